@@ -9,7 +9,10 @@ from hashlib import blake2b
 from boto3.dynamodb.conditions import Key, Attr
 from multiprocessing import Pool
 import sys
+import time
+import threading
 import traceback
+import urllib.request
 from datetime import datetime
 
 
@@ -59,9 +62,16 @@ config = read_config('/home/ec2-user/agent/config.conf')
 region = config.get('DEFAULT', 'region')
 queue_url = config.get('DEFAULT', 'queue_url')
 table_name = config.get('DEFAULT', 'task_dynamodb_name')
+# The load of the agent is published for the target tracking policy of its Auto Scaling Group.
+metric_namespace = config.get('DEFAULT', 'metric_namespace', fallback='')
+asg_name = config.get('DEFAULT', 'asg_name', fallback='')
+METRIC_INTERVAL_SECONDS = 60
+DROPPED_PACKETS_PATH = '/sys/class/net/capture0/statistics/rx_dropped'
+INSTANCE_METADATA_URL = 'http://169.254.169.254/latest'
 
 sessions = {}
 sqs_client = boto3.client('sqs', region_name=region)
+cloudwatch_client = boto3.client('cloudwatch', region_name=region)
 sqs_url = queue_url
 task_id = ''
 
@@ -169,7 +179,7 @@ def send_command_to_queue(event):
     for query in queries:
         if query.strip() != '':
             event['query'] = query
-            event['query_hash'] = blake2b(event['query'].encode()).hexdigest()
+            event['query_hash'] = blake2b(event['query'].encode(), digest_size=16).hexdigest()
             sqs_client.send_message(
                 QueueUrl=sqs_url,
                 MessageBody=json.dumps(event),
@@ -206,16 +216,92 @@ def process_output(output):
         replace_all_placeholder_as_empty_string_value(result)
 
 
+def read_dropped_packets():
+    try:
+        with open(DROPPED_PACKETS_PATH) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def get_instance_id():
+    """
+    Read the instance id of the agent from the instance metadata service (IMDSv2).
+    @return The instance id, or an empty string when the metadata service is not reachable
+    """
+    try:
+        token_request = urllib.request.Request(INSTANCE_METADATA_URL + '/api/token', method='PUT',
+                                               headers={'X-aws-ec2-metadata-token-ttl-seconds': '21600'})
+        token = urllib.request.urlopen(token_request, timeout=2).read().decode()
+        id_request = urllib.request.Request(INSTANCE_METADATA_URL + '/meta-data/instance-id',
+                                            headers={'X-aws-ec2-metadata-token': token})
+        return urllib.request.urlopen(id_request, timeout=2).read().decode()
+    except Exception as e:
+        print(e)
+        return ''
+
+
+def publish_load_metrics(counter):
+    """
+    Publish the lines read from tshark per second and the packets dropped by the capture interface every minute.
+    The lines per second are published for the Auto Scaling Group and for the agent, to compare the load of agents.
+    @param counter Dict with the number of lines read so far, updated by run_command
+    """
+    instance_id = get_instance_id()
+    last_lines = counter['lines']
+    last_dropped = read_dropped_packets()
+    last_time = time.time()
+    while True:
+        time.sleep(METRIC_INTERVAL_SECONDS)
+        now = time.time()
+        lines = counter['lines']
+        dropped = read_dropped_packets()
+        try:
+            lines_per_second = (lines - last_lines) / (now - last_time)
+            metric_data = [
+                {
+                    'MetricName': 'LinesPerSecond',
+                    'Dimensions': [{'Name': 'AutoScalingGroupName', 'Value': asg_name}],
+                    'Value': lines_per_second,
+                    'Unit': 'Count/Second'
+                },
+                {
+                    'MetricName': 'DroppedPackets',
+                    'Dimensions': [{'Name': 'AutoScalingGroupName', 'Value': asg_name}],
+                    'Value': max(dropped - last_dropped, 0),
+                    'Unit': 'Count'
+                }
+            ]
+            if instance_id:
+                metric_data.append({
+                    'MetricName': 'LinesPerSecond',
+                    'Dimensions': [{'Name': 'AutoScalingGroupName', 'Value': asg_name},
+                                   {'Name': 'InstanceId', 'Value': instance_id}],
+                    'Value': lines_per_second,
+                    'Unit': 'Count/Second'
+                })
+            cloudwatch_client.put_metric_data(Namespace=metric_namespace, MetricData=metric_data)
+        except Exception as e:
+            print(e)
+        last_lines, last_dropped, last_time = lines, dropped, now
+
+
 def run_command():
     process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=0)
     pool = Pool(processes=7)
 
+    # The thread is started after the pool is forked.
+    counter = {'lines': 0}
+    if metric_namespace and asg_name:
+        threading.Thread(target=publish_load_metrics, args=(counter,), daemon=True).start()
+
     while True:
         try:
             output = process.stdout.readline()
             if output == '' and process.poll() is not None:
                 break
             if output:
+                counter['lines'] += 1
                 pool.apply_async(process_output, (output,))
 
         except Exception as e:
@@ -0,0 +1,92 @@
+"""
+Measures the throughput of the compatibility rule engine against the former per-call regex checks, and of the
+local syntax prefilter with the share of statements it decides without the database.
+
+The corpus is a file with one captured statement per line, e.g. the query column of a failed_queries.csv report:
+
+    python3 benchmarks/rule_engine_benchmark.py --corpus statements.sql
+
+Without --corpus a synthetic corpus of typical statements is generated.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+VALIDATE_QUERY_DIR = os.path.join(os.path.dirname(__file__), '..', 'infrastructure', 'query_validation',
+                                  'lambda_function', 'validate_query')
+sys.path.insert(0, VALIDATE_QUERY_DIR)
+
+from rule_engine import RuleEngine  # noqa: E402
+from prefilter import classify  # noqa: E402
+
+SYNTHETIC_TEMPLATES = [
+    "SELECT id, name, status FROM orders{0} WHERE id = 1 AND status = ''",
+    "SELECT o.id, c.name FROM orders{0} o JOIN customers c ON o.customer_id = c.id WHERE c.region = '' LIMIT 1",
+    "UPDATE orders{0} SET status = '', updated_at = NOW() WHERE id = 1",
+    "INSERT INTO audit{0} (id, action, payload) VALUES (1, '', '')",
+    "SELECT customer_id, COUNT(*) FROM orders{0} GROUP BY customer_id DESC",
+    "SELECT rank, score FROM leaderboard{0} WHERE season = 1 ORDER BY score DESC",
+    "SELECT SQL_CACHE id FROM products{0} WHERE name LIKE '' AND price > 1",
+    "SELECT id FROM users{0} WHERE password = PASSWORD('')",
+]
+
+
+def legacy_check(query):
+    # The checks of validate_query before the rule engine, both regexes were compiled on every call.
+    functions = ['load_file', 'udf', 'geometrycollectome', 'geomcollfromtext',
+                 'linestringfromtext', 'polygonfromtext', 'pointfromtex', 'json_append',
+                 'encode', 'decode', 'encrypt', 'des_encrypt', 'des_decrypt', 'glength']
+    function_pattern = re.compile(r'\b(' + '|'.join(map(re.escape, functions)) + r')\s*\(', re.IGNORECASE)
+    keywords = [
+        'cume_dist', 'dense_rank', 'empty', 'except', 'first_value',
+        'grouping', 'groups', 'json_table', 'lag', 'last_value',
+        'lateral', 'lead', 'nth_value', 'ntile', 'of', 'over',
+        'percent_rank', 'rank', 'recursive', 'row_number', 'system', 'window'
+    ]
+    keywords_pattern = re.compile(rf"(?i)(?<!`)\b({'|'.join(map(re.escape, keywords))})\b(?!`)")
+    return function_pattern.findall(query) + keywords_pattern.findall(query)
+
+
+def load_corpus(path, size):
+    if path:
+        with open(path) as corpus_file:
+            return [line.strip() for line in corpus_file if line.strip()]
+    random.seed(0)
+    return [random.choice(SYNTHETIC_TEMPLATES).format(i) for i in range(size)]
+
+
+def measure(name, check, corpus, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in corpus:
+            check(query)
+    elapsed = time.perf_counter() - start
+    print('{:12s}: {:12.1f} statements/sec'.format(name, len(corpus) * repeat / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='file with one statement per line')
+    parser.add_argument('--size', type=int, default=20000, help='size of the synthetic corpus')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.size)
+    engine = RuleEngine.from_file(os.path.join(VALIDATE_QUERY_DIR, 'rule_catalog.json'))
+    print('{} statements, rule catalog version {}'.format(len(corpus), engine.version))
+
+    measure('legacy regex', legacy_check, corpus, args.repeat)
+    measure('rule engine', engine.evaluate, corpus, args.repeat)
+    measure('prefilter', classify, corpus, args.repeat)
+
+    verdicts = Counter(classify(query)[0].value for query in corpus)
+    for verdict, count in sorted(verdicts.items()):
+        print('{:12s}: {:6.1%}'.format(verdict, count / len(corpus)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Compares the per-statement STATEMENT_DIGEST_TEXT loop of validate_query with the batched check.
+
+Run it against a local MySQL 8 stand-in, for example:
+
+    docker run -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=root mysql:8.0
+    python3 benchmarks/validate_batch_benchmark.py --password root --rtt-ms 1
+
+--rtt-ms adds a delay to every round trip to emulate the network latency to the RDS Proxy.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import pymysql
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'infrastructure', 'query_validation',
+                                'lambda_function', 'validate_query'))
+
+from syntax_check import check_syntax_batch  # noqa: E402
+
+VALID_TEMPLATES = [
+    "SELECT id, name FROM t{0} WHERE id = 1",
+    "SELECT a.id, b.value FROM t{0} a JOIN t{1} b ON a.id = b.id WHERE a.status = '' LIMIT 1",
+    "UPDATE t{0} SET name = '' WHERE id = 1",
+    "INSERT INTO t{0} (id, name) VALUES (1, '')",
+    "DELETE FROM t{0} WHERE created_at < '' AND id IN (1, 1, 1)",
+]
+
+INVALID_TEMPLATES = [
+    "SELECT rank FROM t{0} WHERE id = 1",
+    "SELECT id FROM t{0} GROUP BY id DESC",
+    "SELECT * FROM t{0} WHERE",
+]
+
+
+class DelayedConnection:
+    """Wraps a pymysql connection and sleeps before each execute to emulate a remote database."""
+
+    def __init__(self, conn, delay):
+        self.conn = conn
+        self.delay = delay
+
+    def cursor(self):
+        return DelayedCursor(self.conn.cursor(), self.delay)
+
+
+class DelayedCursor:
+
+    def __init__(self, cursor, delay):
+        self.cursor = cursor
+        self.delay = delay
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cursor.close()
+
+    def execute(self, query, args=None):
+        time.sleep(self.delay)
+        return self.cursor.execute(query, args)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+
+def generate_statements(count, invalid_ratio):
+    statements = []
+    for i in range(count):
+        templates = INVALID_TEMPLATES if random.random() < invalid_ratio else VALID_TEMPLATES
+        statements.append(random.choice(templates).format(i, i + 1))
+    return statements
+
+
+def check_syntax_loop(conn, queries):
+    # The validate_query behaviour before batching: one round trip per statement.
+    results = []
+    with conn.cursor() as cursor:
+        for query in queries:
+            try:
+                cursor.execute('SELECT STATEMENT_DIGEST_TEXT(%s)', query)
+                cursor.fetchall()
+                results.append(None)
+            except Exception as e:
+                results.append(str(e))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--statements', type=int, default=2000)
+    parser.add_argument('--invalid-ratio', type=float, default=0.02)
+    parser.add_argument('--batch-sizes', default='10,25,50,100')
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    random.seed(0)
+    statements = generate_statements(args.statements, args.invalid_ratio)
+    conn = DelayedConnection(pymysql.connect(host=args.host, port=args.port, user=args.user,
+                                             passwd=args.password, database='mysql'),
+                             args.rtt_ms / 1000)
+
+    start = time.perf_counter()
+    expected = check_syntax_loop(conn, statements)
+    elapsed = time.perf_counter() - start
+    print('loop           : {:10.1f} statements/sec'.format(len(statements) / elapsed))
+
+    for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+        start = time.perf_counter()
+        results = check_syntax_batch(conn, statements, batch_size)
+        elapsed = time.perf_counter() - start
+        assert results == expected, 'batched results differ from the per-statement loop'
+        print('batch size {:4d}: {:10.1f} statements/sec'.format(batch_size, len(statements) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -36,8 +36,34 @@ class QueriesCompatibilityCheckStack(Stack):
             'public_subnet_ids': stack_input.public_subnet_ids,
             'keypair': stack_input.keypair,
             'check_task_table_name': 'check-task-table-{}'.format(stack_input.env_name),
-            'check_log_table_name': 'check-log-table-{}'.format(stack_input.env_name),
-            'check_task_table_gsi_name': 'in-progress-time-index'
+            # v2: the key schema changed to task_bucket + binary query_hash, a new table replaces the earlier one.
+            'check_log_table_name': 'check-log-table-v2-{}'.format(stack_input.env_name),
+            'check_result_cache_table_name': 'check-result-cache-table-{}'.format(stack_input.env_name),
+            'check_result_cache_ttl_days': 30,
+            'check_log_table_bucket_count': 16,
+            'check_log_query_compress_threshold': 512,
+            'check_log_stream_batch_size': 200,
+            'check_log_stream_parallelization_factor': 4,
+            'check_log_stream_tumbling_window_seconds': 30,
+            'validate_prefilter_enabled': True,
+            'validate_prefilter_audit_rate': 0.05,
+            'metric_namespace': 'db-check-{}'.format(stack_input.env_name),
+            'validation_targets': [dict(zip(('name', 'engine_version'), target.split('=')))
+                                   for target in stack_input.validation_targets],
+            'check_task_table_gsi_name': 'in-progress-time-index',
+            'check_log_table_gsi_name': 'pending-index',
+            'check_log_table_risk_gsi_name': 'risk-index',
+            'check_log_table_failed_gsi_name': 'failed-index',
+            'validate_function_name': 'db-check-validate-query-{}'.format(stack_input.env_name),
+            'sweeper_function_name': 'db-check-sweeper-{}'.format(stack_input.env_name),
+            'sweeper_schedule_minutes': 10,
+            'partial_report_schedule_minutes': 5,
+            'stats_schedule_minutes': 1,
+            'agent_statements_per_second': 1500,
+            'agent_max_count': 10,
+            # The sessions of a hot database network interface, at most 3 sessions per network interface.
+            'mirror_shards': 3,
+            'drain_timeout_minutes': 30
         }
 
         shared_infrastructure = SharedInfrastructureConstruct(self, "SharedInfrastructureConstruct", params=params)
@@ -53,4 +79,5 @@ class QueriesCompatibilityCheckStack(Stack):
                                                     sg=query_collection.security_group,
                                                     s3_bucket = shared_infrastructure.s3_bucket,
                                                     dynamodb = shared_infrastructure.dynamodb,
+                                                    api=shared_infrastructure.api.api,
                                                     )
@@ -11,7 +11,8 @@ class ApiMethod(Construct):
     def __init__(self, scope: Construct, construct_id: str, env_name: str, api: aws_apigateway.RestApi, 
                  create_state_machine: sfn.CfnStateMachine,
                  cleanup_state_machine: sfn.CfnStateMachine,
-                 get_task_progress_function: _lambda.Function, **kwargs) -> None:
+                 get_task_progress_function: _lambda.Function,
+                 get_task_failures_function: _lambda.Function, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
         
         # add resource 
@@ -44,7 +45,9 @@ class ApiMethod(Construct):
                 type=aws_apigateway.JsonSchemaType.OBJECT,
                 properties={
                     "traffic_window": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.INTEGER, maximum=100, minimum=1),
-                    "cluster_identifier": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.STRING)
+                    "cluster_identifier": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.STRING),
+                    "early_finish_rate": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.NUMBER, minimum=0),
+                    "early_finish_minutes": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.INTEGER, minimum=0, maximum=6000)
                 },
                 required=["traffic_window", "cluster_identifier"]
             )
@@ -149,3 +152,20 @@ class ApiMethod(Construct):
 
         lambda_integration = aws_apigateway.LambdaIntegration(get_task_progress_function)
         api_resource.add_method('GET', lambda_integration, api_key_required=True,)
+
+        # add get failed queries method, GET /task/failures
+        failures_resource = api_resource.add_resource("failures")
+        failures_resource.add_method('GET', aws_apigateway.LambdaIntegration(get_task_failures_function),
+                                     api_key_required=True,
+                                     request_parameters={
+                                         "method.request.querystring.task_id": True,
+                                         "method.request.querystring.error_class": False,
+                                         "method.request.querystring.rule_id": False,
+                                         "method.request.querystring.fields": False,
+                                         "method.request.querystring.limit": False,
+                                         "method.request.querystring.next_token": False,
+                                     },
+                                     request_validator_options=aws_apigateway.RequestValidatorOptions(
+                                         validate_request_body=False,
+                                         validate_request_parameters=True
+                                     ))
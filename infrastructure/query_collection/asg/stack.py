@@ -4,15 +4,18 @@ except ImportError:
     import aws_cdk as cdk
 
 from aws_cdk import (
+    Duration,
     aws_ec2,
     aws_iam,
     aws_autoscaling,
+    aws_cloudwatch,
 )
 from constructs import Construct
 
 class ASG(Construct):
     def __init__(self, scope: Construct, construct_id: str, env_name: str, 
-                 launch_template, vpc, public_subnets, **kwargs) -> None:
+                 launch_template, vpc, public_subnets, metric_namespace: str, agent_statements_per_second: int,
+                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         self.db_check_asg = aws_autoscaling.AutoScalingGroup(
@@ -26,6 +29,31 @@ class ASG(Construct):
             desired_capacity=0,
             )
 
+        # The agents publish the statements they read and the packets the capture interface dropped, by group.
+        agent_dimensions = {'AutoScalingGroupName': "db_check_asg_{}".format(env_name)}
+        self.db_check_asg.scale_to_track_metric(
+            "agent_load_tracking",
+            metric=aws_cloudwatch.Metric(namespace=metric_namespace, metric_name='LinesPerSecond',
+                                         dimensions_map=agent_dimensions, statistic='Average',
+                                         period=Duration.minutes(1)),
+            target_value=agent_statements_per_second,
+            estimated_instance_warmup=Duration.minutes(5),
+        )
+        # Dropped packets are lost queries, an agent is added while they are dropped whatever the average load.
+        self.db_check_asg.scale_on_metric(
+            "agent_drop_scaling",
+            metric=aws_cloudwatch.Metric(namespace=metric_namespace, metric_name='DroppedPackets',
+                                         dimensions_map=agent_dimensions, statistic='Sum',
+                                         period=Duration.minutes(1)),
+            scaling_steps=[
+                aws_autoscaling.ScalingInterval(upper=0, change=0),
+                aws_autoscaling.ScalingInterval(lower=1, change=1),
+            ],
+            adjustment_type=aws_autoscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+            evaluation_periods=2,
+            cooldown=Duration.minutes(5),
+        )
+
     @property
     def asg(self):
         return self.db_check_asg
\ No newline at end of file
@@ -0,0 +1,318 @@
+import boto3
+import os
+import json
+import time
+import logging
+from datetime import datetime, timezone, timedelta
+from decimal import Decimal
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+REGION = os.environ.get("REGION")
+QUEUE_URL = os.environ.get("QUEUE_URL")
+TASK_TABLE_GSI = os.environ.get("DDB_TASK_TABLE_GSI")
+LOG_TABLE_GSI = os.environ.get("DDB_LOG_TABLE_GSI")
+LOG_TABLE_BUCKETS = int(os.environ.get("LOG_TABLE_BUCKETS", "1"))
+VALIDATE_FUNCTION_NAME = os.environ.get("VALIDATE_FUNCTION_NAME")
+CLEANUP_STATE_MACHINE_ARN = os.environ.get("CLEANUP_STATE_MACHINE_ARN")
+ASG_NAME = os.environ.get("ASG_NAME")
+METRIC_NAMESPACE = os.environ.get("METRIC_NAMESPACE")
+# The statistics of a task are stored in the task table under this key, apart from the task item and its stream.
+STATS_KEY = "stats#{}"
+# Rates are reported over these windows, in minutes, the samples of the longest window are kept.
+RATE_WINDOWS = [1, 5, 15]
+# The number of distinct queries captured is added to the discovery curve at this interval.
+DISCOVERY_INTERVAL_SECONDS = int(os.environ.get("DISCOVERY_INTERVAL_SECONDS", "600"))
+MAX_DISCOVERY_POINTS = 1000
+
+sqs = boto3.client('sqs', region_name=REGION)
+autoscaling = boto3.client('autoscaling', region_name=REGION)
+cloudwatch = boto3.client('cloudwatch', region_name=REGION)
+stepfunctions = boto3.client('stepfunctions', region_name=REGION)
+
+dynamodb = boto3.resource('dynamodb', region_name=REGION)
+task_table = dynamodb.Table(os.environ.get("DDB_TASK_TABLE"))
+log_table = dynamodb.Table(os.environ.get("DDB_LOG_TABLE"))
+
+
+def get_queue_backlog():
+    response = sqs.get_queue_attributes(
+        QueueUrl=QUEUE_URL,
+        AttributeNames=['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible']
+    )
+    attributes = response['Attributes']
+    return int(attributes['ApproximateNumberOfMessages']), int(attributes['ApproximateNumberOfMessagesNotVisible'])
+
+
+def get_pending_queries(task_id: str):
+    pending_count = 0
+    for bucket in range(LOG_TABLE_BUCKETS):
+        query_kwargs = {
+            'IndexName': LOG_TABLE_GSI,
+            'KeyConditionExpression': Key('pending_bucket').eq('{}#{}'.format(task_id, bucket)),
+            'Select': 'COUNT',
+        }
+        while True:
+            response = log_table.query(**query_kwargs)
+            pending_count += response['Count']
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return pending_count
+
+
+def get_stream_lag_seconds():
+    """
+        Returns the age of the last log table stream record read by the validate function, over the last 5 minutes.
+
+        Returns:
+            int: The stream lag in seconds, or None when the function has not read the stream recently.
+    """
+
+    now = datetime.now(timezone.utc)
+    response = cloudwatch.get_metric_statistics(
+        Namespace='AWS/Lambda',
+        MetricName='IteratorAge',
+        Dimensions=[{'Name': 'FunctionName', 'Value': VALIDATE_FUNCTION_NAME}],
+        StartTime=now - timedelta(minutes=5),
+        EndTime=now,
+        Period=60,
+        Statistics=['Maximum']
+    )
+    datapoints = sorted(response['Datapoints'], key=lambda datapoint: datapoint['Timestamp'])
+    if not datapoints:
+        return None
+    return int(datapoints[-1]['Maximum'] / 1000)
+
+
+def get_agent_loads():
+    """
+        Returns the statements per second read by each agent in service, over the last 5 minutes.
+
+        Returns:
+            list: The instance ID and the statements per second of each agent, None when the agent has not reported yet.
+    """
+
+    response = autoscaling.describe_auto_scaling_groups(AutoScalingGroupNames=[ASG_NAME])
+    instance_ids = sorted(instance['InstanceId'] for group in response['AutoScalingGroups']
+                          for instance in group['Instances'] if instance['LifecycleState'] == 'InService')
+    now = datetime.now(timezone.utc)
+    agent_loads = []
+    for instance_id in instance_ids:
+        response = cloudwatch.get_metric_statistics(
+            Namespace=METRIC_NAMESPACE,
+            MetricName='LinesPerSecond',
+            Dimensions=[{'Name': 'AutoScalingGroupName', 'Value': ASG_NAME},
+                        {'Name': 'InstanceId', 'Value': instance_id}],
+            StartTime=now - timedelta(minutes=5),
+            EndTime=now,
+            Period=300,
+            Statistics=['Average']
+        )
+        datapoints = response['Datapoints']
+        agent_loads.append({
+            'instance_id': instance_id,
+            'lines_per_second': to_decimal(datapoints[0]['Average']) if datapoints else None
+        })
+    return agent_loads
+
+
+def get_agent_imbalance(agent_loads: list):
+    """
+        Returns how unevenly the statements are spread across the agents, the busiest agent over the average agent.
+
+        Returns:
+            Decimal: 1 when the load is even, None when fewer than two agents have reported.
+    """
+
+    loads = [agent['lines_per_second'] for agent in agent_loads if agent['lines_per_second'] is not None]
+    if len(loads) < 2 or sum(loads) == 0:
+        return None
+    return to_decimal(float(max(loads)) / (float(sum(loads)) / len(loads)))
+
+
+def get_active_tasks():
+    task_ids = []
+    query_kwargs = {
+        'IndexName': TASK_TABLE_GSI,
+        'KeyConditionExpression': Key('in_progress').eq(1),
+        'ProjectionExpression': 'task_id',
+    }
+    while True:
+        response = task_table.query(**query_kwargs)
+        task_ids.extend(item['task_id'] for item in response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return task_ids
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def to_decimal(value: float):
+    return Decimal(str(round(value, 2)))
+
+
+def get_rates(samples: list, window_minutes: int):
+    """
+        Calculates the captured, distinct, checked and failed queries per minute over a window, from the counter samples.
+
+        Args:
+            samples (list): The counter samples of the task, oldest first, the last one is the current sample.
+            window_minutes (int): The window in minutes.
+
+        Returns:
+            dict: The rates per minute, or None when there is no sample in the window yet.
+    """
+
+    now = samples[-1]
+    start = now['time'] - window_minutes * 60
+    # The oldest sample in the window, the collector runs about once a minute.
+    earlier = next((sample for sample in samples[:-1] if sample['time'] >= start - 30), None)
+    if earlier is None:
+        return None
+    minutes = (now['time'] - earlier['time']) / 60
+    return {name: (now[name] - earlier[name]) / minutes for name in ('captured', 'distinct', 'checked', 'failed')}
+
+
+def build_task_stats(task: dict, stats: dict, queue_backlog: tuple, stream_lag_seconds: int, agent_loads: list):
+    """
+        Adds the current counters of a task to its statistics and calculates the rates, backlog and ETA.
+
+        Args:
+            task (dict): The task item.
+            stats (dict): The statistics item of the task, or an empty dict for the first sample.
+            queue_backlog (tuple): The visible and in-flight messages of the queries queue.
+            stream_lag_seconds (int): The stream lag of the validate function.
+            agent_loads (list): The statements per second of each agent.
+
+        Returns:
+            dict: The new statistics item.
+    """
+
+    now = int(time.time())
+    sample = {
+        'time': now,
+        'captured': int(task.get('captured_query', 0)),
+        'distinct': int(task.get('distinct_query', 0)),
+        'checked': int(task.get('checked_query', 0)),
+        'failed': int(task.get('failed_query', 0)),
+    }
+    # Samples taken before the distinct counter existed are dropped.
+    samples = [{name: int(value) for name, value in earlier.items()} for earlier in stats.get('samples', [])
+               if int(earlier['time']) >= now - max(RATE_WINDOWS) * 60 - 60 and 'distinct' in earlier]
+    samples.append(sample)
+
+    discovery = [[int(minute), int(captured)] for minute, captured in stats.get('discovery', [])]
+    created = datetime.strptime(task['created_time'], '%Y-%m-%dT%H:%M:%S.%f%z').timestamp()
+    elapsed_minutes = int((now - created) / 60)
+    if not discovery or (elapsed_minutes - discovery[-1][0]) * 60 >= DISCOVERY_INTERVAL_SECONDS:
+        discovery.append([elapsed_minutes, sample['distinct']])
+        if len(discovery) > MAX_DISCOVERY_POINTS:
+            # Every other point is dropped, the curve keeps its shape over long tasks.
+            discovery = discovery[::2] + ([discovery[-1]] if len(discovery) % 2 == 0 else [])
+
+    rates = {}
+    for window in RATE_WINDOWS:
+        window_rates = get_rates(samples, window)
+        if window_rates is not None:
+            rates['{}m'.format(window)] = {name: to_decimal(rate) for name, rate in window_rates.items()}
+
+    pending_queries = get_pending_queries(task['task_id'])
+    # The pending queries drain at the rate they are checked, less the rate new distinct ones are captured.
+    eta_seconds = None
+    recent_rates = get_rates(samples, 5)
+    if pending_queries == 0:
+        eta_seconds = 0
+    elif recent_rates is not None and recent_rates['checked'] > recent_rates['distinct']:
+        eta_seconds = int(pending_queries / (recent_rates['checked'] - recent_rates['distinct']) * 60)
+
+    # The start of the current period in which new queries are discovered at most at the early finish rate.
+    saturated_since = None
+    if recent_rates is not None and recent_rates['distinct'] <= float(task.get('early_finish_rate', 0)):
+        saturated_since = int(stats.get('saturated_since') or now)
+
+    return {
+        'task_id': STATS_KEY.format(task['task_id']),
+        'samples': samples,
+        'discovery': discovery,
+        'rates': rates,
+        'queued_messages': queue_backlog[0],
+        'in_flight_messages': queue_backlog[1],
+        'pending_queries': pending_queries,
+        'stream_lag_seconds': stream_lag_seconds,
+        'eta_seconds': eta_seconds,
+        'saturated_since': saturated_since,
+        'agents': agent_loads,
+        'agent_imbalance': get_agent_imbalance(agent_loads),
+        'updated_time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    }
+
+
+def finish_task_early(task_id: str, saturated_minutes: int):
+    """
+        Finishes a task whose discovery of new queries has stayed below its early finish rate, by starting the cleanup
+        state machine as if the traffic window had ended.
+
+        The execution is named after the task, so the cleanup is started once although the collector runs again before
+        the task is draining. The early finish time is then set on the task.
+
+        Args:
+            task_id (str): The ID of the task.
+            saturated_minutes (int): The minutes the discovery rate has stayed below the early finish rate.
+
+        Returns:
+            bool: True when the cleanup is started.
+    """
+
+    try:
+        stepfunctions.start_execution(
+            stateMachineArn=CLEANUP_STATE_MACHINE_ARN,
+            name='early-finish-{}'.format(task_id),
+            input=json.dumps({'task_id': task_id, 'auto_finished': 1, 'early_finished': 1})
+        )
+    except stepfunctions.exceptions.ExecutionAlreadyExists:
+        return False
+
+    try:
+        task_table.update_item(
+            Key={'task_id': task_id},
+            UpdateExpression='SET early_finish_time = :time',
+            ConditionExpression='attribute_not_exists(early_finish_time)',
+            ExpressionAttributeValues={
+                ':time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+            }
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    logger.info("Task " + task_id + " discovered few new queries for " + str(saturated_minutes) +
+                " minutes, finishing it early")
+    return True
+
+
+def lambda_handler(event, context):
+    task_ids = get_active_tasks()
+    if not task_ids:
+        return
+
+    # The queue, the stream and the agents are shared by all tasks.
+    queue_backlog = get_queue_backlog()
+    stream_lag_seconds = get_stream_lag_seconds()
+    agent_loads = get_agent_loads()
+    for task_id in task_ids:
+        task = task_table.get_item(Key={'task_id': task_id}).get('Item')
+        if task is None or 'created_time' not in task:
+            continue
+        stats = task_table.get_item(Key={'task_id': STATS_KEY.format(task_id)}).get('Item', {})
+        task_stats = build_task_stats(task, stats, queue_backlog, stream_lag_seconds, agent_loads)
+        task_table.put_item(Item=task_stats)
+
+        # The early finish policy of the task is optional, it is disabled when early_finish_minutes is 0.
+        early_finish_minutes = int(task.get('early_finish_minutes', 0))
+        if early_finish_minutes > 0 and task['status'] == 'In-progress' and task_stats['saturated_since'] is not None:
+            saturated_minutes = int((task_stats['samples'][-1]['time'] - task_stats['saturated_since']) / 60)
+            if saturated_minutes >= early_finish_minutes:
+                finish_task_early(task_id, saturated_minutes)
+        logger.info("Task " + task['task_id'] + " stats: " + str({name: value for name, value in task_stats.items()
+                                                                   if name not in ('samples', 'discovery', 'agents')}))
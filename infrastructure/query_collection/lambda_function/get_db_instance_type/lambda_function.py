@@ -1,11 +1,24 @@
+import os
 import json
+import math
 import boto3
 import re
 import dns.resolver
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 ec2_client = boto3.client('ec2')
 rds = boto3.client('rds')
+cloudwatch = boto3.client('cloudwatch')
+
+# The statements per second each agent is sized for, the same target the Auto Scaling Group tracks.
+AGENT_STATEMENTS_PER_SECOND = int(os.environ.get('AGENT_STATEMENTS_PER_SECOND', '1500'))
+AGENT_MAX_COUNT = int(os.environ.get('AGENT_MAX_COUNT', '10'))
+# The peak statement rate is measured over this many hours before the task is created.
+STATEMENT_RATE_HOURS = int(os.environ.get('STATEMENT_RATE_HOURS', '24'))
+TRAFFIC_MIRROR_FILTER_ID = os.environ.get('TRAFFIC_MIRROR_FILTER_ID')
+# The filters of the client port slices, a hot network interface is mirrored by one session per filter.
+TRAFFIC_MIRROR_SHARD_FILTER_IDS = [filter_id for filter_id
+                                   in os.environ.get('TRAFFIC_MIRROR_SHARD_FILTER_IDS', '').split(',') if filter_id]
 
 
 def get_ip_for_database_endpoint(endpoint):
@@ -25,6 +38,61 @@ def calculate_instance_count_by_db_class(instance_class):
         return 1
 
 
+def get_statement_rate(instance_identifier):
+    """
+        Returns the peak statement rate of a database instance, from the 5 minute averages of the Queries metric.
+
+        Args:
+            instance_identifier (str): The identifier of the database instance.
+
+        Returns:
+            float: The peak statements per second, or None when the instance does not publish the Queries metric, e.g.
+                   RDS for MySQL, which only Aurora MySQL does.
+    """
+
+    now = datetime.now(timezone.utc)
+    response = cloudwatch.get_metric_statistics(
+        Namespace='AWS/RDS',
+        MetricName='Queries',
+        Dimensions=[{'Name': 'DBInstanceIdentifier', 'Value': instance_identifier}],
+        StartTime=now - timedelta(hours=STATEMENT_RATE_HOURS),
+        EndTime=now,
+        Period=300,
+        Statistics=['Average']
+    )
+    if not response['Datapoints']:
+        return None
+    return max(datapoint['Average'] for datapoint in response['Datapoints'])
+
+
+def calculate_instance_count_by_statement_rate(statement_rate):
+    return min(max(math.ceil(statement_rate / AGENT_STATEMENTS_PER_SECOND), 1), AGENT_MAX_COUNT)
+
+
+def get_mirrors(eni_id, statement_rate):
+    """
+        Returns the traffic mirror sessions of a database network interface.
+
+        A network interface with more statements than an agent handles is split into one session per shard filter, the
+        filters take complementary client port ranges so each query is mirrored once, and the NLB spreads the sessions
+        across the agents.
+
+        Args:
+            eni_id (str): The ID of the network interface.
+            statement_rate (float): The peak statements per second of the database instance, or None when unknown.
+
+        Returns:
+            list: The sessions with the network interface, the filter and the session number.
+    """
+
+    if statement_rate is not None and statement_rate > AGENT_STATEMENTS_PER_SECOND and TRAFFIC_MIRROR_SHARD_FILTER_IDS:
+        filter_ids = TRAFFIC_MIRROR_SHARD_FILTER_IDS
+    else:
+        filter_ids = [TRAFFIC_MIRROR_FILTER_ID]
+    return [{'eni_id': eni_id, 'filter_id': filter_id, 'session_number': session_number}
+            for session_number, filter_id in enumerate(filter_ids, start=1)]
+
+
 def get_eni_for_ip(ip):
     eni = {
         'eni_id': {
@@ -63,8 +131,12 @@ def lambda_handler(event, context):
         'endpoint': '',
         'read_endpoint': '',
         'instance_count': 0,
+        'min_count': 1,
+        'max_count': 1,
+        'statement_rate': 0,
         'error': '',
-        'instances': []
+        'instances': [],
+        'mirrors': []
     }
 
     cluster_identifier = event['cluster_identifier']
@@ -130,8 +202,23 @@ def lambda_handler(event, context):
         instance['M']['eni'] = {'M': get_eni_for_ip(ip)}
 
         database_info['instances'].append(instance)
-        database_info['instance_count'] = database_info['instance_count'] + calculate_instance_count_by_db_class(
-            instance['M']['class']['S'])
+
+    # The agents start from the measured statement rate, the Auto Scaling Group then tracks the load they report.
+    statement_rates = [get_statement_rate(instance['M']['identifier']['S']) for instance in database_info['instances']]
+    for instance, statement_rate in zip(database_info['instances'], statement_rates):
+        instance['M']['statement_rate'] = {'N': str(int(statement_rate or 0))}
+        database_info['mirrors'].extend(get_mirrors(instance['M']['eni']['M']['eni_id']['S'], statement_rate))
+    if statement_rates and None not in statement_rates:
+        database_info['statement_rate'] = int(sum(statement_rates))
+        database_info['instance_count'] = calculate_instance_count_by_statement_rate(sum(statement_rates))
+    else:
+        for instance in database_info['instances']:
+            database_info['instance_count'] = database_info['instance_count'] + calculate_instance_count_by_db_class(
+                instance['M']['class']['S'])
+        database_info['instance_count'] = max(database_info['instance_count'], 1)
+    # Scaling in never goes below the initial fleet, the agents it starts with are sized for the peak load.
+    database_info['min_count'] = database_info['instance_count']
+    database_info['max_count'] = max(database_info['instance_count'], AGENT_MAX_COUNT)
 
     print('database_info: ')
     print(database_info)
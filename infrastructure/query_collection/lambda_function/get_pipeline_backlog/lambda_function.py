@@ -0,0 +1,127 @@
+import boto3
+import os
+import logging
+from datetime import datetime, timezone
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+REGION = os.environ.get("REGION")
+QUEUE_URL = os.environ.get("QUEUE_URL")
+LOG_TABLE_GSI = os.environ.get("DDB_LOG_TABLE_GSI")
+LOG_TABLE_BUCKETS = int(os.environ.get("LOG_TABLE_BUCKETS", "1"))
+# Exponential polling of the backlog, the wait doubles after every poll that still finds work.
+DRAIN_POLL_INITIAL_SECONDS = int(os.environ.get("DRAIN_POLL_INITIAL_SECONDS", "5"))
+DRAIN_POLL_MAX_SECONDS = int(os.environ.get("DRAIN_POLL_MAX_SECONDS", "60"))
+# The task is finished with whatever is left once the deadline has passed.
+DRAIN_TIMEOUT_SECONDS = int(os.environ.get("DRAIN_TIMEOUT_SECONDS", "1800"))
+
+sqs = boto3.client('sqs', region_name=REGION)
+
+dynamodb = boto3.resource('dynamodb', region_name=REGION)
+task_table = dynamodb.Table(os.environ.get("DDB_TASK_TABLE"))
+log_table = dynamodb.Table(os.environ.get("DDB_LOG_TABLE"))
+
+
+def get_queue_backlog():
+    """
+        Returns the approximate number of messages waiting in the queries queue and received by the ingest function.
+
+        Returns:
+            tuple: The number of visible messages and the number of in-flight messages.
+    """
+
+    response = sqs.get_queue_attributes(
+        QueueUrl=QUEUE_URL,
+        AttributeNames=['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible']
+    )
+    attributes = response['Attributes']
+    return int(attributes['ApproximateNumberOfMessages']), int(attributes['ApproximateNumberOfMessagesNotVisible'])
+
+
+def get_pending_queries(task_id: str):
+    """
+        Counts the log items of a task that are not validated yet, from the sparse pending index of the log table.
+
+        Args:
+            task_id (str): The ID of the task.
+
+        Returns:
+            int: The number of pending log items.
+    """
+
+    pending_count = 0
+    for bucket in range(LOG_TABLE_BUCKETS):
+        query_kwargs = {
+            'IndexName': LOG_TABLE_GSI,
+            'KeyConditionExpression': Key('pending_bucket').eq('{}#{}'.format(task_id, bucket)),
+            'Select': 'COUNT',
+        }
+        while True:
+            response = log_table.query(**query_kwargs)
+            pending_count += response['Count']
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return pending_count
+
+
+def update_drain_progress(task_id: str, drain_progress: dict):
+    """
+        Stores the drain progress in the task item, it is returned by the task progress API.
+
+        Args:
+            task_id (str): The ID of the task.
+            drain_progress (dict): The backlog of the pipeline.
+
+        Returns:
+            None
+    """
+
+    try:
+        task_table.update_item(
+            Key={'task_id': task_id},
+            UpdateExpression='SET drain_progress = :progress',
+            ConditionExpression='#stat = :draining',
+            ExpressionAttributeNames={'#stat': 'status'},
+            ExpressionAttributeValues={':progress': drain_progress, ':draining': 'Draining'}
+        )
+    except ClientError as e:
+        logger.error("Update drain progress failed! task_id = " + task_id)
+        logger.error(e)
+
+
+def lambda_handler(event, context):
+    task_id = event['task_id']
+    attempt = int(event.get('attempt', 0))
+    drain_started = datetime.strptime(event['drain_started'], '%Y-%m-%dT%H:%M:%S.%f%z')
+    elapsed_seconds = int((datetime.now(timezone.utc) - drain_started).total_seconds())
+
+    queued_messages, in_flight_messages = get_queue_backlog()
+    pending_queries = get_pending_queries(task_id)
+
+    drained = queued_messages == 0 and in_flight_messages == 0 and pending_queries == 0
+    expired = elapsed_seconds >= DRAIN_TIMEOUT_SECONDS
+    wait_seconds = min(DRAIN_POLL_INITIAL_SECONDS * 2 ** attempt, DRAIN_POLL_MAX_SECONDS)
+
+    drain_progress = {
+        'queued_messages': queued_messages,
+        'in_flight_messages': in_flight_messages,
+        'pending_queries': pending_queries,
+        'elapsed_seconds': elapsed_seconds,
+        'timeout_seconds': DRAIN_TIMEOUT_SECONDS,
+        'checked_time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    }
+    update_drain_progress(task_id, drain_progress)
+    logger.info("Task " + task_id + " drain progress: " + str(drain_progress))
+
+    return {
+        'started': event['drain_started'],
+        'attempt': attempt + 1,
+        'drained': drained,
+        'expired': expired,
+        'wait_seconds': wait_seconds,
+        'pending_queries': pending_queries
+    }
@@ -0,0 +1,188 @@
+import boto3
+import os
+import json
+import zlib
+import base64
+import logging
+import traceback
+from boto3.dynamodb.conditions import Key, Attr
+from boto3.dynamodb.types import Binary
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+REGION = os.environ.get("REGION")
+
+# dynamodb client
+dynamodb = boto3.resource("dynamodb", region_name=REGION)
+log_table = dynamodb.Table(os.environ.get("DDB_LOG_TABLE"))
+log_table_failed_index = os.environ.get("DDB_LOG_TABLE_FAILED_GSI")
+log_table_buckets = int(os.environ.get("LOG_TABLE_BUCKETS", "1"))
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# A page with a rule filter may have to skip many failures, the reads of one request are bounded so it returns fast.
+MAX_READS = 20
+# The fields that can be returned, each one with the attributes of the failed index it is read from.
+FIELDS = {
+    "query_hash": ["query_hash"],
+    "query": ["#query", "query_z"],
+    "message": ["message"],
+    "error_class": ["error_class"],
+    "rule_ids": ["rule_ids"],
+    "target_status": ["target_results"],
+    "src": ["src"],
+    "src_port": ["src_port"],
+}
+DEFAULT_FIELDS = ["query_hash", "query", "message", "error_class", "rule_ids"]
+
+
+class InvalidParameterError(Exception):
+    pass
+
+
+def encode_token(bucket: int, last_key: dict):
+    """
+        Encodes the position of a page as an opaque continuation token.
+
+        Args:
+            bucket (int): The bucket of the task the next page is read from.
+            last_key (dict): The LastEvaluatedKey in the bucket, or None to start at the beginning of the bucket.
+
+        Returns:
+            str: The URL safe token.
+    """
+
+    if last_key:
+        last_key = {name: value.value.hex() if isinstance(value, Binary) else value for name, value in last_key.items()}
+    return base64.urlsafe_b64encode(json.dumps({"b": bucket, "k": last_key}).encode()).decode()
+
+
+def decode_token(token: str):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token.encode()))
+        last_key = position["k"]
+        if last_key:
+            last_key["query_hash"] = Binary(bytes.fromhex(last_key["query_hash"]))
+        return int(position["b"]), last_key
+    except (ValueError, KeyError, TypeError):
+        raise InvalidParameterError("Invalid next_token.")
+
+
+def build_failure(item: dict, fields: list):
+    failure = {}
+    for field in fields:
+        if field == "query_hash":
+            failure[field] = item["query_hash"].value.hex()
+        elif field == "query":
+            # Long queries are stored zlib compressed in the binary query_z attribute.
+            failure[field] = zlib.decompress(item["query_z"].value).decode() if "query_z" in item else item.get("query")
+        elif field == "target_status":
+            failure[field] = {name: result["status"] for name, result in item.get("target_results", {}).items()}
+        elif field == "rule_ids":
+            failure[field] = sorted(item.get("rule_ids", []))
+        elif field == "src_port":
+            failure[field] = int(item["src_port"]) if "src_port" in item else None
+        else:
+            failure[field] = item.get(field)
+    return failure
+
+
+def get_task_failures(task_id: str, error_class: str = None, rule_id: str = None, fields: list = None,
+                      limit: int = DEFAULT_LIMIT, next_token: str = None):
+    """
+        Reads a page of the failed queries of a task from the failed index, bucket after bucket.
+
+        The failed index only holds the failed queries and is sorted by error class, so an error class is a key
+        condition on the sort key. A rule id is a filter on the items that are read, the reads of one request are
+        bounded and a page may hold fewer failures than the limit although there are more.
+
+        Args:
+            task_id (str): The ID of the task.
+            error_class (str): Only the failures of this error class, e.g. a rule id or MYSQL_1064.
+            rule_id (str): Only the failures that failed this compatibility rule.
+            fields (list): The fields of each failure, DEFAULT_FIELDS when not set.
+            limit (int): The maximum number of failures of the page.
+            next_token (str): The continuation token of the previous page, or None for the first page.
+
+        Returns:
+            dict: The failures and the continuation token of the next page, which is not set after the last page.
+    """
+
+    fields = fields or DEFAULT_FIELDS
+    bucket, last_key = decode_token(next_token) if next_token else (0, None)
+    projection = ["query_hash"] + [name for field in fields for name in FIELDS[field]]
+    query_kwargs = {
+        "IndexName": log_table_failed_index,
+        "ProjectionExpression": ", ".join(sorted(set(projection))),
+    }
+    if "#query" in projection:
+        query_kwargs["ExpressionAttributeNames"] = {"#query": "query"}
+    if rule_id:
+        query_kwargs["FilterExpression"] = Attr("rule_ids").contains(rule_id)
+
+    failures = []
+    for _ in range(MAX_READS):
+        key_condition = Key("failed_bucket").eq("{}#{}".format(task_id, bucket))
+        if error_class:
+            key_condition = key_condition & Key("failure_sort").begins_with(error_class + "#")
+        query_kwargs["KeyConditionExpression"] = key_condition
+        query_kwargs["Limit"] = limit - len(failures)
+        if last_key:
+            query_kwargs["ExclusiveStartKey"] = last_key
+        else:
+            query_kwargs.pop("ExclusiveStartKey", None)
+
+        response = log_table.query(**query_kwargs)
+        failures.extend(build_failure(item, fields) for item in response["Items"])
+        last_key = response.get("LastEvaluatedKey")
+        if last_key is None:
+            bucket += 1
+            if bucket >= log_table_buckets:
+                return {"failures": failures}
+        if len(failures) >= limit:
+            break
+
+    return {"failures": failures, "next_token": encode_token(bucket, last_key)}
+
+
+def get_parameters(parameters: dict):
+    if not parameters.get("task_id"):
+        raise InvalidParameterError("Please input task_id.")
+
+    fields = [field for field in parameters.get("fields", "").split(",") if field]
+    unknown_fields = [field for field in fields if field not in FIELDS]
+    if unknown_fields:
+        raise InvalidParameterError("Unknown fields: {}, the fields are {}.".format(
+            ",".join(unknown_fields), ",".join(FIELDS)))
+
+    try:
+        limit = int(parameters.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise InvalidParameterError("limit must be an integer.")
+    if limit < 1 or limit > MAX_LIMIT:
+        raise InvalidParameterError("limit must be between 1 and {}.".format(MAX_LIMIT))
+
+    return {
+        "task_id": parameters["task_id"],
+        "error_class": parameters.get("error_class"),
+        "rule_id": parameters.get("rule_id"),
+        "fields": fields,
+        "limit": limit,
+        "next_token": parameters.get("next_token"),
+    }
+
+
+def lambda_handler(event, context):
+    try:
+        resp_body = get_task_failures(**get_parameters(event.get("queryStringParameters") or {}))
+    except InvalidParameterError as e:
+        resp_body = {"message": str(e)}
+    except Exception as e:
+        logger.error("Get failures failed! parameters = " + str(event.get("queryStringParameters")))
+        logger.error(traceback.format_exc())
+        resp_body = {"message": str(e)}
+    return {
+        "statusCode": 202,  # Custom success code (optional)
+        "body": json.dumps(resp_body)
+    }
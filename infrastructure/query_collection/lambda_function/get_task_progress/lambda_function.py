@@ -17,6 +17,8 @@ class Task(Enum):
     FINISHED = "Finished"
     IN_PROGRESS = "In-progress"
     ERROR = "Error"
+    RECHECKING = "Rechecking"
+    DRAINING = "Draining"
 
 
 class QueryLog(Enum):
@@ -34,6 +36,8 @@ s3 = boto3.client('s3')
 dynamodb = boto3.resource("dynamodb", region_name=REGION)
 task_table_name = os.environ.get("DDB_TASK_TABLE")
 task_table = dynamodb.Table(task_table_name)
+# The statistics of a task, updated every minute by the collect task stats function while the task is in progress.
+STATS_KEY = "stats#{}"
 
 
 def get_task_complete_percentage(create_time: str, traffic_window: int):
@@ -63,6 +67,40 @@ def get_task_complete_percentage(create_time: str, traffic_window: int):
         return "100%"
 
 
+def get_task_stats(task_id: str):
+    """
+        Returns the throughput, backlog and ETA of a task from its statistics item.
+
+        Args:
+            task_id (str): The ID of the task.
+
+        Returns:
+            dict: The statistics of the task, or None when they have not been collected yet.
+    """
+
+    stats = task_table.get_item(Key={"task_id": STATS_KEY.format(task_id)}).get("Item")
+    if stats is None:
+        return None
+    return {
+        # Queries per minute over the last 1, 5 and 15 minutes.
+        "rates": {window: {name: float(rate) for name, rate in rates.items()}
+                  for window, rates in stats["rates"].items()},
+        "queued_messages": int(stats["queued_messages"]),
+        "in_flight_messages": int(stats["in_flight_messages"]),
+        "pending_queries": int(stats["pending_queries"]),
+        "stream_lag_seconds": None if stats["stream_lag_seconds"] is None else int(stats["stream_lag_seconds"]),
+        "eta_seconds": None if stats["eta_seconds"] is None else int(stats["eta_seconds"]),
+        # [minutes since the task was created, distinct queries captured]
+        "discovery": [[int(minute), int(captured)] for minute, captured in stats["discovery"]],
+        # Statements per second read by each agent over the last 5 minutes, and the busiest agent over the average.
+        "agents": [{"instance_id": agent["instance_id"],
+                    "lines_per_second": None if agent["lines_per_second"] is None else float(agent["lines_per_second"])}
+                   for agent in stats.get("agents", [])],
+        "agent_imbalance": None if stats.get("agent_imbalance") is None else float(stats["agent_imbalance"]),
+        "updated_time": stats["updated_time"]
+    }
+
+
 def get_task_info(task_id: str):
     """
         Retrieves information about a task from the DynamoDB table.
@@ -91,8 +129,12 @@ def get_task_info(task_id: str):
             return_dict["status"] = status
             return_dict["cluster_identifier"] = item["cluster_identifier"]
             return_dict["captured_query"] = int(item["captured_query"])
+            return_dict["distinct_query"] = int(item.get("distinct_query", 0))
             return_dict["checked_query"] = int(item["checked_query"])
             return_dict["failed_query"] = int(item["failed_query"])
+            # The failed count of each validation target, in the failed_query_<target> attributes.
+            return_dict["target_failed_query"] = {name[len("failed_query_"):]: int(value) for name, value in item.items()
+                                                  if name.startswith("failed_query_")}
             return_dict["message"] = item["message"]
             return_dict["created_time"] = item["created_time"]
             return_dict["traffic_window"] = int(item["traffic_window"])
@@ -100,10 +142,44 @@ def get_task_info(task_id: str):
                                                                               int(item["traffic_window"]))
             if "start_capture_time" in item:
                 return_dict["start_capture_time"] = item["start_capture_time"]
+            if int(item.get("early_finish_minutes", 0)) > 0:
+                # The task finishes once new queries are discovered at most at this rate for this many minutes.
+                return_dict["early_finish"] = {
+                    "rate": float(item["early_finish_rate"]),
+                    "minutes": int(item["early_finish_minutes"])
+                }
+                if "early_finish_time" in item:
+                    return_dict["early_finish"]["finish_time"] = item["early_finish_time"]
+            task_stats = get_task_stats(task_id)
+            if task_stats is not None:
+                return_dict["stats"] = task_stats
+
+            if status == Task.DRAINING.value and "drain_progress" in item:
+                # The capture has stopped, the queries still in the pipeline are being validated.
+                drain_progress = item["drain_progress"]
+                return_dict["drain_progress"] = {
+                    "queued_messages": int(drain_progress["queued_messages"]),
+                    "in_flight_messages": int(drain_progress["in_flight_messages"]),
+                    "pending_queries": int(drain_progress["pending_queries"]),
+                    "elapsed_seconds": int(drain_progress["elapsed_seconds"]),
+                    "timeout_seconds": int(drain_progress["timeout_seconds"]),
+                    "checked_time": drain_progress["checked_time"]
+                }
 
             if status == Task.STOPPED.value or status == Task.FINISHED.value:
                 if "end_time" in item:
                     return_dict["end_time"] = item["end_time"]
+                if "report_export_error" in item:
+                    # The export was continued too many times and stopped, a recheck exports the report again.
+                    return_dict["report_export_error"] = item["report_export_error"]
+                if "corpus_export_error" in item:
+                    return_dict["corpus_export_error"] = item["corpus_export_error"]
+                if "report_export" in item:
+                    # The report is being exported, the rows exported so far.
+                    return_dict["report_progress"] = {
+                        "exported_rows": int(item["report_export"]["rows"]),
+                        "uploaded_parts": len(item["report_export"]["parts"])
+                    }
                 if item.get("report_s3_bucket") and item.get("report_s3_key"):
                     return_dict["complete_percentage"] = "100%"
                     report_s3_uri = "s3://" + item["report_s3_bucket"] + "/" + item["report_s3_key"]
@@ -114,11 +190,41 @@ def get_task_info(task_id: str):
                             }, ExpiresIn=172800
                         )
                         return_dict["report_s3_presign_url"] = response
+                        if item.get("risk_report_s3_key"):
+                            return_dict["risk_report_s3_presign_url"] = s3.generate_presigned_url('get_object', Params={
+                                    'Bucket': item["report_s3_bucket"],
+                                    'Key': item["risk_report_s3_key"]
+                                }, ExpiresIn=172800
+                            )
+                        if item.get("summary_report_s3_key"):
+                            return_dict["summary_report_s3_presign_url"] = s3.generate_presigned_url(
+                                'get_object', Params={
+                                    'Bucket': item["report_s3_bucket"],
+                                    'Key': item["summary_report_s3_key"]
+                                }, ExpiresIn=172800
+                            )
                     except ClientError as e:
                         logger.error(e)
                 else:
                     report_s3_uri = "Report is generating, please wait a moment."
                 return_dict["report_s3_uri"] = report_s3_uri
+                if "corpus_s3_uri" in item:
+                    # All queries of the task as a Parquet dataset partitioned by status.
+                    return_dict["corpus_s3_uri"] = item["corpus_s3_uri"]
+                    return_dict["corpus_rows"] = int(item["corpus_rows"])
+
+            if "report_s3_presign_url" not in return_dict and item.get("partial_report_s3_key"):
+                # The failed queries validated so far, while the task captures queries or the report is generating.
+                try:
+                    return_dict["partial_report_s3_presign_url"] = s3.generate_presigned_url('get_object', Params={
+                            'Bucket': item["report_s3_bucket"],
+                            'Key': item["partial_report_s3_key"]
+                        }, ExpiresIn=172800
+                    )
+                    return_dict["partial_report_rows"] = int(item["partial_report_rows"])
+                    return_dict["partial_report_time"] = item["partial_report_time"]
+                except ClientError as e:
+                    logger.error(e)
         else:
             return_dict["message"] = "The task_id is not in DynamoDB table."
     except Exception as e:
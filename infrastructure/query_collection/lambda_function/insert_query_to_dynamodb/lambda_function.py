@@ -1,6 +1,8 @@
 import json
 import boto3
 import os
+import zlib
+import time
 from botocore.exceptions import ClientError
 from enum import Enum
 from datetime import datetime
@@ -13,6 +15,8 @@ task_table = dynamodb.Table(task_table_name)
 
 log_table_name = os.environ.get("DDB_LOG_TABLE")
 log_table = dynamodb.Table(log_table_name)
+log_table_buckets = int(os.environ.get("LOG_TABLE_BUCKETS", "1"))
+query_compress_threshold = int(os.environ.get("QUERY_COMPRESS_THRESHOLD", "512"))
 
 
 class Task(Enum):
@@ -21,11 +25,57 @@ class Task(Enum):
     FINISHED = 'Finished'
     IN_PROGRESS = 'In-progress'
     ERROR = 'Error'
+    DRAINING = 'Draining'
+
+
+def get_task_bucket(task_id, query_hash):
+    # Spread the digests of one task over several partitions, the bucket is derived from the query hash.
+    bucket = int(query_hash[:8], 16) % log_table_buckets
+    return '{}#{}'.format(task_id, bucket)
+
+
+def build_log_item(body, seen_count=1):
+    """
+        Builds a compact check log item from a captured query message.
+
+        Only the fields used by the validator and the report are kept, the query hash is stored as binary
+        and queries longer than QUERY_COMPRESS_THRESHOLD bytes are stored zlib compressed in query_z.
+        pending_bucket and pending_since put the item into the sparse pending index until it is validated.
+        seen_count is the number of times the query was captured, it weighs its performance risks in the report.
+
+        Args:
+            body (dict): The query message sent by the agent.
+            seen_count (int): The number of times the query was captured in the batch.
+
+        Returns:
+            dict: The log item to put into the check log table.
+    """
+
+    log_item = {
+        'task_bucket': get_task_bucket(body['task_id'], body['query_hash']),
+        'query_hash': bytes.fromhex(body['query_hash']),
+        'task_id': body['task_id'],
+        'src': body['src'],
+        'src_port': body['src_port'],
+        'pending_since': int(time.time()),
+        'seen_count': seen_count,
+    }
+    log_item['pending_bucket'] = log_item['task_bucket']
+
+    query = body['query'].encode()
+    if len(query) > query_compress_threshold:
+        log_item['query_z'] = zlib.compress(query)
+    else:
+        log_item['query'] = body['query']
+
+    return log_item
 
 
 def lambda_handler(event, context):
     unique_hash_dict = {}
     query_count = 0
+    # The queries of the batch that are new to the task, they draw its discovery curve.
+    distinct_count = 0
     task_id = ''
         
     for record in event['Records']:
@@ -34,52 +84,40 @@ def lambda_handler(event, context):
         task_id = body['task_id']
 
         if body['query_hash'] not in unique_hash_dict:
-            unique_hash_dict[body['query_hash']] = ""
-            
-            # Check if the item already exists in DynamoDB
-            response = log_table.get_item(
-                Key={
-                    'task_id': body['task_id'],
-                    'query_hash': body['query_hash']
-                },
-                ProjectionExpression='task_id'
+            unique_hash_dict[body['query_hash']] = [body, 0]
+        unique_hash_dict[body['query_hash']][1] += 1
+
+    for body, seen_count in unique_hash_dict.values():
+        log_item = build_log_item(body, seen_count)
+
+        # Only put the item if it does not exist in DynamoDB yet, otherwise count the captures of the query.
+        try:
+            log_table.put_item(Item=log_item, ConditionExpression='attribute_not_exists(query_hash)')
+            distinct_count += 1
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            log_table.update_item(
+                Key={'task_bucket': log_item['task_bucket'], 'query_hash': log_item['query_hash']},
+                UpdateExpression='ADD seen_count :seen_count',
+                ExpressionAttributeValues={':seen_count': seen_count}
             )
-            
-            if 'Item' not in response:
-                log_table.put_item(Item=body)
     
     print('*'*20 + str(query_count))
 
     try:
         task_key = {'task_id': task_id}
-        update_expression = "set captured_query = captured_query + :captured_query, #status = :s"
-        expression_attribute_values = {
-            ':captured_query': query_count,
-            ':s': Task.IN_PROGRESS.value,
-            ':in_progress_flag': 1
-        }
-
-        response = task_table.get_item(
-            Key=task_key
-        )
-        if "Item" in response:
-            item = response["Item"]
-            status = item["status"]
-            if status == Task.CREATED.value:
-                # The first time to capture query.
-                update_expression = update_expression + ", start_capture_time = :c"
-                current_time = datetime.utcnow()
-                formatted_time = current_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
-                expression_attribute_values[':c'] = formatted_time
-
         task_table.update_item(
             Key=task_key,
-            UpdateExpression=update_expression,
+            UpdateExpression="set captured_query = captured_query + :captured_query, "
+                             "distinct_query = if_not_exists(distinct_query, :zero) + :distinct_query",
             ConditionExpression='in_progress = :in_progress_flag',
-            ExpressionAttributeNames={
-                '#status': 'status'
+            ExpressionAttributeValues={
+                ':captured_query': query_count,
+                ':distinct_query': distinct_count,
+                ':zero': 0,
+                ':in_progress_flag': 1
             },
-            ExpressionAttributeValues=expression_attribute_values,
             ReturnValues='NONE'
         )
     except ClientError as e:
@@ -88,8 +126,34 @@ def lambda_handler(event, context):
             # Handle the conditional check failure here
             # For example, you can retry the update operation
         else:
-            print('Error updating item:', e)    
-    
+            print('Error updating item:', e)
+        return
+
+    response = task_table.get_item(
+        Key=task_key
+    )
+    if response.get("Item", {}).get("status") == Task.CREATED.value:
+        # The first time to capture query. Concurrent first batches race for the transition, their counters are
+        # already added, so only the status update of the losers fails. A draining task stays Draining.
+        current_time = datetime.utcnow()
+        formatted_time = current_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+        try:
+            task_table.update_item(
+                Key=task_key,
+                UpdateExpression="set #status = :s, start_capture_time = :c",
+                ConditionExpression='#status = :created',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':s': Task.IN_PROGRESS.value,
+                    ':created': Task.CREATED.value,
+                    ':c': formatted_time
+                },
+                ReturnValues='NONE'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                print('Error updating item:', e)
+
     # print(response)
     
 
@@ -4,7 +4,9 @@ from aws_cdk import (
     aws_iam,
     aws_sqs,
     aws_lambda_event_sources as source,
-    aws_s3
+    aws_s3,
+    aws_events as events,
+    aws_events_targets as targets
 )
 from constructs import Construct
 
@@ -58,6 +60,14 @@ class LambdaFunction(Construct):
             )
         )
 
+        get_db_instance_type_lambda_role.add_to_policy(
+            aws_iam.PolicyStatement(
+                effect=aws_iam.Effect.ALLOW,
+                actions=['cloudwatch:GetMetricStatistics'],
+                resources=['*'],
+            )
+        )
+
         self.get_db_instance_type = aws_lambda.Function(
             self, "get_db_instance_type",
             code=aws_lambda.Code.from_asset("infrastructure/query_collection/lambda_function/get_db_instance_type"),
@@ -67,6 +77,10 @@ class LambdaFunction(Construct):
             role=get_db_instance_type_lambda_role,
             function_name='db-check-get-db-instance-type-{}'.format(env_name),
             layers=[dnspython_layer],
+            environment={'AGENT_STATEMENTS_PER_SECOND': str(params['agent_statements_per_second']),
+                         'AGENT_MAX_COUNT': str(params['agent_max_count']),
+                         'TRAFFIC_MIRROR_FILTER_ID': params['tmf_id'],
+                         'TRAFFIC_MIRROR_SHARD_FILTER_IDS': ','.join(params['tmf_shard_ids'])},
             )
         
         insert_query_to_dynamodb_lambda_role = aws_iam.Role(
@@ -89,6 +103,8 @@ class LambdaFunction(Construct):
             environment={'REGION': region,
                          'DDB_TASK_TABLE': params['check_task_table_name'],
                          'DDB_LOG_TABLE': params['check_log_table_name'],
+                         'LOG_TABLE_BUCKETS': str(params['check_log_table_bucket_count']),
+                         'QUERY_COMPRESS_THRESHOLD': str(params['check_log_query_compress_threshold']),
                          }
             )
         
@@ -104,6 +120,44 @@ class LambdaFunction(Construct):
         dynamodb_tables.task_table.grant_read_write_data(self.insert_query_to_dynamodb)
         dynamodb_tables.log_table.grant_read_write_data(self.insert_query_to_dynamodb)
 
+        # Create get pipeline backlog lambda function, polled by the cleanup state machine while the task drains.
+        get_pipeline_backlog_lambda_role = aws_iam.Role(
+            self,
+            "db-check-get-pipeline-backlog-lambda-role-{}".format(env_name),
+            role_name="db-check-get-pipeline-backlog-lambda-role-{}".format(env_name),
+            assumed_by=aws_iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                aws_iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")]
+        )
+
+        get_pipeline_backlog_lambda_role.add_to_policy(
+            aws_iam.PolicyStatement(
+                effect=aws_iam.Effect.ALLOW,
+                actions=['sqs:GetQueueAttributes'],
+                resources=[sqs.queue_arn],
+            )
+        )
+
+        self.get_pipeline_backlog = aws_lambda.Function(
+            self, "get_pipeline_backlog",
+            code=aws_lambda.Code.from_asset("infrastructure/query_collection/lambda_function/get_pipeline_backlog"),
+            handler="lambda_function.lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_12,
+            timeout=Duration.seconds(60),
+            function_name='db-check-get-pipeline-backlog-{}'.format(env_name),
+            role=get_pipeline_backlog_lambda_role,
+            environment={'REGION': region,
+                         'QUEUE_URL': sqs.queue_url,
+                         'DDB_TASK_TABLE': params['check_task_table_name'],
+                         'DDB_LOG_TABLE': params['check_log_table_name'],
+                         'DDB_LOG_TABLE_GSI': params['check_log_table_gsi_name'],
+                         'LOG_TABLE_BUCKETS': str(params['check_log_table_bucket_count']),
+                         'DRAIN_TIMEOUT_SECONDS': str(params['drain_timeout_minutes'] * 60),
+                         }
+        )
+        dynamodb_tables.task_table.grant_read_write_data(self.get_pipeline_backlog)
+        dynamodb_tables.log_table.grant_read_data(self.get_pipeline_backlog)
+
         # Create get task progress lambda function and role
         get_task_progress_lambda_role = aws_iam.Role(
             self,
@@ -126,5 +180,95 @@ class LambdaFunction(Construct):
                          'DDB_TASK_TABLE': params['check_task_table_name']},
         )
         dynamodb_tables.task_table.grant_read_write_data(self.get_task_progress)
+
+        # Create collect task stats lambda function, samples the throughput and backlog of the running tasks.
+        collect_task_stats_lambda_role = aws_iam.Role(
+            self,
+            "db-check-collect-task-stats-lambda-role-{}".format(env_name),
+            role_name="db-check-collect-task-stats-lambda-role-{}".format(env_name),
+            assumed_by=aws_iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                aws_iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")]
+        )
+
+        collect_task_stats_lambda_role.add_to_policy(
+            aws_iam.PolicyStatement(
+                effect=aws_iam.Effect.ALLOW,
+                actions=['sqs:GetQueueAttributes'],
+                resources=[sqs.queue_arn],
+            )
+        )
+
+        collect_task_stats_lambda_role.add_to_policy(
+            aws_iam.PolicyStatement(
+                effect=aws_iam.Effect.ALLOW,
+                actions=['cloudwatch:GetMetricStatistics'],
+                resources=['*'],
+            )
+        )
+
+        collect_task_stats_lambda_role.add_to_policy(
+            aws_iam.PolicyStatement(
+                effect=aws_iam.Effect.ALLOW,
+                actions=['autoscaling:DescribeAutoScalingGroups'],
+                resources=['*'],
+            )
+        )
+
+        self.collect_task_stats = aws_lambda.Function(
+            self, "collect_task_stats",
+            code=aws_lambda.Code.from_asset("infrastructure/query_collection/lambda_function/collect_task_stats"),
+            handler="lambda_function.lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_12,
+            timeout=Duration.seconds(60),
+            function_name='db-check-collect-task-stats-{}'.format(env_name),
+            role=collect_task_stats_lambda_role,
+            environment={'REGION': region,
+                         'QUEUE_URL': sqs.queue_url,
+                         'DDB_TASK_TABLE': params['check_task_table_name'],
+                         'DDB_TASK_TABLE_GSI': params['check_task_table_gsi_name'],
+                         'DDB_LOG_TABLE': params['check_log_table_name'],
+                         'DDB_LOG_TABLE_GSI': params['check_log_table_gsi_name'],
+                         'LOG_TABLE_BUCKETS': str(params['check_log_table_bucket_count']),
+                         'VALIDATE_FUNCTION_NAME': params['validate_function_name'],
+                         'ASG_NAME': params['asg_name'],
+                         'METRIC_NAMESPACE': params['metric_namespace'],
+                         }
+        )
+        dynamodb_tables.task_table.grant_read_write_data(self.collect_task_stats)
+        dynamodb_tables.log_table.grant_read_data(self.collect_task_stats)
+
+        events.Rule(
+            self, "collect_task_stats_schedule",
+            rule_name='db-check-collect-task-stats-schedule-{}'.format(env_name),
+            schedule=events.Schedule.rate(Duration.minutes(params['stats_schedule_minutes'])),
+            targets=[targets.LambdaFunction(self.collect_task_stats)]
+        )
         s3_bucket.grant_read_write(get_task_progress_lambda_role)
 
+
+        # Create get task failures lambda function, reads the failed queries of a task page by page.
+        get_task_failures_lambda_role = aws_iam.Role(
+            self,
+            "db-check-get-task-failures-lambda-role-{}".format(env_name),
+            role_name="db-check-get-task-failures-lambda-role-{}".format(env_name),
+            assumed_by=aws_iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                aws_iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")]
+        )
+
+        self.get_task_failures = aws_lambda.Function(
+            self, "get_task_failures",
+            code=aws_lambda.Code.from_asset("infrastructure/query_collection/lambda_function/get_task_failures"),
+            handler="lambda_function.lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_12,
+            timeout=Duration.seconds(29),
+            memory_size=512,
+            function_name='db-check-get-task-failures-{}'.format(env_name),
+            role=get_task_failures_lambda_role,
+            environment={'REGION': region,
+                         'DDB_LOG_TABLE': params['check_log_table_name'],
+                         'DDB_LOG_TABLE_FAILED_GSI': params['check_log_table_failed_gsi_name'],
+                         'LOG_TABLE_BUCKETS': str(params['check_log_table_bucket_count'])},
+        )
+        dynamodb_tables.log_table.grant_read_data(self.get_task_failures)
@@ -15,7 +15,8 @@ from constructs import Construct
 
 class LaunchTemplate(Construct):
     def __init__(self, scope: Construct, construct_id: str, env_name: str, bucket: aws_s3.Bucket, 
-                 task_table: aws_dynamodb.Table, region: str, sqs: aws_sqs.Queue, key_name: str, sg, **kwargs) -> None:
+                 task_table: aws_dynamodb.Table, region: str, sqs: aws_sqs.Queue, key_name: str, sg,
+                 metric_namespace: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
         
         source_code = 's3://{}/code/'.format(bucket.bucket_name)
@@ -30,6 +31,13 @@ class LaunchTemplate(Construct):
         bucket.grant_read(self.agent_role)
         sqs.grant_send_messages(self.agent_role)
         task_table.grant_read_data(self.agent_role)
+        # The Auto Scaling Group of the agents tracks the load they publish.
+        self.agent_role.add_to_policy(aws_iam.PolicyStatement(
+            effect=aws_iam.Effect.ALLOW,
+            actions=['cloudwatch:PutMetricData'],
+            resources=['*'],
+            conditions={'StringEquals': {'cloudwatch:namespace': metric_namespace}}
+        ))
         
         # user data
         user_data = aws_ec2.UserData.for_linux()
@@ -47,6 +55,8 @@ class LaunchTemplate(Construct):
         user_data.add_commands('echo "region={}" >> /home/ec2-user/agent/config.conf'.format(region))
         user_data.add_commands('echo "queue_url={}" >> /home/ec2-user/agent/config.conf'.format(sqs.queue_url))
         user_data.add_commands('echo "task_dynamodb_name={}" >> /home/ec2-user/agent/config.conf'.format(task_table.table_name))
+        user_data.add_commands('echo "metric_namespace={}" >> /home/ec2-user/agent/config.conf'.format(metric_namespace))
+        user_data.add_commands('echo "asg_name=db_check_asg_{}" >> /home/ec2-user/agent/config.conf'.format(env_name))
         user_data.add_commands('sh setup.sh')
         # user_data.add_commands('sudo -u ec2-usevimpython3 -u /home/ec2-user/agent/agent.py > /home/ec2-user/agent/run.log  2>&1 &')
         # user_data.add_commands('sudo yum install cronie -y')
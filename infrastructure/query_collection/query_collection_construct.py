@@ -21,6 +21,8 @@ class QueryCollectionConstruct(Construct):
 
         vpc = ec2.Vpc.from_lookup(self, "ExistingVPC", vpc_id=params['vpc_id'])
         vpc.add_gateway_endpoint("DynamoDbEndpoint", service=ec2.GatewayVpcEndpointAwsService.DYNAMODB)
+        # The validation functions write the report segments from the private subnets.
+        vpc.add_gateway_endpoint("S3Endpoint", service=ec2.GatewayVpcEndpointAwsService.S3)
 
         private_subnets = [ec2.Subnet.from_subnet_id(self, "private-subnet-{}".format(i), subnet_id=subnet_id) for i, subnet_id in enumerate(params['private_subnet_ids'])]
 
@@ -35,10 +37,13 @@ class QueryCollectionConstruct(Construct):
                                          env_name=params['env_name'], bucket=bucket.bucket,
                                          region=params['region'], sqs=sqs.queries_compatibility_check_queue,
                                          task_table=dynamodb_tables.task_table,
-                                         key_name=params['keypair'], sg=sg.security_group)
+                                         key_name=params['keypair'], sg=sg.security_group,
+                                         metric_namespace=params['metric_namespace'])
 
         asg = ASG(self, "asg", vpc=vpc, public_subnets=public_subnets, env_name=params['env_name'], 
-                  launch_template=launch_template.agent_launch_template) 
+                  launch_template=launch_template.agent_launch_template,
+                  metric_namespace=params['metric_namespace'],
+                  agent_statements_per_second=params['agent_statements_per_second']) 
         params['asg_name'] = asg.asg.auto_scaling_group_name
         params['asg_arn'] = asg.asg.auto_scaling_group_arn
         
@@ -47,23 +52,36 @@ class QueryCollectionConstruct(Construct):
                   asg=asg.asg)
 
         traffic_mirroring = TrafficMirroring(self, 'TrafficMirroring', env_name=params['env_name'], vpc=vpc,
-                                             nlb=nlb.network_load_balancer)
+                                             nlb=nlb.network_load_balancer, mirror_shards=params['mirror_shards'])
         params['tmt_id'] = traffic_mirroring.traffic_mirror_target.ref
         params['tmf_id'] = traffic_mirroring.traffic_mirror_filter.ref
+        params['tmf_shard_ids'] = [shard_filter.ref for shard_filter in traffic_mirroring.tmf_shards]
 
         lambda_function = LambdaFunction(self, 'LambdaFunction', params,
                                          sqs=sqs.queries_compatibility_check_queue,
                                          dynamodb_tables=dynamodb_tables,
                                          s3_bucket=bucket.bucket)
         params['get_db_instance_type_function_arn'] = lambda_function.get_db_instance_type.function_arn
+        params['get_pipeline_backlog_function_arn'] = lambda_function.get_pipeline_backlog.function_arn
 
         step_functions = StepFunctions(self, "step_function", params)
+        # The stats collector finishes a task early with the cleanup state machine.
+        lambda_function.collect_task_stats.add_environment('CLEANUP_STATE_MACHINE_ARN',
+                                                           step_functions.cleanup_step_function.attr_arn)
+        lambda_function.collect_task_stats.add_to_role_policy(
+            aws_iam.PolicyStatement(
+                effect=aws_iam.Effect.ALLOW,
+                actions=['states:StartExecution'],
+                resources=[step_functions.cleanup_step_function.attr_arn],
+            )
+        )
         
         api_method = ApiMethod(self, "api_method", api=api, 
                                env_name=params['env_name'],
                                cleanup_state_machine=step_functions.cleanup_step_function,
                                create_state_machine=step_functions.create_step_function,
-                               get_task_progress_function=lambda_function.get_task_progress)
+                               get_task_progress_function=lambda_function.get_task_progress,
+                               get_task_failures_function=lambda_function.get_task_failures)
 
         # Set properties
         self.the_vpc = vpc
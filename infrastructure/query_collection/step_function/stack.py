@@ -17,6 +17,7 @@ class StepFunctions(Construct):
         asg_name = params["asg_name"]
         sqs_queue_name = "queries-compatibility-check-queue-{}".format(env_name)
         create_step_function_arn = f"arn:aws:states:{region}:{account}:execution:CreateTaskStateMachine_{env_name}"
+        sweeper_function_arn = f"arn:aws:lambda:{region}:{account}:function:{params['sweeper_function_name']}"
 
         # Create policy document
         policy = iam.Policy(
@@ -37,7 +38,9 @@ class StepFunctions(Construct):
                 iam.PolicyStatement(
                     effect=iam.Effect.ALLOW,
                     actions=['lambda:InvokeFunction'],
-                    resources=[f'{params["get_db_instance_type_function_arn"]}:*', params["get_db_instance_type_function_arn"]],
+                    resources=[f'{params["get_db_instance_type_function_arn"]}:*', params["get_db_instance_type_function_arn"],
+                               f'{params["get_pipeline_backlog_function_arn"]}:*', params["get_pipeline_backlog_function_arn"],
+                               f'{sweeper_function_arn}:*', sweeper_function_arn],
                 ),
                 iam.PolicyStatement(
                     effect=iam.Effect.ALLOW,
@@ -121,7 +124,109 @@ class StepFunctions(Construct):
               },
               "Resource": "arn:aws:states:::aws-sdk:autoscaling:updateAutoScalingGroup",
               "ResultPath": "$.update_asg",
-              "Next": "PurgeQueue"
+              "Next": "Init drain"
+            },
+            "Init drain": {
+              "Type": "Pass",
+              "Parameters": {
+                "started.$": "$$.State.EnteredTime",
+                "attempt": 0
+              },
+              "ResultPath": "$.drain",
+              "Next": "DynamoDB UpdateTaskStatusDraining"
+            },
+            "DynamoDB UpdateTaskStatusDraining": {
+              "Type": "Task",
+              "Resource": "arn:aws:states:::dynamodb:updateItem",
+              "Parameters": {
+                "TableName": "check_task_table_name",
+                "Key": {
+                  "task_id": {
+                    "S.$": "$.task_id"
+                  }
+                },
+                "UpdateExpression": "SET #s = :draining, drain_start_time = :start_time",
+                "ExpressionAttributeNames": {
+                  "#s": "status"
+                },
+                "ExpressionAttributeValues": {
+                  ":draining": {
+                    "S": "Draining"
+                  },
+                  ":start_time": {
+                    "S.$": "$.drain.started"
+                  }
+                }
+              },
+              "ResultPath": null,
+              "Next": "Check pipeline backlog"
+            },
+            "Check pipeline backlog": {
+              "Type": "Task",
+              "Resource": "arn:aws:states:::lambda:invoke",
+              "Parameters": {
+                "Payload": {
+                  "task_id.$": "$.task_id",
+                  "attempt.$": "$.drain.attempt",
+                  "drain_started.$": "$.drain.started"
+                },
+                "FunctionName": "get_pipeline_backlog_function_arn"
+              },
+              "Retry": [
+                {
+                  "ErrorEquals": [
+                    "Lambda.ServiceException",
+                    "Lambda.AWSLambdaException",
+                    "Lambda.SdkClientException",
+                    "Lambda.TooManyRequestsException"
+                  ],
+                  "IntervalSeconds": 2,
+                  "MaxAttempts": 3,
+                  "BackoffRate": 2
+                }
+              ],
+              "Catch": [
+                {
+                  "ErrorEquals": [
+                    "States.ALL"
+                  ],
+                  "Next": "PurgeQueue",
+                  "ResultPath": "$.drain_error"
+                }
+              ],
+              "ResultSelector": {
+                "started.$": "$.Payload.started",
+                "attempt.$": "$.Payload.attempt",
+                "drained.$": "$.Payload.drained",
+                "expired.$": "$.Payload.expired",
+                "wait_seconds.$": "$.Payload.wait_seconds"
+              },
+              "ResultPath": "$.drain",
+              "Next": "Is pipeline drained"
+            },
+            "Is pipeline drained": {
+              "Type": "Choice",
+              "Choices": [
+                {
+                  "Or": [
+                    {
+                      "Variable": "$.drain.drained",
+                      "BooleanEquals": true
+                    },
+                    {
+                      "Variable": "$.drain.expired",
+                      "BooleanEquals": true
+                    }
+                  ],
+                  "Next": "PurgeQueue"
+                }
+              ],
+              "Default": "Wait for pipeline"
+            },
+            "Wait for pipeline": {
+              "Type": "Wait",
+              "SecondsPath": "$.drain.wait_seconds",
+              "Next": "Check pipeline backlog"
             },
             "PurgeQueue": {
               "Type": "Task",
@@ -129,9 +234,65 @@ class StepFunctions(Construct):
                 "QueueUrl": "sqs_queue_url"
               },
               "Resource": "arn:aws:states:::aws-sdk:sqs:purgeQueue",
-              "Next": "Is stopped manually",
+              "Next": "Sweep pending queries",
               "ResultPath": "$.sqs"
             },
+            "Sweep pending queries": {
+              "Type": "Task",
+              "Resource": "arn:aws:states:::lambda:invoke",
+              "Parameters": {
+                "Payload": {
+                  "task_id.$": "$.task_id",
+                  "grace_seconds": 0
+                },
+                "FunctionName": "sweeper_function_arn"
+              },
+              "Retry": [
+                {
+                  "ErrorEquals": [
+                    "Lambda.ServiceException",
+                    "Lambda.AWSLambdaException",
+                    "Lambda.SdkClientException",
+                    "Lambda.TooManyRequestsException",
+                    "DatabaseUnavailableError"
+                  ],
+                  "IntervalSeconds": 5,
+                  "MaxAttempts": 5,
+                  "BackoffRate": 2
+                }
+              ],
+              "Catch": [
+                {
+                  "ErrorEquals": [
+                    "States.ALL"
+                  ],
+                  "Next": "Wait for task counters",
+                  "ResultPath": "$.sweep_error"
+                }
+              ],
+              "ResultSelector": {
+                "done.$": "$.Payload.done",
+                "swept.$": "$.Payload.swept"
+              },
+              "ResultPath": "$.sweep",
+              "Next": "Sweep done?"
+            },
+            "Sweep done?": {
+              "Type": "Choice",
+              "Choices": [
+                {
+                  "Variable": "$.sweep.done",
+                  "BooleanEquals": false,
+                  "Next": "Sweep pending queries"
+                }
+              ],
+              "Default": "Wait for task counters"
+            },
+            "Wait for task counters": {
+              "Type": "Wait",
+              "Seconds": 35,
+              "Next": "Is stopped manually"
+            },
             "Is stopped manually": {
               "Type": "Choice",
               "Choices": [
@@ -208,7 +369,22 @@ class StepFunctions(Construct):
                   }
                 }
               },
-              "End": true
+              "Next": "Is finished early",
+              "ResultPath": "$.ddb_task_finished"
+            },
+            "Is finished early": {
+              "Type": "Choice",
+              "Choices": [
+                {
+                  "Variable": "$.early_finished",
+                  "IsPresent": true,
+                  "Next": "StopExecution"
+                }
+              ],
+              "Default": "Finished"
+            },
+            "Finished": {
+              "Type": "Succeed"
             }
           }
         }
@@ -218,6 +394,16 @@ class StepFunctions(Construct):
         cleanup_function_definition = cleanup_function_definition.replace("traffic-mirror-asg", params['asg_name'])
         cleanup_function_definition = cleanup_function_definition.replace("create_step_function_arn",
                                                                           create_step_function_arn)
+        cleanup_function_definition = cleanup_function_definition.replace("sweeper_function_arn", sweeper_function_arn)
+        cleanup_function_definition = cleanup_function_definition.replace("get_pipeline_backlog_function_arn",
+                                                                          params['get_pipeline_backlog_function_arn'])
+
+        # The validator writes the task counters once per tumbling window, the last window is flushed before the
+        # final status is set.
+        cleanup_function_definition_dict = json.loads(cleanup_function_definition)
+        cleanup_function_definition_dict['States']['Wait for task counters']['Seconds'] = \
+            params['check_log_stream_tumbling_window_seconds'] + 5
+        cleanup_function_definition = json.dumps(cleanup_function_definition_dict)
 
         self.cleanup_step_function = sfn.CfnStateMachine(
             self,
@@ -230,8 +416,25 @@ class StepFunctions(Construct):
         create_function_definition = '''
             {
               "Comment": "A description of my state machine",
-              "StartAt": "Check status",
+              "StartAt": "Default options",
               "States": {
+                "Default options": {
+                  "Type": "Pass",
+                  "Result": {
+                    "early_finish_rate": 0,
+                    "early_finish_minutes": 0
+                  },
+                  "ResultPath": "$.default_options",
+                  "Next": "Apply options"
+                },
+                "Apply options": {
+                  "Type": "Pass",
+                  "Parameters": {
+                    "input.$": "States.JsonMerge($.default_options, $, false)"
+                  },
+                  "OutputPath": "$.input",
+                  "Next": "Check status"
+                },
                 "Check status": {
                   "Type": "Task",
                   "Next": "Existing task?",
@@ -355,6 +558,10 @@ class StepFunctions(Construct):
                     "read_endpoint.$": "$.Payload.read_endpoint",
                     "error.$": "$.Payload.error",
                     "instance_count.$": "$.Payload.instance_count",
+                    "min_count.$": "$.Payload.min_count",
+                    "max_count.$": "$.Payload.max_count",
+                    "statement_rate.$": "$.Payload.statement_rate",
+                    "mirrors.$": "$.Payload.mirrors",
                     "instances.$": "$.Payload.instances",
                     "stop_time.$": "$.Payload.stop_time"
                   }
@@ -473,8 +680,8 @@ class StepFunctions(Construct):
                   "Parameters": {
                     "AutoScalingGroupName": "traffic-mirror-asg",
                     "DesiredCapacity.$": "$.cluster_info.instance_count",
-                    "MaxSize.$": "$.cluster_info.instance_count",
-                    "MinSize.$": "$.cluster_info.instance_count"
+                    "MaxSize.$": "$.cluster_info.max_count",
+                    "MinSize.$": "$.cluster_info.min_count"
                   },
                   "Resource": "arn:aws:states:::aws-sdk:autoscaling:updateAutoScalingGroup",
                   "ResultPath": "$.update_asg",
@@ -499,9 +706,9 @@ class StepFunctions(Construct):
                       "Create Traffic Mirror Session": {
                         "Type": "Task",
                         "Parameters": {
-                          "NetworkInterfaceId.$": "$.M.eni.M.eni_id.S",
-                          "SessionNumber": 3,
-                          "TrafficMirrorFilterId": "tmf-0766c54e75fe865d8",
+                          "NetworkInterfaceId.$": "$.eni_id",
+                          "SessionNumber.$": "$.session_number",
+                          "TrafficMirrorFilterId.$": "$.filter_id",
                           "TrafficMirrorTargetId": "tmt-0bfe598d01bcd1905",
                           "VirtualNetworkId": 9804898
                         },
@@ -527,7 +734,7 @@ class StepFunctions(Construct):
                     }
                   },
                   "Next": "Store task",
-                  "ItemsPath": "$.cluster_info.instances",
+                  "ItemsPath": "$.cluster_info.mirrors",
                   "Catch": [
                     {
                       "ErrorEquals": [
@@ -563,6 +770,9 @@ class StepFunctions(Construct):
                       "captured_query": {
                         "N": "0"
                       },
+                      "distinct_query": {
+                        "N": "0"
+                      },
                       "checked_query": {
                         "N": "0"
                       },
@@ -575,6 +785,15 @@ class StepFunctions(Construct):
                       "instance_count": {
                         "N.$": "States.JsonToString($.cluster_info.instance_count)"
                       },
+                      "statement_rate": {
+                        "N.$": "States.JsonToString($.cluster_info.statement_rate)"
+                      },
+                      "early_finish_rate": {
+                        "N.$": "States.JsonToString($.early_finish_rate)"
+                      },
+                      "early_finish_minutes": {
+                        "N.$": "States.JsonToString($.early_finish_minutes)"
+                      },
                       "message": {
                         "S": ""
                       },
@@ -679,7 +898,6 @@ class StepFunctions(Construct):
         create_function_definition_dict['States']['Store traffic mirror error']['Parameters']['TableName'] = params['check_task_table_name']
         create_function_definition_dict['States']['Store asg error']['Parameters']['TableName'] = params['check_task_table_name']
 
-        create_function_definition_dict['States']['Iterate eni']['ItemProcessor']['States']['Create Traffic Mirror Session']['Parameters']['TrafficMirrorFilterId'] = params['tmf_id']
         create_function_definition_dict['States']['Iterate eni']['ItemProcessor']['States']['Create Traffic Mirror Session']['Parameters']['TrafficMirrorTargetId'] = params['tmt_id']
 
         create_function_definition_dict['States']['Update Auto Scaling Group']['Parameters']['AutoScalingGroupName'] = params['asg_name']
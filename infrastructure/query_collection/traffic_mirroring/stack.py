@@ -5,10 +5,21 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+# The ephemeral ports of the clients are split evenly between the shard filters, the first one also takes the lower ports.
+EPHEMERAL_PORT_START = 32768
+MAX_PORT = 65535
+# A network interface is the source of at most 3 traffic mirror sessions.
+MAX_MIRROR_SHARDS = 3
+
+
 class TrafficMirroring(Construct):
-    def __init__(self, scope: Construct, id: str, vpc: ec2.Vpc, env_name:str, nlb: elbv2.NetworkLoadBalancer, **kwargs) -> None:
+    def __init__(self, scope: Construct, id: str, vpc: ec2.Vpc, env_name:str, nlb: elbv2.NetworkLoadBalancer,
+                 mirror_shards: int, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
+        if not 1 <= mirror_shards <= MAX_MIRROR_SHARDS:
+            raise ValueError("mirror_shards must be between 1 and {}, got {}".format(MAX_MIRROR_SHARDS, mirror_shards))
+
         # Create a Traffic Mirror Target
         self.traffic_mirror_target = ec2.CfnTrafficMirrorTarget(
             self, "TrafficMirrorTarget",
@@ -39,10 +50,44 @@ class TrafficMirroring(Construct):
             protocol=6,
         )
 
+        # Create the shard filters, each one accepts the traffic of a slice of the client ports. A database network
+        # interface with more traffic than an agent handles is mirrored by one session per shard filter, a connection
+        # always stays in one session, and the NLB spreads the sessions across the agents.
+        self.traffic_mirror_shard_filters = []
+        shard_ports = (MAX_PORT + 1 - EPHEMERAL_PORT_START) // mirror_shards
+        for shard in range(mirror_shards):
+            from_port = 0 if shard == 0 else EPHEMERAL_PORT_START + shard * shard_ports
+            to_port = MAX_PORT if shard == mirror_shards - 1 else EPHEMERAL_PORT_START + (shard + 1) * shard_ports - 1
+            shard_filter = ec2.CfnTrafficMirrorFilter(
+                self, "TrafficMirrorShardFilter{}".format(shard),
+                description="Traffic Mirror Filter shard {} - {}".format(shard, env_name),
+                network_services=[
+                    "amazon-dns"
+                ]
+            )
+            ec2.CfnTrafficMirrorFilterRule(self, "TrafficMirrorShardFilterRule{}".format(shard),
+                destination_cidr_block=vpc.vpc_cidr_block,
+                rule_action="accept",
+                rule_number=100,
+                source_cidr_block=vpc.vpc_cidr_block,
+                traffic_direction="ingress",
+                traffic_mirror_filter_id=shard_filter.ref,
+                description="Traffic Mirror Filter rule allows traffic within the VPC from client ports {}-{}".format(
+                    from_port, to_port),
+                protocol=6,
+                source_port_range=ec2.CfnTrafficMirrorFilterRule.TrafficMirrorPortRangeProperty(
+                    from_port=from_port, to_port=to_port),
+            )
+            self.traffic_mirror_shard_filters.append(shard_filter)
+
     @property
     def tmt(self):
         return self.traffic_mirror_target
 
     @property
     def tmf(self):
-        return self.traffic_mirror_filter 
\ No newline at end of file
+        return self.traffic_mirror_filter
+
+    @property
+    def tmf_shards(self):
+        return self.traffic_mirror_shard_filters
@@ -0,0 +1,89 @@
+from aws_cdk import (
+    aws_apigateway,
+    aws_iam,
+    aws_stepfunctions as sfn
+    )
+from constructs import Construct
+
+
+class RecheckApiMethod(Construct):
+    def __init__(self, scope: Construct, construct_id: str, env_name: str, api: aws_apigateway.RestApi,
+                 recheck_state_machine: sfn.CfnStateMachine, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        # add resource
+        api_resource = api.root.resource_for_path("task").add_resource("recheck")
+
+        # execution role
+        api_role = aws_iam.Role(self, "APIGatewayRecheckRole",
+                                assumed_by=aws_iam.ServicePrincipal("apigateway.amazonaws.com"))
+
+        execution_step_function_policy = aws_iam.Policy(
+            self,
+            "api-execute-recheck-step-function-policy-{}".format(env_name),
+            policy_name="api-execute-recheck-step-function-policy-{}".format(env_name),
+            statements=[
+                aws_iam.PolicyStatement(
+                    effect=aws_iam.Effect.ALLOW,
+                    actions=['states:StartExecution'],
+                    resources=[recheck_state_machine.attr_arn],
+                )
+            ]
+        )
+        api_role.attach_inline_policy(execution_step_function_policy)
+
+        # add recheck task method
+        recheck_tasks_request_model = api.add_model(
+            "post-task-recheck-request-model",
+            model_name="PostTaskRecheckRequestModel{}".format(env_name),
+            schema=aws_apigateway.JsonSchema(
+                schema=None,
+                type=aws_apigateway.JsonSchemaType.OBJECT,
+                properties={
+                    "task_id": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.STRING, max_length=36, min_length=36)
+                },
+                required=["task_id"]
+            )
+        )
+
+        recheck_tasks_response_mapping_template = """
+            #set($inputRoot = $input.path('$'))
+            {
+            "recheck_id" : "$inputRoot.executionArn",
+            "message" : ""
+            }
+        """
+
+        api_resource.add_method(
+                "POST",
+                aws_apigateway.AwsIntegration(
+                    service="states",
+                    options=aws_apigateway.IntegrationOptions(
+                        credentials_role=api_role,
+                        passthrough_behavior=aws_apigateway.PassthroughBehavior.WHEN_NO_TEMPLATES,
+                        integration_responses=[
+                            aws_apigateway.IntegrationResponse(
+                                status_code="200",
+                                response_templates={
+                                    "application/json": recheck_tasks_response_mapping_template
+                                }
+                            )
+                        ],
+                        request_templates={
+                            "application/json": "{\"input\": \"$util.escapeJavaScript($input.json('$'))\", \"stateMachineArn\": \"" + recheck_state_machine.attr_arn + "\"}"
+                        },
+                    ),
+                    action='StartExecution'
+                ),
+                method_responses=[
+                    aws_apigateway.MethodResponse(status_code="200")
+                ],
+                request_validator_options=aws_apigateway.RequestValidatorOptions(
+                    validate_request_body=True,
+                    validate_request_parameters=False
+                ),
+                api_key_required=True,
+                request_models={
+                    "application/json": recheck_tasks_request_model
+                }
+            )
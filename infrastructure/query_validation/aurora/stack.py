@@ -12,16 +12,21 @@ from constructs import Construct
 
 class Aurora(Construct):
     def __init__(self, scope: Construct, construct_id: str, env_name:  str, vpc: ec2.Vpc, private_subnets,
-                 sg: ec2.SecurityGroup, **kwargs) -> None:
+                 sg: ec2.SecurityGroup, engine_version: str = '8.0.mysql_aurora.3.04.1', target_name: str = None,
+                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # The major version is the prefix of the full version, e.g. 8.0 for 8.0.mysql_aurora.3.04.1.
+        engine_version = rds.AuroraMysqlEngineVersion.of(engine_version, engine_version.split('.mysql_aurora')[0])
+        # The first target keeps the original resource names, the others are named after the target.
+        name = env_name if target_name is None else '{}-{}'.format(target_name, env_name)
         cluster = rds.DatabaseCluster(self, "validation_db",
-                                      cluster_identifier=f"validation-db-{env_name}",
+                                      cluster_identifier=f"validation-db-{name}",
                                       engine=rds.DatabaseClusterEngine.aurora_mysql(
-                                          version=rds.AuroraMysqlEngineVersion.VER_3_04_1),
+                                          version=engine_version),
                                       credentials=rds.Credentials.from_generated_secret("admin"),
                                       writer=rds.ClusterInstance.provisioned("writer",
-                                                                             instance_identifier=f"validation-writer-{env_name}",
+                                                                             instance_identifier=f"validation-writer-{name}",
                                                                              publicly_accessible=False,
                                                                              instance_type=ec2.InstanceType.of(
                                                                                  ec2.InstanceClass.R5,
@@ -29,7 +34,7 @@ class Aurora(Construct):
                                                                              ),
                                       readers=[
                                           rds.ClusterInstance.provisioned("reader",
-                                                                          instance_identifier=f"validation-reader-{env_name}",
+                                                                          instance_identifier=f"validation-reader-{name}",
                                                                           instance_type=ec2.InstanceType.of(
                                                                               ec2.InstanceClass.R5,
                                                                               ec2.InstanceSize.LARGE),
@@ -39,10 +44,11 @@ class Aurora(Construct):
                                       vpc=vpc,
                                       security_groups=[sg],
                                       storage_encrypted=True,
+                                      iam_authentication=True,
                                       )
 
         proxy = rds.DatabaseProxy(self, "validation_db_proxy",
-                                  db_proxy_name=f"validation-db-proxy-{env_name}",
+                                  db_proxy_name=f"validation-db-proxy-{name}",
                                   proxy_target=rds.ProxyTarget.from_cluster(cluster),
                                   secrets=[cluster.secret],
                                   vpc=vpc,
@@ -52,10 +58,33 @@ class Aurora(Construct):
                                   iam_auth=True,
                                   )
 
+        # Read-only proxy endpoint, routes the validation connections to the reader instance.
+        proxy_read_only_endpoint = rds.CfnDBProxyEndpoint(self, "validation_db_proxy_read_only_endpoint",
+                                                          db_proxy_endpoint_name=f"validation-db-proxy-ro-{name}",
+                                                          db_proxy_name=proxy.db_proxy_name,
+                                                          vpc_subnet_ids=[subnet.subnet_id for subnet in private_subnets],
+                                                          vpc_security_group_ids=[sg.security_group_id],
+                                                          target_role="READ_ONLY",
+                                                          )
+
         # Set property
         self.db_proxy = proxy
+        self.db_cluster = cluster
+        self.db_proxy_read_only_endpoint = proxy_read_only_endpoint
+        self.db_engine_version = engine_version
 
     @property
     def proxy(self):
         return self.db_proxy
 
+    @property
+    def cluster(self):
+        return self.db_cluster
+
+    @property
+    def proxy_read_only_endpoint(self):
+        return self.db_proxy_read_only_endpoint.attr_endpoint
+
+    @property
+    def engine_version(self):
+        return self.db_engine_version.aurora_mysql_full_version
@@ -0,0 +1,324 @@
+import boto3
+import os
+import json
+import zlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+import pyarrow as pa
+import pyarrow.parquet as pq
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class Task(Enum):
+    STOPPED = 'Stopped'
+    FINISHED = 'Finished'
+
+
+s3 = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+dynamodb = boto3.resource('dynamodb')
+log_table = dynamodb.Table(os.environ['LOG_TABLE_NAME'])
+task_table = dynamodb.Table(os.environ['TASK_TABLE_NAME'])
+bucket_name = os.environ['BUCKET_NAME']
+log_table_buckets = int(os.environ.get('LOG_TABLE_BUCKETS', '1'))
+# Buckets exported concurrently, each one into its own files.
+corpus_concurrency = int(os.environ.get('CORPUS_CONCURRENCY', '4'))
+# Rows buffered per status before they are written as a row group.
+corpus_row_group_size = int(os.environ.get('CORPUS_ROW_GROUP_SIZE', '20000'))
+# Stop exporting and invoke the function again when less time than this is left.
+corpus_time_margin_ms = int(os.environ.get('CORPUS_TIME_MARGIN_MS', '120000'))
+# The export fails instead of invoking the function again once it has been continued this many times.
+corpus_max_invocations = int(os.environ.get('CORPUS_MAX_INVOCATIONS', '100'))
+
+# The dataset is partitioned by task and status, one file per bucket, status and invocation that exported the bucket.
+CORPUS_PREFIX = 'corpus/task_id={}/'
+CORPUS_KEY = 'corpus/task_id={}/status={}/bucket-{:03d}-{:05d}.parquet'
+# Items the validator has not updated have no status.
+PENDING_STATUS = 'Pending'
+
+CORPUS_SCHEMA = pa.schema([
+    ('query_hash', pa.string()),
+    ('query', pa.string()),
+    ('message', pa.string()),
+    ('error_class', pa.string()),
+    ('rule_ids', pa.list_(pa.string())),
+    ('risk_ids', pa.list_(pa.string())),
+    ('target_status', pa.map_(pa.string(), pa.string())),
+    ('src', pa.string()),
+    ('src_port', pa.int32()),
+    ('seen_count', pa.int64()),
+])
+
+
+def get_query(item):
+    # Long queries are stored zlib compressed in the binary query_z attribute.
+    if 'query_z' in item:
+        return zlib.decompress(item['query_z'].value).decode()
+    return item['query']
+
+
+def build_corpus_row(item):
+    return {
+        'query_hash': item['query_hash'].value.hex(),
+        'query': get_query(item),
+        'message': item.get('message'),
+        'error_class': item.get('error_class'),
+        'rule_ids': list(item.get('rule_ids', [])),
+        'risk_ids': list(item.get('risk_ids', [])),
+        'target_status': [(name, result['status']) for name, result in item.get('target_results', {}).items()],
+        'src': item.get('src'),
+        'src_port': int(item['src_port']) if 'src_port' in item else None,
+        # The number of times the query was captured, items inserted before it was counted were seen at least once.
+        'seen_count': int(item.get('seen_count', 1)),
+    }
+
+
+def export_bucket(task_id, bucket, cursor, context):
+    """
+        Exports the log items of a task bucket from its cursor into one Parquet file per status.
+
+        The rows are written in row groups to local files. When the bucket is complete or the function runs out of
+        time, the files are uploaded as the next part of the bucket and the cursor moves past the rows they hold, so
+        the next invocation continues the bucket instead of exporting it again.
+
+        Args:
+            task_id (str): The ID of the task.
+            bucket (int): The bucket of the task to export.
+            cursor (dict): The last key read in the bucket and the number of the next part.
+            context: The Lambda context.
+
+        Returns:
+            tuple: The number of exported rows, and the cursor to continue from, None when the bucket is complete.
+    """
+
+    writers = {}
+    buffers = {}
+    rows = 0
+    part = int(cursor['part'])
+    last_key = cursor['last_key']
+    query_kwargs = {
+        'KeyConditionExpression': Key('task_bucket').eq('{}#{}'.format(task_id, bucket)),
+        'ProjectionExpression': 'query_hash, #query, query_z, #stat, message, error_class, rule_ids, risk_ids, '
+                                'target_results, src, src_port, seen_count',
+        'ExpressionAttributeNames': {'#query': 'query', '#stat': 'status'},
+    }
+
+    def write_rows(status):
+        if status not in writers:
+            path = '/tmp/corpus-{:03d}-{}.parquet'.format(bucket, status)
+            writers[status] = (pq.ParquetWriter(path, CORPUS_SCHEMA, compression='zstd'), path)
+        writers[status][0].write_table(pa.Table.from_pylist(buffers[status], schema=CORPUS_SCHEMA))
+        buffers[status] = []
+
+    try:
+        while True:
+            if context.get_remaining_time_in_millis() < corpus_time_margin_ms:
+                break
+            if last_key:
+                query_kwargs['ExclusiveStartKey'] = last_key
+            response = log_table.query(**query_kwargs)
+            for item in response['Items']:
+                status = item.get('status', PENDING_STATUS)
+                buffers.setdefault(status, []).append(build_corpus_row(item))
+                if len(buffers[status]) >= corpus_row_group_size:
+                    write_rows(status)
+                rows += 1
+
+            last_key = response.get('LastEvaluatedKey')
+            if last_key is None:
+                break
+
+        for status in list(buffers):
+            if buffers[status]:
+                write_rows(status)
+        for status, (writer, path) in writers.items():
+            writer.close()
+            s3.upload_file(path, bucket_name, CORPUS_KEY.format(task_id, status, bucket, part))
+    finally:
+        for writer, path in writers.values():
+            writer.close()
+            os.remove(path)
+
+    if last_key is None:
+        return rows, None
+    return rows, {'last_key': last_key, 'part': part + 1 if writers else part}
+
+
+def list_corpus(task_id):
+    keys = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=CORPUS_PREFIX.format(task_id)):
+        keys.extend(content['Key'] for content in page.get('Contents', []))
+    return keys
+
+
+def delete_objects(keys):
+    for start in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=bucket_name,
+                          Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True})
+
+
+def delete_corpus(task_id):
+    # The files of an earlier export, e.g. before a recheck, may be in other status partitions.
+    delete_objects(list_corpus(task_id))
+
+
+def delete_uncommitted_parts(task_id, cursors):
+    """
+        Deletes the files an invocation uploaded before it stopped without storing the checkpoint, their rows are
+        exported again from the cursor of the bucket.
+
+        Args:
+            task_id (str): The ID of the task.
+            cursors (dict): The cursor of each remaining bucket.
+
+        Returns:
+            None
+    """
+
+    keys = []
+    for key in list_corpus(task_id):
+        # bucket-<bucket>-<part>.parquet
+        bucket, part = key.rsplit('/', 1)[1].split('.')[0].split('-')[1:]
+        cursor = cursors.get(str(int(bucket)))
+        if cursor is not None and int(part) >= int(cursor['part']):
+            keys.append(key)
+    delete_objects(keys)
+
+
+def start_corpus_export(task_id):
+    """
+        Claims the corpus export of a task, the cursors of the buckets that remain to be exported are its checkpoint.
+
+        Args:
+            task_id (str): The ID of the task.
+
+        Returns:
+            dict: The export checkpoint, or None when the corpus of the task is already exported or being exported.
+    """
+
+    cursors = {str(bucket): {'last_key': {}, 'part': 0} for bucket in range(log_table_buckets)}
+    export = {'cursors': cursors, 'rows': 0, 'invocations': 0}
+    try:
+        task_table.update_item(
+            Key={'task_id': task_id},
+            UpdateExpression="set corpus_export = :export",
+            ConditionExpression="attribute_not_exists(corpus_export) AND attribute_not_exists(corpus_s3_uri)",
+            ExpressionAttributeValues={':export': export}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return None
+    delete_corpus(task_id)
+    return export
+
+
+def export_corpus(task_id, export, context):
+    """
+        Exports the remaining buckets of a task from their cursors, concurrently.
+
+        Args:
+            task_id (str): The ID of the task.
+            export (dict): The export checkpoint with the cursors of the remaining buckets, the rows exported so far
+                           and the number of invocations.
+            context: The Lambda context.
+
+        Returns:
+            tuple: True when the corpus is complete, False when the export continues in another invocation or has
+                   failed, and the number of rows exported so far.
+    """
+
+    cursors = dict(export['cursors'])
+    rows = int(export['rows'])
+    delete_uncommitted_parts(task_id, cursors)
+
+    with ThreadPoolExecutor(max_workers=corpus_concurrency) as executor:
+        results = list(executor.map(lambda bucket: export_bucket(task_id, int(bucket), cursors[bucket], context),
+                                    list(cursors)))
+
+    for bucket, (bucket_rows, cursor) in zip(list(cursors), results):
+        rows += bucket_rows
+        if cursor is None:
+            del cursors[bucket]
+        else:
+            cursors[bucket] = cursor
+    if not cursors:
+        return True, rows
+
+    invocations = int(export.get('invocations', 0)) + 1
+    if invocations > corpus_max_invocations:
+        fail_corpus_export(task_id, rows)
+        return False, rows
+
+    task_table.update_item(
+        Key={'task_id': task_id},
+        UpdateExpression="set corpus_export = :export",
+        ConditionExpression="attribute_exists(corpus_export)",
+        ExpressionAttributeValues={':export': {'cursors': cursors, 'rows': rows, 'invocations': invocations}}
+    )
+    continue_corpus_export(task_id)
+    return False, rows
+
+
+def fail_corpus_export(task_id, rows):
+    # The corpus export stops instead of invoking the function forever, a recheck of the task exports it again.
+    message = 'The corpus export stopped after it was continued {} times, {} rows were exported'.format(
+        corpus_max_invocations, rows)
+    logger.error(message + ", task " + task_id)
+    task_table.update_item(
+        Key={'task_id': task_id},
+        UpdateExpression="set corpus_export_error = :m REMOVE corpus_export",
+        ConditionExpression="attribute_exists(corpus_export)",
+        ExpressionAttributeValues={':m': message}
+    )
+    delete_corpus(task_id)
+
+
+def continue_corpus_export(task_id):
+    # The export runs in asynchronous invocations, a failed one is retried by Lambda from the checkpoint.
+    lambda_client.invoke(
+        FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+        InvocationType='Event',
+        Payload=json.dumps({'action': 'export', 'task_id': task_id})
+    )
+
+
+def lambda_handler(event, context):
+
+    if event.get('action') == 'export':
+        # A previous invocation ran out of time, continue from the export checkpoint.
+        task_id = event['task_id']
+        export = task_table.get_item(Key={'task_id': task_id}).get('Item', {}).get('corpus_export')
+        if export is None:
+            return
+    else:
+        task_item = event['Records'][0]['dynamodb']['NewImage']
+        task_id = task_item['task_id']['S']
+        status = task_item['status']['S']
+
+        # Only process STOPPED or FINISHED event, the corpus is exported once per status change.
+        if status != Task.STOPPED.value and status != Task.FINISHED.value:
+            return
+        if 'corpus_s3_uri' in task_item or 'corpus_export' in task_item or 'corpus_export_error' in task_item:
+            return
+
+        if start_corpus_export(task_id) is not None:
+            continue_corpus_export(task_id)
+        return
+
+    complete, rows = export_corpus(task_id, export, context)
+    if not complete:
+        return
+
+    corpus_s3_uri = 's3://{}/{}'.format(bucket_name, CORPUS_PREFIX.format(task_id))
+    task_table.update_item(
+        Key={'task_id': task_id},
+        UpdateExpression="set corpus_s3_uri = :uri, corpus_rows = :rows REMOVE corpus_export",
+        ExpressionAttributeValues={':uri': corpus_s3_uri, ':rows': rows}
+    )
+    logger.info("Exported " + str(rows) + " queries of task " + task_id + " to " + corpus_s3_uri)
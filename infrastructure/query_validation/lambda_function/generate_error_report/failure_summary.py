@@ -0,0 +1,99 @@
+import re
+import hashlib
+
+# Literals are replaced by ? so that the variants of a statement, e.g. generated by an ORM, share one template.
+TEMPLATE_PATTERNS = [
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), '?'),
+    (re.compile(r'"(?:[^"\\]|\\.|"")*"'), '?'),
+    (re.compile(r'\b0x[0-9a-f]+\b'), '?'),
+    (re.compile(r'(?<![\w`.$])[-+]?\d+(?:\.\d+)?(?:e[-+]?\d+)?\b'), '?'),
+    # IN lists and multi-row VALUES of any length.
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?+)'),
+    (re.compile(r'\(\?\+\)(?:\s*,\s*\(\?\+\))+'), '(?+)'),
+    (re.compile(r'\s+'), ' '),
+]
+# The templates of the failures are kept up to this number of groups, other templates are counted together.
+MAX_GROUPS = 2000
+MAX_TEXT_LENGTH = 1000
+OTHER_TEMPLATES = '(other templates)'
+
+
+def normalize_template(query: str):
+    """
+        Normalizes a query into a template without literals, in lower case and with single spaces.
+
+        Args:
+            query (str): The query.
+
+        Returns:
+            str: The template.
+    """
+
+    template = query.lower()
+    for pattern, replacement in TEMPLATE_PATTERNS:
+        template = pattern.sub(replacement, template)
+    return template.strip()
+
+
+class FailureSummary:
+    """
+        Groups failed queries by error class, rule ids and query template, with the number of queries and an example.
+
+        Only a hash of the template is the key of a group, so the summary is built in one pass over the failures. The
+        number of groups is bounded, once MAX_GROUPS is reached the queries of new templates are counted in one group
+        per error class and rule ids.
+    """
+
+    def __init__(self):
+        self.groups = {}
+
+    def add_group(self, key, count: int, template: str, example_query: str, example_message: str):
+        if key not in self.groups and len(self.groups) >= MAX_GROUPS:
+            key = key[:2] + ('',)
+            template = OTHER_TEMPLATES
+        group = self.groups.get(key)
+        if group is None:
+            self.groups[key] = [count, template, example_query, example_message]
+        else:
+            group[0] += count
+
+    def add(self, error_class: str, rule_ids: list, query: str, message: str):
+        """
+            Adds a failed query to the group of its template.
+
+            Args:
+                error_class (str): The error class of the query.
+                rule_ids (list): The compatibility rule ids the query failed.
+                query (str): The query.
+                message (str): The error message of the query.
+
+            Returns:
+                None
+        """
+
+        template = normalize_template(query)
+        template_hash = hashlib.md5(template.encode()).hexdigest()[:16]
+        self.add_group((error_class, ';'.join(sorted(rule_ids)), template_hash), 1, template[:MAX_TEXT_LENGTH],
+                       query[:MAX_TEXT_LENGTH], message[:MAX_TEXT_LENGTH])
+
+    def merge(self, other):
+        for key, (count, template, example_query, example_message) in other.groups.items():
+            self.add_group(key, count, template, example_query, example_message)
+
+    def rows(self):
+        """
+            Returns the groups, the error classes with most failed queries first and their templates by count.
+
+            Returns:
+                list: The rows error_class, rule_ids, class_failed_queries, template_hash, failed_queries, template,
+                      example_query, example_message.
+        """
+
+        class_counts = {}
+        for (error_class, rule_ids, _), group in self.groups.items():
+            class_counts[(error_class, rule_ids)] = class_counts.get((error_class, rule_ids), 0) + group[0]
+
+        rows = [[error_class, rule_ids, class_counts[(error_class, rule_ids)], template_hash] + group
+                for (error_class, rule_ids, template_hash), group in self.groups.items()]
+        rows.sort(key=lambda row: (-row[2], row[0], row[1], -row[4]))
+        return rows
@@ -1,7 +1,16 @@
 import boto3
 import os
+import io
 import csv
+import gzip
+import heapq
+import json
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from botocore.exceptions import ClientError
+from failure_summary import FailureSummary
 
 
 class Task(Enum):
@@ -13,82 +22,700 @@ class Task(Enum):
 
 
 s3 = boto3.client('s3')
+lambda_client = boto3.client('lambda')
 dynamodb = boto3.resource('dynamodb')
 log_table = dynamodb.Table(os.environ['LOG_TABLE_NAME'])
 task_table = dynamodb.Table(os.environ['TASK_TABLE_NAME'])
 bucket_name = os.environ['BUCKET_NAME']
+log_table_buckets = int(os.environ.get('LOG_TABLE_BUCKETS', '1'))
+# One status column per validation target is appended to each row.
+validation_targets = [name for name in os.environ.get('VALIDATION_TARGETS', '').split(',') if name]
+log_table_risk_index = os.environ.get('LOG_TABLE_RISK_INDEX')
+log_table_failed_index = os.environ.get('LOG_TABLE_FAILED_INDEX')
+# Compressed bytes buffered before a part is uploaded, S3 requires at least 5 MB for all parts but the last.
+report_part_size = int(os.environ.get('REPORT_PART_SIZE_MB', '8')) * 1024 * 1024
+MIN_PART_SIZE = 5 * 1024 * 1024
+# Stop exporting and invoke the function again when less time than this is left.
+report_time_margin_ms = int(os.environ.get('REPORT_TIME_MARGIN_MS', '60000'))
+# The export fails instead of invoking the function again once it has been continued this many times.
+report_max_invocations = int(os.environ.get('REPORT_MAX_INVOCATIONS', '100'))
+# The rows compressed after the last part, staged when an invocation runs out of time before they fill a part.
+# "<rows>" is the number of rows exported up to the end of the tail.
+REPORT_TAIL_PREFIX = 'failed_reports/id={}/export_tail/'
+REPORT_TAIL_KEY = 'failed_reports/id={}/export_tail/rows-{}.csv.gz'
+task_table_index = os.environ.get('TASK_TABLE_INDEX')
+# The performance risk report keeps the queries with the highest risk scores, only this many rows are held in memory
+# per bucket while the risk index is read.
+risk_report_max_rows = int(os.environ.get('RISK_REPORT_MAX_ROWS', '10000'))
+# The validator appends the failed queries to segments partitioned by hour, "<epoch ms>-<uuid>-<rows>.csv.gz".
+SEGMENT_PREFIX = 'failed_reports/id={}/segments/'
+# A closed hour is compacted into one object, "hour=<YYYYMMDDHH>-<rows>.csv.gz".
+COMPACTED_PREFIX = 'failed_reports/id={}/compacted/'
+COMPACTED_KEY = 'failed_reports/id={}/compacted/hour={}-{}.csv.gz'
+PARTIAL_REPORT_KEY = 'failed_reports/id={}/partial_failed_queries.csv.gz'
+# An hour is closed when no validator invocation can still write a segment into it.
+SEGMENT_HOUR_GRACE_SECONDS = 300
+# Segments read concurrently while they are concatenated.
+SEGMENT_READ_CONCURRENCY = 16
 
 
-def update_task_db(task_id, report_s3_key):
+def update_task_db(task_id, report_s3_key, risk_report_s3_key, summary_report_s3_key):
     task_table.update_item(
         Key={'task_id': task_id},
-        UpdateExpression="set report_s3_key = :r, report_s3_bucket = :b",
+        UpdateExpression="set report_s3_key = :r, report_s3_bucket = :b, risk_report_s3_key = :p, "
+                         "summary_report_s3_key = :s REMOVE report_export",
         ExpressionAttributeValues={
             ':r': report_s3_key,
-            ':b': bucket_name
+            ':b': bucket_name,
+            ':p': risk_report_s3_key,
+            ':s': summary_report_s3_key
         }
     )
 
 
-def get_failed_items(task_id):
-    csv_items = []
+def start_report_export(task_id):
+    """
+        Starts the multipart upload of the failed query report and stores it as the export checkpoint of the task.
+
+        Args:
+            task_id (str): The ID of the task.
+
+        Returns:
+            dict: The export checkpoint, or None when the report of the task is already exported or being exported.
+    """
+
+    report_key = 'failed_reports/id={}/failed_queries.csv.gz'.format(task_id)
+    upload = s3.create_multipart_upload(Bucket=bucket_name, Key=report_key, ContentType='application/gzip')
+    # The last key read in each bucket, the buckets that are complete are removed.
+    cursors = {str(bucket): {} for bucket in range(log_table_buckets)}
+    export = {'upload_id': upload['UploadId'], 'key': report_key, 'cursors': cursors, 'rows': 0, 'parts': [],
+              'tail': None, 'invocations': 0}
+    try:
+        task_table.update_item(
+            Key={'task_id': task_id},
+            UpdateExpression="set report_export = :export",
+            ConditionExpression="attribute_not_exists(report_export) AND attribute_not_exists(report_s3_key)",
+            ExpressionAttributeValues={':export': export}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        s3.abort_multipart_upload(Bucket=bucket_name, Key=report_key, UploadId=upload['UploadId'])
+        return None
+    return export
+
+
+def save_report_export(task_id, export):
+    """
+        Stores the export checkpoint after a part or the tail is uploaded.
+
+        Args:
+            task_id (str): The ID of the task.
+            export (dict): The export checkpoint.
+
+        Returns:
+            bool: False when another invocation has replaced the export of the task.
+    """
+
+    try:
+        task_table.update_item(
+            Key={'task_id': task_id},
+            UpdateExpression="set report_export = :export",
+            ConditionExpression="report_export.upload_id = :upload_id",
+            ExpressionAttributeValues={':export': export, ':upload_id': export['upload_id']}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+    return True
+
+
+def continue_report_export(task_id, export):
+    """
+        Invokes the function again to continue the export from its checkpoint, or fails the export when it has been
+        continued too many times.
+
+        Args:
+            task_id (str): The ID of the task.
+            export (dict): The export checkpoint, its invocations are counted.
+
+        Returns:
+            bool: True when the checkpoint is stored and the function is invoked.
+    """
 
-    response = log_table.query(
-        KeyConditionExpression=boto3.dynamodb.conditions.Key('task_id').eq(task_id),
-        FilterExpression=boto3.dynamodb.conditions.Attr('status').eq('Failed'),
-        ProjectionExpression='task_id, #query, src, src_port, message',
-        ExpressionAttributeNames={
+    export['invocations'] = int(export.get('invocations', 0)) + 1
+    if export['invocations'] > report_max_invocations:
+        fail_report_export(task_id, export)
+        return False
+    if not save_report_export(task_id, export):
+        return False
+    # The export goes on in a new invocation, it reads the checkpoint from the task item.
+    lambda_client.invoke(
+        FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+        InvocationType='Event',
+        Payload=json.dumps({'action': 'export', 'task_id': task_id})
+    )
+    return True
+
+
+def fail_report_export(task_id, export):
+    # The report export stops instead of invoking the function forever, a recheck of the task exports it again.
+    message = 'The report export stopped after it was continued {} times, {} rows were exported'.format(
+        report_max_invocations, export['rows'])
+    print(message + ", task " + task_id)
+    try:
+        task_table.update_item(
+            Key={'task_id': task_id},
+            UpdateExpression="set report_export_error = :m REMOVE report_export",
+            ConditionExpression="report_export.upload_id = :upload_id",
+            ExpressionAttributeValues={':m': message, ':upload_id': export['upload_id']}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return
+    s3.abort_multipart_upload(Bucket=bucket_name, Key=export['key'], UploadId=export['upload_id'])
+    for key in list_report_objects(REPORT_TAIL_PREFIX.format(task_id)):
+        s3.delete_object(Bucket=bucket_name, Key=key)
+
+
+def get_query(item):
+    # Long queries are stored zlib compressed in the binary query_z attribute.
+    if 'query_z' in item:
+        return zlib.decompress(item['query_z'].value).decode()
+    return item['query']
+
+
+def get_failed_rows(task_id, bucket, last_key=None):
+    """
+        Reads one page of the failed index of a task bucket, only the failed log items are read.
+
+        Args:
+            task_id (str): The ID of the task.
+            bucket (int): The bucket of the task to read.
+            last_key (dict): The LastEvaluatedKey of the previous page, or None for the first page.
+
+        Returns:
+            tuple: The report rows of the page and the key of the next page, None when the bucket is complete.
+    """
+
+    csv_items = []
+    query_kwargs = {
+        'IndexName': log_table_failed_index,
+        'KeyConditionExpression': boto3.dynamodb.conditions.Key('failed_bucket').eq('{}#{}'.format(task_id, bucket)),
+        'ProjectionExpression': 'task_id, #query, query_z, src, src_port, message, #stat, target_results',
+        'ExpressionAttributeNames': {
             '#query': 'query',
+            '#stat': 'status',
         },
-    )
+    }
+    if last_key:
+        query_kwargs['ExclusiveStartKey'] = last_key
 
-    items = response['Items']
-    for item in items:
-        csv_item = [task_id, item['query'].replace("\"", ""), item['src'],
+    response = log_table.query(**query_kwargs)
+    for item in response['Items']:
+        csv_item = [task_id, get_query(item).replace("\"", ""), item['src'],
                     item['src_port'], item['message'].replace("\"", "")]
+        # Items validated before the targets were introduced only have the overall status.
+        target_results = item.get('target_results', {})
+        for target_name in validation_targets:
+            csv_item.append(target_results.get(target_name, {}).get('status', item['status']))
         csv_items.append(csv_item)
 
-    while 'LastEvaluatedKey' in response:
-        response = log_table.query(
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('task_id').eq(task_id),
-            FilterExpression=boto3.dynamodb.conditions.Attr('status').eq('Failed'),
-            ProjectionExpression='task_id, #query, src, src_port, message',
-            ExpressionAttributeNames={
-                '#query': 'query',
-            },
-            ExclusiveStartKey=response['LastEvaluatedKey']
-        )
-        items = response['Items']
-        for item in items:
-            csv_item = [task_id, item['query'].replace("\"", ""), item['src'],
-                        item['src_port'], item['message'].replace("\"", "")]
-            csv_items.append(csv_item)
+    return csv_items, response.get('LastEvaluatedKey')
+
+
+def upload_report_part(export, buffer):
+    part_number = len(export['parts']) + 1
+    response = s3.upload_part(Bucket=bucket_name, Key=export['key'], UploadId=export['upload_id'],
+                              PartNumber=part_number, Body=buffer.getvalue())
+    export['parts'].append({'PartNumber': part_number, 'ETag': response['ETag']})
+
+
+def export_failed_items(task_id, export, context):
+    """
+        Streams the failed log items of a task into the multipart upload of the report.
+
+        The next page of every bucket is read in parallel. Every part is one or more complete gzip members, the
+        concatenated members are a valid gzip file. The checkpoint is stored after each part. An invocation that runs
+        out of time before the rows compressed since the last part fill a part stages them as the tail object and
+        checkpoints the cursors, the next invocation starts its first part with the tail. Only a part and a page of
+        rows per bucket are held in memory.
+
+        Args:
+            task_id (str): The ID of the task.
+            export (dict): The export checkpoint of the task.
+            context: The Lambda context.
+
+        Returns:
+            bool: True when the report is uploaded, False when the export continues in another invocation.
+    """
+
+    cursors = dict(export['cursors'])
+    rows = int(export['rows'])
+    export['parts'] = [{'PartNumber': int(part['PartNumber']), 'ETag': part['ETag']} for part in export['parts']]
+
+    # The tail an earlier invocation staged, it is deleted once its rows are in a part or in a newer tail.
+    staged_tail = export.get('tail')
+    buffer = io.BytesIO()
+    if staged_tail:
+        # The rows an earlier invocation compressed after the last part, the tail is a complete gzip member.
+        buffer.write(s3.get_object(Bucket=bucket_name, Key=staged_tail)['Body'].read())
+    gzip_file = gzip.GzipFile(fileobj=buffer, mode='wb')
+    with ThreadPoolExecutor(max_workers=log_table_buckets) as executor:
+        while cursors:
+            out_of_time = context.get_remaining_time_in_millis() < report_time_margin_ms
+            if buffer.tell() >= report_part_size or (out_of_time and buffer.tell() >= MIN_PART_SIZE):
+                gzip_file.close()
+                upload_report_part(export, buffer)
+                export.update({'cursors': dict(cursors), 'rows': rows, 'tail': None})
+                if not save_report_export(task_id, export):
+                    return False
+                if staged_tail:
+                    s3.delete_object(Bucket=bucket_name, Key=staged_tail)
+                    staged_tail = None
+                buffer = io.BytesIO()
+                gzip_file = gzip.GzipFile(fileobj=buffer, mode='wb')
+
+            if out_of_time:
+                if rows > int(export['rows']):
+                    # Too small for a part, the rows are kept as the tail instead of being read again.
+                    gzip_file.close()
+                    tail_key = REPORT_TAIL_KEY.format(task_id, rows)
+                    s3.put_object(Bucket=bucket_name, Key=tail_key, Body=buffer.getvalue())
+                    export.update({'cursors': dict(cursors), 'rows': rows, 'tail': tail_key})
+                if continue_report_export(task_id, export) and staged_tail and staged_tail != export['tail']:
+                    s3.delete_object(Bucket=bucket_name, Key=staged_tail)
+                return False
+
+            futures = {bucket: executor.submit(get_failed_rows, task_id, int(bucket), last_key or None)
+                       for bucket, last_key in cursors.items()}
+            page = io.StringIO()
+            writer = csv.writer(page, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            for bucket, future in futures.items():
+                csv_items, last_key = future.result()
+                writer.writerows(csv_items)
+                rows += len(csv_items)
+                if last_key is None:
+                    del cursors[bucket]
+                else:
+                    cursors[bucket] = last_key
+            gzip_file.write(page.getvalue().encode())
+
+    # The last part may be smaller than the part size, an empty report is an empty gzip member.
+    gzip_file.close()
+    upload_report_part(export, buffer)
+    s3.complete_multipart_upload(Bucket=bucket_name, Key=export['key'], UploadId=export['upload_id'],
+                                 MultipartUpload={'Parts': export['parts']})
+    if staged_tail:
+        s3.delete_object(Bucket=bucket_name, Key=staged_tail)
+    print("Exported " + str(rows) + " failed queries of task " + task_id)
+    return True
+
+
+def iter_risk_items_in_bucket(task_id, bucket):
+    query_kwargs = {
+        'IndexName': log_table_risk_index,
+        'KeyConditionExpression': boto3.dynamodb.conditions.Key('risk_bucket').eq('{}#{}'.format(task_id, bucket)),
+    }
+
+    while True:
+        response = log_table.query(**query_kwargs)
+        for item in response['Items']:
+            seen_count = int(item.get('seen_count', 1))
+            risk_weight = int(item.get('risk_weight', 1))
+            # The risk of a query is weighted by how often it was captured.
+            yield [seen_count * risk_weight, seen_count, ';'.join(item['risk_ids']),
+                   item['risk_message'].replace("\"", ""), get_query(item).replace("\"", ""),
+                   item['src'], item['src_port']]
+
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def get_top_risk_items_in_bucket(task_id, bucket):
+    """
+        Reads the risk index of a task bucket page by page and keeps the risk items with the highest scores.
+
+        Args:
+            task_id (str): The ID of the task.
+            bucket (int): The bucket of the task to read.
+
+        Returns:
+            tuple: At most risk_report_max_rows risk items, and the number of risk items in the bucket.
+    """
+
+    # A min-heap of (score, -order, risk item), the earlier item wins a tie and the items are never compared.
+    top = []
+    count = 0
+    for risk_item in iter_risk_items_in_bucket(task_id, bucket):
+        entry = (risk_item[0], -count, risk_item)
+        count += 1
+        if len(top) < risk_report_max_rows:
+            heapq.heappush(top, entry)
+        elif entry > top[0]:
+            heapq.heapreplace(top, entry)
+    return [entry[2] for entry in top], count
+
+
+def get_ranked_risk_items(task_id):
+    """
+        Ranks the risk items of a task by score, only the risk_report_max_rows highest are returned.
+
+        Args:
+            task_id (str): The ID of the task.
+
+        Returns:
+            tuple: The ranked risk items, and the number of risk items of the task.
+    """
+
+    risk_items = []
+    count = 0
+
+    with ThreadPoolExecutor(max_workers=log_table_buckets) as executor:
+        futures = [executor.submit(get_top_risk_items_in_bucket, task_id, bucket)
+                   for bucket in range(log_table_buckets)]
+        for future in futures:
+            bucket_risk_items, bucket_count = future.result()
+            risk_items.extend(bucket_risk_items)
+            count += bucket_count
+
+    risk_items = heapq.nlargest(risk_report_max_rows, risk_items, key=lambda risk_item: risk_item[0])
+    return [[rank] + risk_item for rank, risk_item in enumerate(risk_items, start=1)], count
+
+
+def get_failure_summary_in_bucket(task_id, bucket):
+    summary = FailureSummary()
+    query_kwargs = {
+        'IndexName': log_table_failed_index,
+        'KeyConditionExpression': boto3.dynamodb.conditions.Key('failed_bucket').eq('{}#{}'.format(task_id, bucket)),
+        'ProjectionExpression': '#query, query_z, message, error_class, rule_ids',
+        'ExpressionAttributeNames': {'#query': 'query'},
+    }
+
+    while True:
+        response = log_table.query(**query_kwargs)
+        for item in response['Items']:
+            summary.add(item.get('error_class', 'OTHER'), item.get('rule_ids', []), get_query(item), item['message'])
 
-    return csv_items
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    return summary
+
+
+def generate_failure_summary(task_id):
+    """
+        Writes the summary of the failed queries of a task, grouped by error class, rule ids and query template.
+
+        Every bucket is summarized in parallel from the failed index, only the groups are held in memory.
+
+        Args:
+            task_id (str): The ID of the task.
+
+        Returns:
+            str: The key of the summary report.
+    """
+
+    summary = FailureSummary()
+    with ThreadPoolExecutor(max_workers=log_table_buckets) as executor:
+        futures = [executor.submit(get_failure_summary_in_bucket, task_id, bucket)
+                   for bucket in range(log_table_buckets)]
+        for future in futures:
+            summary.merge(future.result())
+
+    summary_key = 'failed_reports/id={}/failure_summary.csv'.format(task_id)
+    with open('/tmp/failure_summary.csv', 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(['error_class', 'rule_ids', 'class_failed_queries', 'template_hash', 'failed_queries',
+                         'template', 'example_query', 'example_message'])
+        writer.writerows(summary.rows())
+
+    s3.upload_file('/tmp/failure_summary.csv', bucket_name, summary_key)
+    return summary_key
+
+
+def list_report_objects(prefix):
+    keys = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=prefix):
+        keys.extend(content['Key'] for content in page.get('Contents', []))
+    return keys
+
+
+def get_object_rows(key):
+    # The number of rows is the last part of the name of a segment or a compacted hour.
+    return int(key.rsplit('-', 1)[1].split('.')[0])
+
+
+def get_object_hour(key):
+    return key.split('hour=')[1][:10]
+
+
+def list_report_sources(task_id):
+    """
+        Lists the compacted hours and the segments of the hours that are not compacted yet.
+
+        Args:
+            task_id (str): The ID of the task.
+
+        Returns:
+            tuple: The key of each compacted hour by hour, and the segment keys of each other hour by hour.
+    """
+
+    compacted = {get_object_hour(key): key for key in list_report_objects(COMPACTED_PREFIX.format(task_id))}
+    segments = {}
+    for key in list_report_objects(SEGMENT_PREFIX.format(task_id)):
+        hour = get_object_hour(key)
+        if hour not in compacted:
+            segments.setdefault(hour, []).append(key)
+    return compacted, segments
+
+
+def read_object(key):
+    return s3.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+
+
+def concatenate_objects(keys, target_key, context=None):
+    """
+        Concatenates gzip objects into one gzip object with a multipart upload, only a part is held in memory.
+
+        Args:
+            keys (list): The keys of the objects to concatenate.
+            target_key (str): The key of the concatenated object.
+            context: The Lambda context, the upload is aborted when the function runs out of time.
+
+        Returns:
+            bool: True when the object is uploaded.
+    """
+
+    upload = s3.create_multipart_upload(Bucket=bucket_name, Key=target_key, ContentType='application/gzip')
+    export = {'upload_id': upload['UploadId'], 'key': target_key, 'parts': []}
+    buffer = io.BytesIO()
+    with ThreadPoolExecutor(max_workers=SEGMENT_READ_CONCURRENCY) as executor:
+        for start in range(0, len(keys), SEGMENT_READ_CONCURRENCY):
+            if context and context.get_remaining_time_in_millis() < report_time_margin_ms:
+                s3.abort_multipart_upload(Bucket=bucket_name, Key=target_key, UploadId=upload['UploadId'])
+                return False
+            for body in executor.map(read_object, keys[start:start + SEGMENT_READ_CONCURRENCY]):
+                buffer.write(body)
+            if buffer.tell() >= report_part_size:
+                upload_report_part(export, buffer)
+                buffer = io.BytesIO()
+
+    # The concatenation of no object is an empty gzip member.
+    if not export['parts'] and buffer.tell() == 0:
+        buffer.write(gzip.compress(b''))
+    if buffer.tell() > 0:
+        upload_report_part(export, buffer)
+    s3.complete_multipart_upload(Bucket=bucket_name, Key=target_key, UploadId=upload['UploadId'],
+                                 MultipartUpload={'Parts': export['parts']})
+    return True
+
+
+def compact_closed_hours(task_id, compacted, segments, context=None):
+    """
+        Concatenates the segments of every closed hour into one object, so they are read once.
+
+        Args:
+            task_id (str): The ID of the task.
+            compacted (dict): The key of each compacted hour by hour, the new compacted hours are added.
+            segments (dict): The segment keys of each hour that is not compacted, the compacted hours are removed.
+            context: The Lambda context.
+
+        Returns:
+            None
+    """
+
+    open_hour = time.strftime('%Y%m%d%H', time.gmtime(time.time() - SEGMENT_HOUR_GRACE_SECONDS))
+    for hour in sorted(segments):
+        if hour >= open_hour:
+            continue
+        rows = sum(get_object_rows(key) for key in segments[hour])
+        compacted_key = COMPACTED_KEY.format(task_id, hour, rows)
+        if not concatenate_objects(segments[hour], compacted_key, context):
+            return
+        compacted[hour] = compacted_key
+        del segments[hour]
+
+
+def get_report_keys(compacted, segments):
+    keys = [compacted[hour] for hour in sorted(compacted)]
+    for hour in sorted(segments):
+        keys.extend(sorted(segments[hour]))
+    return keys
+
+
+def build_report_from_segments(task_id, failed_count, context):
+    """
+        Builds the failed query report by concatenating the compacted hours and the segments of the task.
+
+        The segments hold the failed queries validated by the stream. If their rows do not add up to the failed_query
+        counter, e.g. because swept queries are not in the segments, None is returned and the report is exported
+        from the failed index.
+
+        Args:
+            task_id (str): The ID of the task.
+            failed_count (int): The failed_query counter of the task.
+            context: The Lambda context.
+
+        Returns:
+            str: The key of the report, or None.
+    """
+
+    compacted, segments = list_report_sources(task_id)
+    keys = get_report_keys(compacted, segments)
+    rows = sum(get_object_rows(key) for key in keys)
+    if rows != failed_count:
+        print("Report segments of task " + task_id + " have " + str(rows) + " rows, failed_query is " +
+              str(failed_count) + ", exporting the failed index")
+        return None
+
+    report_key = 'failed_reports/id={}/failed_queries.csv.gz'.format(task_id)
+    if not concatenate_objects(keys, report_key, context):
+        return None
+    print("Built the report of task " + task_id + " from " + str(len(keys)) + " segments")
+    return report_key
+
+
+def delete_report_sources(task_id):
+    # The segments are merged into the report, they are not needed anymore.
+    keys = list_report_objects(SEGMENT_PREFIX.format(task_id)) + list_report_objects(COMPACTED_PREFIX.format(task_id))
+    # A tail left behind by an invocation that stopped after it was staged.
+    keys.extend(list_report_objects(REPORT_TAIL_PREFIX.format(task_id)))
+    keys.append(PARTIAL_REPORT_KEY.format(task_id))
+    for start in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=bucket_name,
+                          Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True})
+
+
+def get_active_tasks():
+    task_ids = []
+    query_kwargs = {
+        'IndexName': task_table_index,
+        'KeyConditionExpression': boto3.dynamodb.conditions.Key('in_progress').eq(1),
+        'ProjectionExpression': 'task_id',
+    }
+    while True:
+        response = task_table.query(**query_kwargs)
+        task_ids.extend(item['task_id'] for item in response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return task_ids
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def generate_partial_reports(context):
+    """
+        Builds the partial report of every task that is capturing queries from the segments written so far.
+
+        Args:
+            context: The Lambda context.
+
+        Returns:
+            None
+    """
+
+    for task_id in get_active_tasks():
+        compacted, segments = list_report_sources(task_id)
+        compact_closed_hours(task_id, compacted, segments, context)
+        keys = get_report_keys(compacted, segments)
+        partial_key = PARTIAL_REPORT_KEY.format(task_id)
+        if not concatenate_objects(keys, partial_key, context):
+            return
+
+        try:
+            task_table.update_item(
+                Key={'task_id': task_id},
+                UpdateExpression="set partial_report_s3_key = :k, partial_report_rows = :r, partial_report_time = :t, "
+                                 "report_s3_bucket = :b",
+                ConditionExpression="attribute_not_exists(report_s3_key)",
+                ExpressionAttributeValues={
+                    ':k': partial_key,
+                    ':r': sum(get_object_rows(key) for key in keys),
+                    ':t': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    ':b': bucket_name
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+
+def generate_risk_report(task_id):
+    # Performance risks, ranked by their weight multiplied by the capture count of the query.
+    risk_items, count = get_ranked_risk_items(task_id=task_id)
+    if count > len(risk_items):
+        print("The risk report of task " + task_id + " has the " + str(len(risk_items)) + " highest of " +
+              str(count) + " risk items")
+    risk_items_key = 'failed_reports/id={}/performance_risks.csv'.format(task_id)
+
+    with open('/tmp/performance_risks.csv', 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(['rank', 'score', 'seen_count', 'risk_ids', 'risk_message', 'query', 'src', 'src_port'])
+        writer.writerows(risk_items)
+
+    s3.upload_file('/tmp/performance_risks.csv', bucket_name, risk_items_key)
+    return risk_items_key
 
 
 def lambda_handler(event, context):
-    
-    record = event['Records'][0]
 
-    task_item = record['dynamodb']['NewImage']
+    if event.get('action') == 'partial':
+        # Scheduled, the partial reports of the tasks that are capturing queries.
+        generate_partial_reports(context)
+        return
+
+    if event.get('action') == 'export':
+        # A previous invocation ran out of time, continue from the export checkpoint.
+        task_id = event['task_id']
+        task_item = task_table.get_item(Key={'task_id': task_id}).get('Item', {})
+        export = task_item.get('report_export')
+        if export is None:
+            return
+    else:
+        record = event['Records'][0]
+
+        task_item = record['dynamodb']['NewImage']
+
+        print(task_item)
+
+        task_id = task_item['task_id']['S']
+        status = task_item['status']['S']
 
-    print(task_item)
+        # Only process STOPPED or FINISHED event, the report is generated once per status change.
+        if status != Task.STOPPED.value and status != Task.FINISHED.value:
+            return
+        if 'report_s3_key' in task_item or 'report_export' in task_item or 'report_export_error' in task_item:
+            return
 
-    task_id = task_item['task_id']['S']
-    status = task_item['status']['S']
+        # The segments do not hold the results of a recheck.
+        if 'report_segments_stale' not in task_item:
+            report_key = build_report_from_segments(task_id, int(task_item.get('failed_query', {}).get('N', '-1')),
+                                                    context)
+            if report_key is not None:
+                risk_items_key = generate_risk_report(task_id)
+                summary_key = generate_failure_summary(task_id)
+                update_task_db(task_id=task_id, report_s3_key=report_key, risk_report_s3_key=risk_items_key,
+                               summary_report_s3_key=summary_key)
+                delete_report_sources(task_id)
+                return
 
-    # Only process STOPPED or FINISHED event
-    if status == Task.STOPPED.value or status == Task.FINISHED.value:
-        failed_items = get_failed_items(task_id=task_id)
+        export = start_report_export(task_id)
+        if export is None:
+            task_item = task_table.get_item(Key={'task_id': task_id}).get('Item', {})
+            # A retried stream record continues the export of the failed invocation.
+            export = task_item.get('report_export')
+            if export is None:
+                return
 
-        failed_items_key = 'failed_reports/id={}/failed_queries.csv'.format(task_id)
-        
-        # write item to csv file
-        with open('/tmp/failed_queries.csv', 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            writer.writerows(failed_items)
+    if not export_failed_items(task_id, export, context):
+        return
 
-        s3.upload_file('/tmp/failed_queries.csv', bucket_name, failed_items_key)
+    risk_items_key = generate_risk_report(task_id)
+    summary_key = generate_failure_summary(task_id)
 
-        update_task_db(task_id=task_id, report_s3_key=failed_items_key)
\ No newline at end of file
+    update_task_db(task_id=task_id, report_s3_key=export['key'], risk_report_s3_key=risk_items_key,
+                   summary_report_s3_key=summary_key)
+    delete_report_sources(task_id)
@@ -1,20 +1,24 @@
 from aws_cdk import (
     Duration,
+    Size,
     aws_lambda,
     aws_ec2 as ec2,
-    aws_rds as rds,
     aws_lambda_event_sources as sources,
     aws_iam as iam,
     aws_s3,
-    aws_dynamodb
+    aws_dynamodb,
+    aws_events as events,
+    aws_events_targets as targets
 )
 from constructs import Construct
+import json
 
 
 class LambdaFunction(Construct):
     def __init__(self, scope: Construct, construct_id: str, params: dict, vpc: ec2.Vpc, private_subnets,
-                 sg: ec2.SecurityGroup, aurora_proxy: rds.DatabaseProxy,
+                 sg: ec2.SecurityGroup, validation_targets: list,
                  s3_bucket: aws_s3.Bucket, log_table: aws_dynamodb.Table, task_table: aws_dynamodb.Table,
+                 result_cache_table: aws_dynamodb.Table,
                  ddb_task_table_source: sources.DynamoEventSource, 
                  ddb_log_table_source: sources.DynamoEventSource, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -23,6 +27,7 @@ class LambdaFunction(Construct):
         account = params['account']
         check_log_table_name = params['check_log_table_name']
         check_task_table_name = params['check_task_table_name']
+        validator_db_user = 'db_check_validator'
 
         # lambda layers
         validate_python_layer = aws_lambda.LayerVersion(
@@ -32,6 +37,36 @@ class LambdaFunction(Construct):
             layer_version_name="validation_python_layer_{}".format(params['env_name']),
             )
         
+        # The endpoints of every validation target, the first target is the primary one.
+        validation_targets_config = [{'name': name,
+                                      'engine_version': aurora.engine_version,
+                                      'proxy_endpoint': aurora.proxy.endpoint,
+                                      'proxy_read_only_endpoint': aurora.proxy_read_only_endpoint,
+                                      'writer_endpoint': aurora.cluster.cluster_endpoint.hostname,
+                                      'reader_endpoint': aurora.cluster.cluster_read_endpoint.hostname}
+                                     for name, aurora in validation_targets]
+        validator_db_user_arns = [f"arn:aws:rds-db:{region}:{account}:dbuser:{aurora.cluster.cluster_resource_identifier}/{validator_db_user}"
+                                  for _, aurora in validation_targets]
+
+        validate_environment = {'VALIDATION_TARGETS': json.dumps(validation_targets_config),
+                                'VALIDATOR_DB_USER': validator_db_user,
+                                'VALIDATE_POOL_SIZE': '8',
+                                'REGION': params['region'],
+                                'DDB_LOG_TABLE': check_log_table_name,
+                                'DDB_TASK_TABLE': check_task_table_name,
+                                'VALIDATE_BATCH_SIZE': '25',
+                                'VALIDATE_LATENCY_TARGET_MS': '1000',
+                                'BREAKER_FAILURE_THRESHOLD': '3',
+                                'BREAKER_COOLDOWN_SECONDS': '30',
+                                'LOG_UPDATE_CONCURRENCY': '16',
+                                'PREFILTER_ENABLED': str(params['validate_prefilter_enabled']).lower(),
+                                'PREFILTER_AUDIT_RATE': str(params['validate_prefilter_audit_rate']),
+                                'METRIC_NAMESPACE': params['metric_namespace'],
+                                'RESULT_CACHE_TABLE': result_cache_table.table_name,
+                                'RESULT_CACHE_TTL_DAYS': str(params['check_result_cache_ttl_days']),
+                                'RESULT_CACHE_LOCAL_SIZE': '20000',
+                                'REPORT_BUCKET': s3_bucket.bucket_name}
+
         # lambda function
         self.validate_query_function = aws_lambda.Function(
             self, "validate_query_function",
@@ -39,7 +74,7 @@ class LambdaFunction(Construct):
             handler="lambda_function.lambda_handler",
             runtime=aws_lambda.Runtime.PYTHON_3_12,
             timeout=Duration.seconds(60),
-            function_name='db-check-validate-query-{}'.format(params['env_name']),
+            function_name=params['validate_function_name'],
             layers=[validate_python_layer],
             allow_public_subnet=False,
             vpc=vpc,
@@ -53,18 +88,105 @@ class LambdaFunction(Construct):
                     actions=['dynamodb:GetItem', 'dynamodb:UpdateItem'],
                     resources=[f"arn:aws:dynamodb:{region}:{account}:table/{check_log_table_name}",
                                f"arn:aws:dynamodb:{region}:{account}:table/{check_task_table_name}"],
+                ),
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=['rds-db:connect'],
+                    resources=validator_db_user_arns,
                 )
             ],
-            environment={'PROXY_ENDPOINT': aurora_proxy.endpoint,
-                         'REGION': params['region'],
-                         'DDB_LOG_TABLE': check_log_table_name,
-                         'DDB_TASK_TABLE': check_task_table_name},
+            environment=validate_environment,
         )
-        aurora_proxy.grant_connect(grantee=self.validate_query_function)
+        for _, aurora in validation_targets:
+            aurora.proxy.grant_connect(grantee=self.validate_query_function)
+        result_cache_table.grant_read_write_data(self.validate_query_function)
+        s3_bucket.grant_put(self.validate_query_function, "failed_reports/*")
 
         # Add dynamodb event source as a trigger.
         self.validate_query_function.add_event_source(ddb_log_table_source)
 
+        # recheck lambda function, validates the stored queries of a task again with the current rules.
+        self.recheck_task_function = aws_lambda.Function(
+            self, "recheck_task_function",
+            code=aws_lambda.Code.from_asset("infrastructure/query_validation/lambda_function/validate_query"),
+            handler="recheck.lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_12,
+            timeout=Duration.seconds(300),
+            function_name='db-check-recheck-task-{}'.format(params['env_name']),
+            layers=[validate_python_layer],
+            allow_public_subnet=False,
+            vpc=vpc,
+            memory_size=1024,
+            security_groups=[sg],
+            vpc_subnets=ec2.SubnetSelection(
+                subnets=private_subnets
+            ),
+            initial_policy=[iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=['dynamodb:GetItem', 'dynamodb:UpdateItem', 'dynamodb:Query'],
+                    resources=[f"arn:aws:dynamodb:{region}:{account}:table/{check_log_table_name}",
+                               f"arn:aws:dynamodb:{region}:{account}:table/{check_task_table_name}"],
+                ),
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=['rds-db:connect'],
+                    resources=validator_db_user_arns,
+                )
+            ],
+            environment=validate_environment,
+        )
+        for _, aurora in validation_targets:
+            aurora.proxy.grant_connect(grantee=self.recheck_task_function)
+        result_cache_table.grant_read_write_data(self.recheck_task_function)
+
+        # sweeper lambda function, validates the log items the stream did not validate.
+        self.sweeper_function = aws_lambda.Function(
+            self, "sweeper_function",
+            code=aws_lambda.Code.from_asset("infrastructure/query_validation/lambda_function/validate_query"),
+            handler="sweeper.lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_12,
+            timeout=Duration.seconds(300),
+            function_name=params['sweeper_function_name'],
+            layers=[validate_python_layer],
+            allow_public_subnet=False,
+            vpc=vpc,
+            memory_size=1024,
+            security_groups=[sg],
+            vpc_subnets=ec2.SubnetSelection(
+                subnets=private_subnets
+            ),
+            initial_policy=[iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=['dynamodb:GetItem', 'dynamodb:UpdateItem', 'dynamodb:Query'],
+                    resources=[f"arn:aws:dynamodb:{region}:{account}:table/{check_log_table_name}",
+                               f"arn:aws:dynamodb:{region}:{account}:table/{check_log_table_name}/index/*",
+                               f"arn:aws:dynamodb:{region}:{account}:table/{check_task_table_name}",
+                               f"arn:aws:dynamodb:{region}:{account}:table/{check_task_table_name}/index/*"],
+                ),
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=['rds-db:connect'],
+                    resources=validator_db_user_arns,
+                )
+            ],
+            environment=validate_environment,
+        )
+        for _, aurora in validation_targets:
+            aurora.proxy.grant_connect(grantee=self.sweeper_function)
+        result_cache_table.grant_read_write_data(self.sweeper_function)
+        s3_bucket.grant_put(self.sweeper_function, "failed_reports/*")
+        self.sweeper_function.add_environment('DDB_LOG_TABLE_GSI', params['check_log_table_gsi_name'])
+        self.sweeper_function.add_environment('DDB_TASK_TABLE_GSI', params['check_task_table_gsi_name'])
+        self.sweeper_function.add_environment('LOG_TABLE_BUCKETS', str(params['check_log_table_bucket_count']))
+
+        # Sweep the active tasks periodically.
+        events.Rule(
+            self, "sweeper_schedule",
+            rule_name='db-check-sweeper-schedule-{}'.format(params['env_name']),
+            schedule=events.Schedule.rate(Duration.minutes(params['sweeper_schedule_minutes'])),
+            targets=[targets.LambdaFunction(self.sweeper_function)]
+        )
+
         # generate report lambda function
         generate_report_function_role = iam.Role(
             self,
@@ -77,13 +199,19 @@ class LambdaFunction(Construct):
         s3_bucket.grant_read_write(generate_report_function_role)
         log_table.grant_read_data(generate_report_function_role)
         task_table.grant_read_write_data(generate_report_function_role)
+        # The function invokes itself to continue a report export that did not complete in time.
+        generate_report_function_role.add_to_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=['lambda:InvokeFunction'],
+            resources=[f"arn:aws:lambda:{region}:{account}:function:db-check-generate-report-{params['env_name']}"],
+        ))
 
         self.generate_report_function = aws_lambda.Function(
             self, "generate_report_function",
             code=aws_lambda.Code.from_asset("infrastructure/query_validation/lambda_function/generate_error_report"),
             handler="lambda_function.lambda_handler",
             runtime=aws_lambda.Runtime.PYTHON_3_12,
-            timeout=Duration.seconds(120),
+            timeout=Duration.seconds(300),
             role=generate_report_function_role,
             function_name='db-check-generate-report-{}'.format(params['env_name'])
         )
@@ -93,7 +221,74 @@ class LambdaFunction(Construct):
         self.generate_report_function.add_environment('BUCKET_NAME', s3_bucket.bucket_name)
         self.generate_report_function.add_environment('LOG_TABLE_NAME', log_table.table_name)
         self.generate_report_function.add_environment('TASK_TABLE_NAME', task_table.table_name)
+        self.generate_report_function.add_environment('LOG_TABLE_BUCKETS', str(params['check_log_table_bucket_count']))
+        self.generate_report_function.add_environment('LOG_TABLE_RISK_INDEX', params['check_log_table_risk_gsi_name'])
+        self.generate_report_function.add_environment('LOG_TABLE_FAILED_INDEX', params['check_log_table_failed_gsi_name'])
+        self.generate_report_function.add_environment('VALIDATION_TARGETS',
+                                                      ','.join(name for name, _ in validation_targets))
+        self.generate_report_function.add_environment('TASK_TABLE_INDEX', params['check_task_table_gsi_name'])
+
+        # Build the partial reports of the tasks that are capturing queries periodically.
+        events.Rule(
+            self, "partial_report_schedule",
+            rule_name='db-check-partial-report-schedule-{}'.format(params['env_name']),
+            schedule=events.Schedule.rate(Duration.minutes(params['partial_report_schedule_minutes'])),
+            targets=[targets.LambdaFunction(self.generate_report_function,
+                                            event=events.RuleTargetInput.from_object({'action': 'partial'}))]
+        )
+
+        # export task corpus lambda function, writes all log items of a finished task as a Parquet dataset.
+        pyarrow_layer = aws_lambda.LayerVersion(
+            self, "pyarrow_layer",
+            code=aws_lambda.Code.from_asset("infrastructure/query_validation/lambda_function/lambda_layer_pyarrow"),
+            compatible_runtimes=[aws_lambda.Runtime.PYTHON_3_12],
+            layer_version_name="pyarrow_layer_{}".format(params['env_name']),
+            )
+
+        export_corpus_function_name = 'db-check-export-task-corpus-{}'.format(params['env_name'])
+        self.export_task_corpus_function = aws_lambda.Function(
+            self, "export_task_corpus_function",
+            code=aws_lambda.Code.from_asset("infrastructure/query_validation/lambda_function/export_task_corpus"),
+            handler="lambda_function.lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_12,
+            timeout=Duration.seconds(900),
+            memory_size=2048,
+            ephemeral_storage_size=Size.mebibytes(4096),
+            layers=[pyarrow_layer],
+            function_name=export_corpus_function_name,
+            initial_policy=[iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=['lambda:InvokeFunction'],
+                    resources=[f"arn:aws:lambda:{region}:{account}:function:{export_corpus_function_name}"],
+                )
+            ],
+            environment={'LOG_TABLE_NAME': log_table.table_name,
+                         'TASK_TABLE_NAME': task_table.table_name,
+                         'BUCKET_NAME': s3_bucket.bucket_name,
+                         'LOG_TABLE_BUCKETS': str(params['check_log_table_bucket_count'])}
+        )
+        s3_bucket.grant_read_write(self.export_task_corpus_function, "corpus/*")
+        log_table.grant_read_data(self.export_task_corpus_function)
+        task_table.grant_read_write_data(self.export_task_corpus_function)
+
+        # Exported once per task when the task is stopped or finished, like the report.
+        self.export_task_corpus_function.add_event_source(sources.DynamoEventSource(
+            task_table,
+            retry_attempts=1,
+            batch_size=1,
+            starting_position=aws_lambda.StartingPosition.LATEST,
+            filters=[aws_lambda.FilterCriteria.filter(
+                {
+                    "dynamodb": {"NewImage": {"status": {"S": ["Stopped", "Finished"]}}},
+                    "eventName": aws_lambda.FilterRule.is_equal("MODIFY")
+                }
+            )]
+        ))
 
     @property
     def validate_function(self):
         return self.validate_query_function
+
+    @property
+    def recheck_function(self):
+        return self.recheck_task_function
@@ -0,0 +1,169 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from connection_pool import DatabaseUnavailableError
+
+logger = logging.getLogger()
+
+# The limit is halved at most once per this interval, the chunks in flight during a slowdown report it together.
+DECREASE_INTERVAL_SECONDS = 1
+
+
+class AdaptiveLimiter:
+    """
+        An AIMD budget of statements in flight against the validation database.
+
+        The limit grows by increase_step statements for every limit statements completed below the latency target,
+        and is multiplied by decrease_factor when a database call is slower than the target or fails with an
+        infrastructure error. The state lives in the container, so a warm container keeps what it learned.
+
+        Args:
+            min_limit (int): The lowest limit, at least one chunk must be able to run.
+            max_limit (int): The highest limit, the pool cannot run more statements at once.
+            initial_limit (int): The limit of a new container.
+            latency_target_ms (int): The round trip latency above which the database is considered overloaded.
+            increase_step (int): The additive increase per window of completed statements.
+            decrease_factor (float): The multiplicative decrease on overload.
+    """
+
+    def __init__(self, min_limit: int, max_limit: int, initial_limit: int, latency_target_ms: int,
+                 increase_step: int, decrease_factor: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.latency_target = latency_target_ms / 1000
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.latency = None
+        self.last_decrease = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, count: int):
+        with self.condition:
+            # A chunk larger than the limit still runs alone, otherwise it would wait forever.
+            while self.in_flight > 0 and self.in_flight + count > self.limit:
+                self.condition.wait()
+            self.in_flight += count
+
+    def release(self, count: int, latency: float = None, overloaded: bool = False):
+        with self.condition:
+            self.in_flight -= count
+            if latency is None:
+                # The block failed for another reason, it says nothing about the database.
+                self.condition.notify_all()
+                return
+            # Smoothed round trip latency, published with the limit.
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if overloaded or latency > self.latency_target:
+                now = time.time()
+                if now - self.last_decrease > DECREASE_INTERVAL_SECONDS:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self.last_decrease = now
+                    logger.warning("Validation database overloaded, latency {:.3f}s, limit decreased to {}".format(
+                        latency, int(self.limit)))
+            else:
+                self.limit = min(self.max_limit, self.limit + self.increase_step * count / self.limit)
+            self.condition.notify_all()
+
+    @contextmanager
+    def statements(self, count: int):
+        """
+            Holds count statements of the budget while the block runs and adapts the limit to its outcome.
+
+            The block appends the seconds of its database calls to the yielded list, the slowest one is the latency
+            sample. Without any, the duration of the block is used.
+
+            Args:
+                count (int): The number of statements sent to the database by the block.
+
+            Yields:
+                list: The latencies of the database calls of the block.
+        """
+
+        self.acquire(count)
+        start = time.time()
+        latencies = []
+        try:
+            yield latencies
+        except DatabaseUnavailableError:
+            self.release(count, time.time() - start, overloaded=True)
+            raise
+        except Exception:
+            self.release(count)
+            raise
+        self.release(count, max(latencies) if latencies else time.time() - start)
+
+
+class CircuitBreaker:
+    """
+        Stops sending work to the validation database after consecutive infrastructure failures.
+
+        When open, calls fail at once with DatabaseUnavailableError until the cooldown has passed, then a single
+        trial call is let through: its success closes the breaker, its failure opens it again.
+
+        Args:
+            failure_threshold (int): The number of consecutive failures opening the breaker.
+            cooldown_seconds (int): How long the breaker stays open before a trial call.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: int):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.time() - self.opened_at < self.cooldown_seconds or self.trial_running:
+                raise DatabaseUnavailableError("Circuit breaker is open, the validation database is unhealthy")
+            self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info("Validation database recovered, circuit breaker closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error("Validation database unhealthy after {} failures, circuit breaker opened".format(
+                        self.failures))
+                self.opened_at = time.time()
+
+    @contextmanager
+    def call(self):
+        """
+            Guards a call to the validation database, infrastructure failures are counted by the breaker.
+
+            Raises:
+                DatabaseUnavailableError: If the breaker is open.
+        """
+
+        self.before_call()
+        try:
+            yield
+        except DatabaseUnavailableError:
+            self.record_failure()
+            raise
+        except Exception:
+            with self.lock:
+                self.trial_running = False
+            raise
+        self.record_success()
@@ -0,0 +1,138 @@
+import queue
+import random
+import time
+import logging
+from contextlib import contextmanager
+
+import pymysql
+
+logger = logging.getLogger()
+
+# Client and server errors caused by the connection or the database instance rather than by the checked query,
+# e.g. 1045 for an expired IAM token, 2006 and 2013 for a dropped connection.
+INFRASTRUCTURE_ERROR_CODES = {1040, 1045, 1053, 1152, 1158, 1159, 1160, 1161, 2002, 2003, 2006, 2013, 2014, 2026,
+                              2055}
+
+# Ping a connection before reuse if it has been idle longer than this, the RDS Proxy drops idle clients.
+HEALTH_CHECK_INTERVAL_SECONDS = 60
+
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY_SECONDS = 0.2
+
+
+class DatabaseUnavailableError(Exception):
+    """Raised when the validation database cannot be reached, the checked queries must not be marked as failed."""
+
+
+def is_infrastructure_error(error: Exception):
+    """
+        Tells if an error comes from the connection or the database instance instead of the checked query.
+
+        Args:
+            error (Exception): The error raised by pymysql.
+
+        Returns:
+            bool: True if the error is an infrastructure error.
+    """
+
+    if isinstance(error, (pymysql.err.InterfaceError, OSError, DatabaseUnavailableError)):
+        return True
+    if isinstance(error, pymysql.err.OperationalError) and error.args:
+        return error.args[0] in INFRASTRUCTURE_ERROR_CODES
+    return False
+
+
+class PooledConnection:
+    """A pool slot bound to one database endpoint, the connection is opened on first use."""
+
+    def __init__(self, endpoint: dict):
+        self.endpoint = endpoint
+        self.conn = None
+        self.last_used = 0
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+
+
+class ConnectionPool:
+    """
+        A bounded pool of database connections spread round-robin over several endpoints.
+
+        Connections are opened lazily, health checked after being idle and reopened when they are broken.
+
+        Args:
+            endpoints (list): The endpoints to connect to, each a dict with at least a host and a user.
+            size (int): The total number of connections of the pool.
+            connect (callable): Opens a connection to the given endpoint, with a fresh authentication token.
+    """
+
+    def __init__(self, endpoints: list, size: int, connect):
+        self.connect = connect
+        self.size = max(size, len(endpoints))
+        self.slots = queue.Queue()
+        for i in range(self.size):
+            self.slots.put(PooledConnection(endpoints[i % len(endpoints)]))
+
+    def ensure_connected(self, slot: PooledConnection):
+        if slot.conn is not None and time.time() - slot.last_used > HEALTH_CHECK_INTERVAL_SECONDS:
+            try:
+                slot.conn.ping(reconnect=False)
+            except Exception as e:
+                logger.warning("Connection to {} is broken, reconnecting: {}".format(slot.endpoint['host'], e))
+                slot.close()
+        if slot.conn is None:
+            slot.conn = self.connect(slot.endpoint)
+
+    @contextmanager
+    def connection(self):
+        """
+            Borrows a healthy connection from the pool and returns it when the block exits.
+
+            A connection that raised an infrastructure error is closed, so the slot reconnects on next use.
+
+            Yields:
+                The open connection of the borrowed slot.
+        """
+
+        slot = self.slots.get()
+        try:
+            self.ensure_connected(slot)
+            yield slot.conn
+            slot.last_used = time.time()
+        except Exception as e:
+            if is_infrastructure_error(e):
+                slot.close()
+            raise
+        finally:
+            self.slots.put(slot)
+
+    def run(self, fn, *args):
+        """
+            Runs fn(conn, *args) on a pooled connection, retrying infrastructure errors on a fresh connection.
+
+            Args:
+                fn (callable): The database work, it must be safe to repeat.
+
+            Returns:
+                The result of fn.
+
+            Raises:
+                DatabaseUnavailableError: If the work still fails with an infrastructure error after MAX_ATTEMPTS.
+        """
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                with self.connection() as conn:
+                    return fn(conn, *args)
+            except Exception as e:
+                if not is_infrastructure_error(e):
+                    raise
+                logger.warning("Database infrastructure error, attempt {}/{}: {}".format(attempt, MAX_ATTEMPTS, e))
+                if attempt == MAX_ATTEMPTS:
+                    raise DatabaseUnavailableError(str(e)) from e
+                time.sleep(RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1)) * (1 + random.random()))
@@ -7,6 +7,8 @@ class Task(Enum):
     FINISHED = 'Finished'
     IN_PROGRESS = 'In-progress'
     ERROR = 'Error'
+    RECHECKING = 'Rechecking'
+    DRAINING = 'Draining'
 
 
 class QueryLog(Enum):
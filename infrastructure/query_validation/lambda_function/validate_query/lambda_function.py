@@ -3,147 +3,454 @@ import boto3
 import os
 import re
 import json
+import zlib
+import base64
+import time
+import random
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from enums import Task, QueryLog
+from syntax_check import check_syntax_batch
+from connection_pool import ConnectionPool
+from concurrency import AdaptiveLimiter, CircuitBreaker
+from rule_engine import RuleEngine
+from prefilter import classify, Verdict, PARSER_VERSION
+from metrics import put_metrics
+from result_cache import ResultCache
+from validation_target import ValidationTarget
+from report_segment import build_report_row, write_segment
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
 REGION = os.environ.get("REGION")
-ENDPOINT = os.environ.get("PROXY_ENDPOINT")
+# The validation databases, each with its name, engine version, proxy, proxy read-only, writer and reader endpoints.
+VALIDATION_TARGETS = json.loads(os.environ.get("VALIDATION_TARGETS", "[]"))
 
 PORT = 3306
 USER = "admin"
+# IAM database user for the direct connections to the writer and reader instances.
+VALIDATOR_USER = os.environ.get("VALIDATOR_DB_USER", "db_check_validator")
 DBNAME = "mysql"
 pattern = r"'[^']*'"
 
 client = boto3.client('rds')
 
-query_command = 'SELECT STATEMENT_DIGEST_TEXT(%s)'
-token = client.generate_db_auth_token(DBHostname=ENDPOINT, Port=PORT, DBUsername=USER, Region=REGION)
+VALIDATE_BATCH_SIZE = int(os.environ.get("VALIDATE_BATCH_SIZE", "25"))
+VALIDATE_POOL_SIZE = int(os.environ.get("VALIDATE_POOL_SIZE", "8"))
+
+# Adaptive budget of statements in flight, a round trip slower than the target halves it.
+VALIDATE_LATENCY_TARGET_MS = int(os.environ.get("VALIDATE_LATENCY_TARGET_MS", "1000"))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_COOLDOWN_SECONDS = int(os.environ.get("BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Statements the local parser decides are not sent to the database, except a sample used to measure agreement.
+PREFILTER_ENABLED = os.environ.get("PREFILTER_ENABLED", "true") == "true"
+PREFILTER_AUDIT_RATE = float(os.environ.get("PREFILTER_AUDIT_RATE", "0.05"))
+METRIC_NAMESPACE = os.environ.get("METRIC_NAMESPACE", "db-check")
+LOCAL_SYNTAX_ERROR = "Syntax error found by the local parser: {}"
+# The MySQL error code at the start of a message raised by pymysql, e.g. "(1064, ...".
+MYSQL_ERROR_CODE = re.compile(r'\((\d{4}),')
+
+# Validation results are shared across tasks for the same engine version, rule catalog version and parser version.
+RESULT_CACHE_TABLE = os.environ.get("RESULT_CACHE_TABLE")
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_DAYS", "30")) * 24 * 60 * 60
+RESULT_CACHE_LOCAL_SIZE = int(os.environ.get("RESULT_CACHE_LOCAL_SIZE", "20000"))
+
+# IAM authentication tokens are valid for 15 minutes, generate a new one well before that.
+TOKEN_REFRESH_SECONDS = 10 * 60
+auth_tokens = {}
+# The proxies through which the validator user has been created by this container.
+validator_user_proxies = set()
+validator_user_lock = threading.Lock()
 
 # dynamodb client
 dynamodb = boto3.resource('dynamodb', region_name=REGION)
 log_table_name = os.environ.get("DDB_LOG_TABLE")
-log_table = dynamodb.Table(log_table_name)
 
 task_table_name = os.environ.get("DDB_TASK_TABLE")
 task_table = dynamodb.Table(task_table_name)
 
-# Create database connection
-conn = pymysql.connect(host=ENDPOINT, user=USER, passwd=token, port=PORT, database=DBNAME,
-                       ssl_ca='global-bundle.pem')
+# Log item updates are issued concurrently, each thread uses its own DynamoDB resource.
+LOG_UPDATE_CONCURRENCY = int(os.environ.get("LOG_UPDATE_CONCURRENCY", "16"))
+update_executor = ThreadPoolExecutor(max_workers=LOG_UPDATE_CONCURRENCY)
+thread_local = threading.local()
 
+# Failed items are appended to report segments as they are validated, the report compacts them at the end.
+REPORT_BUCKET = os.environ.get("REPORT_BUCKET")
+s3 = boto3.client('s3', region_name=REGION)
 
-def check_for_unsupported_functions(query):
+
+
+def get_auth_token(endpoint: dict):
+    """
+        Returns an IAM authentication token for an endpoint, refreshed ahead of its 15 minutes expiry.
+
+        Args:
+            endpoint (dict): The endpoint with its host and database user.
+
+        Returns:
+            str: The authentication token.
+    """
+
+    key = (endpoint['host'], endpoint['user'])
+    cached = auth_tokens.get(key)
+    if cached is None or time.time() - cached[1] > TOKEN_REFRESH_SECONDS:
+        token = client.generate_db_auth_token(DBHostname=endpoint['host'], Port=PORT, DBUsername=endpoint['user'],
+                                              Region=REGION)
+        cached = (token, time.time())
+        auth_tokens[key] = cached
+    return cached[0]
+
+
+def connect(endpoint: dict):
+    """
+        Opens a connection to a validation database endpoint with an IAM authentication token.
+
+        Args:
+            endpoint (dict): The endpoint with its host and database user.
+
+        Returns:
+            pymysql.connections.Connection: The open connection.
+    """
+
+    if endpoint.get('admin_host'):
+        ensure_validator_user(endpoint['admin_host'])
+    # STATEMENT_DIGEST_TEXT needs no database, the validator user has no privileges and connects without one.
+    database = DBNAME if endpoint['user'] == USER else None
+    return pymysql.connect(host=endpoint['host'], user=endpoint['user'], passwd=get_auth_token(endpoint), port=PORT,
+                           database=database, ssl_ca='global-bundle.pem', connect_timeout=5, read_timeout=30,
+                           write_timeout=30)
+
+
+def ensure_validator_user(proxy_endpoint: str):
     """
-    Checks a MySQL query for potential unsupported functions using a regular expression.
-    `decode` decode  (
-    
-    Args:
-        query: The MySQL query string to be analyzed.
+        Creates the IAM database user used for direct connections to the cluster instances.
 
-    Returns:
-        A list of unsupported functions found in the query, or an empty list if none are found.
+        The proxy authenticates with the admin secret, the writer and reader instances need a database user
+        identified by the AWSAuthenticationPlugin. The statement is idempotent and runs once per container, on the
+        first direct connection, so an unreachable database is retried by the pool and counted by the breaker
+        instead of failing the container initialization.
+
+        Args:
+            proxy_endpoint (str): The proxy endpoint of the validation database.
+
+        Returns:
+            None
     """
-    functions = ['load_file', 'udf', 'geometrycollectome', 'geomcollfromtext',
-                 'linestringfromtext', 'polygonfromtext', 'pointfromtex', 'json_append',
-                 'encode', 'decode', 'encrypt', 'des_encrypt', 'des_decrypt', 'glength']
-    # function_pattern = re.compile('|'.join(map(re.escape, functions)), re.IGNORECASE)
-    
-    pattern = r'\b(' + '|'.join(map(re.escape, functions)) + r')\s*\('
-    
-    function_pattern = re.compile(pattern, re.IGNORECASE)
-    matches = function_pattern.findall(query)
-    return matches
+
+    with validator_user_lock:
+        if proxy_endpoint in validator_user_proxies:
+            return
+        admin_conn = connect({'host': proxy_endpoint, 'user': USER})
+        try:
+            with admin_conn.cursor() as cur:
+                cur.execute("CREATE USER IF NOT EXISTS %s@'%%' IDENTIFIED WITH AWSAuthenticationPlugin AS 'RDS' "
+                            "REQUIRE SSL", VALIDATOR_USER)
+        finally:
+            admin_conn.close()
+        validator_user_proxies.add(proxy_endpoint)
 
 
-def check_for_keywords(query):
+def get_validation_endpoints(target_config: dict):
     """
-        Checks if a given SQL query contains any MySQL keywords related to window functions.
+        Lists the configured endpoints of a validation database.
 
         Args:
-            query (str): The SQL query to be checked.
+            target_config (dict): The configuration of the validation target.
 
         Returns:
-            list: A list of keywords found in the query.
+            list: The proxy, proxy read-only, writer and reader endpoints that are configured.
     """
-    keywords = [
-        'cume_dist', 'dense_rank', 'empty', 'except', 'first_value',
-        'grouping', 'groups', 'json_table', 'lag', 'last_value',
-        'lateral', 'lead', 'nth_value', 'ntile', 'of', 'over',
-        'percent_rank', 'rank', 'recursive', 'row_number', 'system', 'window'
-    ]
-    keywords_pattern = re.compile(rf"(?i)(?<!`)\b({'|'.join(map(re.escape, keywords))})\b(?!`)")
-    matches = keywords_pattern.findall(query)
-    return matches
+
+    endpoints = [{'host': target_config['proxy_endpoint'], 'user': USER}]
+    if target_config.get('proxy_read_only_endpoint'):
+        endpoints.append({'host': target_config['proxy_read_only_endpoint'], 'user': USER})
+    # The validator user is created through the proxy before the first direct connection.
+    for host in [target_config.get('writer_endpoint'), target_config.get('reader_endpoint')]:
+        if host:
+            endpoints.append({'host': host, 'user': VALIDATOR_USER, 'admin_host': target_config['proxy_endpoint']})
+    return endpoints
 
 
-def check_for_mysql_syntax(query):
+def create_validation_target(target_config: dict):
     """
-        Executes a given MySQL query and returns the results.
+        Creates the connection pool, limiter, breaker and result cache of a validation target.
 
         Args:
-            query (str): The MySQL query to be executed.
+            target_config (dict): The configuration of the validation target.
 
         Returns:
-            list: A list containing the results of the executed query.
+            ValidationTarget: The validation target.
+    """
+
+    # The validation work is fanned out over the connections of the pool.
+    pool = ConnectionPool(get_validation_endpoints(target_config), VALIDATE_POOL_SIZE, connect)
+
+    # The limiter and the breaker protect the validation database from bursts, their state lives in the container.
+    limiter = AdaptiveLimiter(min_limit=VALIDATE_BATCH_SIZE, max_limit=pool.size * VALIDATE_BATCH_SIZE,
+                              initial_limit=pool.size * VALIDATE_BATCH_SIZE // 2,
+                              latency_target_ms=VALIDATE_LATENCY_TARGET_MS, increase_step=VALIDATE_BATCH_SIZE)
+    breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN_SECONDS)
+    result_cache = ResultCache(dynamodb, RESULT_CACHE_TABLE, target_config['engine_version'], rule_engine.version,
+                               PARSER_VERSION, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_LOCAL_SIZE)
+
+    # The local parser implements the MySQL 8.0 grammar, other major versions are always checked by the database.
+    return ValidationTarget(target_config['name'], target_config['engine_version'], pool, limiter, breaker,
+                            result_cache, prefilter=target_config['engine_version'].startswith('8.0.'))
+
+
+# The compatibility rules are compiled once per container.
+rule_engine = RuleEngine.from_file('rule_catalog.json')
+
+# The first target is the primary one, the targets validate the same queries concurrently.
+if not VALIDATION_TARGETS:
+    raise ValueError("VALIDATION_TARGETS is empty, at least one validation database must be configured")
+targets = [create_validation_target(target_config) for target_config in VALIDATION_TARGETS]
+target_executor = ThreadPoolExecutor(max_workers=len(targets))
+
+
+def get_query_from_image(log_item: dict):
     """
-    cur = conn.cursor()
-    cur.execute(query_command, query)
-    query_results = cur.fetchall()
-    return query_results
+        Decodes the query text of a log item stream image.
+
+        Args:
+            log_item (dict): The NewImage of a check log stream record.
+
+        Returns:
+            str: The query, decompressed when it is stored in the binary query_z attribute.
+    """
+
+    if 'query_z' in log_item:
+        return zlib.decompress(base64.b64decode(log_item['query_z']['B'])).decode()
+    return log_item['query']['S']
+
+
+def check_chunk_for_mysql_syntax(target: ValidationTarget, queries: list):
+    """
+        Checks the MySQL syntax of a chunk of queries on a connection borrowed from the pool of a target.
+
+        Broken connections are reopened and the chunk is retried, a DatabaseUnavailableError is raised if the
+        database stays unreachable so that the stream batch is retried instead of marking the queries as failed.
+        The chunk waits for room in the adaptive limit and fails at once while the circuit breaker is open.
+
+        Args:
+            target (ValidationTarget): The validation target.
+            queries (list): The queries to be checked.
+
+        Returns:
+            list: The error message of each query, or None if the query is valid.
+    """
+
+    with target.breaker.call(), target.limiter.statements(len(queries)) as latencies:
+        return target.pool.run(check_syntax_batch, queries, VALIDATE_BATCH_SIZE, latencies)
+
+
+def check_for_mysql_syntax(target: ValidationTarget, queries: list):
+    """
+        Checks the MySQL syntax of queries, chunks of VALIDATE_BATCH_SIZE queries are checked concurrently.
+
+        Args:
+            target (ValidationTarget): The validation target.
+            queries (list): The queries to be checked.
+
+        Returns:
+            list: The error message of each query, or None if the query is valid.
+    """
+
+    chunks = [queries[i:i + VALIDATE_BATCH_SIZE] for i in range(0, len(queries), VALIDATE_BATCH_SIZE)]
+    syntax_errors = []
+    for chunk_errors in target.executor.map(lambda chunk: check_chunk_for_mysql_syntax(target, chunk), chunks):
+        syntax_errors.extend(chunk_errors)
+    return syntax_errors
+
+
+def check_syntax(target: ValidationTarget, queries: list):
+    """
+        Checks the MySQL syntax of queries, the local parser prefilter decides the statements it understands and
+        the others are checked by the database.
+
+        A PREFILTER_AUDIT_RATE sample of the decided statements is checked by the database as well, its result is
+        kept and the agreement of both checks is published as metrics.
+
+        Args:
+            target (ValidationTarget): The validation target.
+            queries (list): The queries to be checked.
+
+        Returns:
+            list: The error message of each query, or None if the query is valid.
+    """
+
+    prefilter_enabled = PREFILTER_ENABLED and target.prefilter
+    syntax_errors = [None] * len(queries)
+    database_indexes = []
+    audited_verdicts = {}
+    counts = {'PrefilterValid': 0, 'PrefilterInvalid': 0, 'PrefilterUncertain': 0, 'PrefilterAudited': 0,
+              'PrefilterDisagreed': 0}
+
+    for index, query in enumerate(queries):
+        verdict, reason = classify(query) if prefilter_enabled else (Verdict.UNCERTAIN, None)
+        counts['Prefilter' + verdict.value] += 1
+        if verdict == Verdict.INVALID:
+            syntax_errors[index] = LOCAL_SYNTAX_ERROR.format(reason)
+        if verdict == Verdict.UNCERTAIN:
+            database_indexes.append(index)
+        elif random.random() < PREFILTER_AUDIT_RATE:
+            audited_verdicts[index] = verdict
+            database_indexes.append(index)
+
+    try:
+        database_errors = check_for_mysql_syntax(target, [queries[index] for index in database_indexes])
+    finally:
+        if database_indexes:
+            put_metrics(METRIC_NAMESPACE, {'ValidationConcurrencyLimit': int(target.limiter.limit),
+                                           'ValidationLatency': int((target.limiter.latency or 0) * 1000),
+                                           'CircuitBreakerOpen': int(target.breaker.is_open)},
+                        dimensions={'Target': target.name}, units={'ValidationLatency': 'Milliseconds'})
+    for index, syntax_error in zip(database_indexes, database_errors):
+        if index in audited_verdicts:
+            counts['PrefilterAudited'] += 1
+            if (syntax_error is None) != (audited_verdicts[index] == Verdict.VALID):
+                counts['PrefilterDisagreed'] += 1
+                logger.warning("Prefilter verdict " + audited_verdicts[index].value + " disagrees with the database! "
+                               "query = " + queries[index] + ", error = " + str(syntax_error))
+        syntax_errors[index] = syntax_error
+
+    if prefilter_enabled and queries:
+        put_metrics(METRIC_NAMESPACE, counts, dimensions={'Target': target.name})
+    return syntax_errors
 
 
 def replace_strings(match):
     return "*" * len(match.group())
 
 
-def update_log_table(log_item: dict):
+def get_log_table():
+    """
+        Returns the check log table of the calling thread, boto3 resources must not be shared between threads.
+
+        Returns:
+            The DynamoDB Table resource of the check log table.
+    """
+
+    if not hasattr(thread_local, 'log_table'):
+        thread_local.log_table = boto3.session.Session().resource('dynamodb', region_name=REGION).Table(log_table_name)
+    return thread_local.log_table
+
+
+def get_error_class(log_item: dict):
+    """
+        Classifies a failed log item by its first compatibility rule, or else by the MySQL error code of its message.
+
+        Args:
+            log_item (dict): A dictionary containing the log item details, including the message and rule ids.
+
+        Returns:
+            str: The error class, e.g. the rule id or MYSQL_1064.
+    """
+
+    if log_item['rule_ids']:
+        return log_item['rule_ids'][0]
+    # The local parser only rejects statements the database rejects with a parse error.
+    if LOCAL_SYNTAX_ERROR.format('') in log_item['message']:
+        return 'MYSQL_1064'
+    match = MYSQL_ERROR_CODE.search(log_item['message'])
+    if match:
+        return 'MYSQL_' + match.group(1)
+    return 'OTHER'
+
+
+def update_log_table(log_item: dict, first_only: bool = True):
     """
         Updates a log item in a DynamoDB table with the provided status and message.
 
+        The item leaves the pending index, and a failed item is added to the failed index. With first_only, only an
+        item that was not validated yet is updated, so that the stream, its retries and the sweeper count every item
+        exactly once.
+
         Args:
-            log_item (dict): A dictionary containing the log item details, including the key, status, and message.
+            log_item (dict): A dictionary containing the log item details, including the key, status, message, rule ids,
+                             performance risks and the result of each validation target.
+            first_only (bool): Update the item only if it has no status yet.
 
         Returns:
-            None
+            bool: True if the item was updated.
     """
 
     # Define the update expression, attribute names, and values
-    update_expression = 'SET #stat = :value, #msg = :msg_value'
+    update_expression = 'SET #stat = :value, #msg = :msg_value, rule_ids = :rule_ids, ' \
+                        'target_results = :target_results, risk_ids = :risk_ids, risk_message = :risk_message, ' \
+                        'risk_weight = :risk_weight'
+    remove_expression = ' REMOVE pending_bucket, pending_since'
     expression_attribute_names = {
         '#stat': 'status',
         '#msg': 'message'
     }
     expression_attribute_values = {
         ':value': log_item['status'],
-        ':msg_value': log_item['message']
+        ':msg_value': log_item['message'],
+        ':rule_ids': log_item['rule_ids'],
+        ':target_results': log_item['target_results'],
+        ':risk_ids': log_item['risk_ids'],
+        ':risk_message': log_item['risk_message'],
+        ':risk_weight': rule_engine.weigh(log_item['risk_ids'])
     }
 
+    # Items with performance risks are in the sparse risk index of their task bucket.
+    if log_item['risk_ids']:
+        update_expression += ', risk_bucket = :risk_bucket'
+        expression_attribute_values[':risk_bucket'] = log_item['key']['task_bucket']
+    else:
+        remove_expression += ', risk_bucket'
+
+    # Failed items are in the sparse failed index of their task bucket, sorted by error class.
+    if log_item['status'] == QueryLog.FAILED.value:
+        error_class = get_error_class(log_item)
+        update_expression += ', failed_bucket = :failed_bucket, failure_sort = :failure_sort, error_class = :error_class'
+        expression_attribute_values[':failed_bucket'] = log_item['key']['task_bucket']
+        expression_attribute_values[':failure_sort'] = error_class + '#' + bytes(log_item['key']['query_hash']).hex()
+        expression_attribute_values[':error_class'] = error_class
+    else:
+        remove_expression += ', failed_bucket, failure_sort, error_class'
+
+    update_kwargs = {}
+    if first_only:
+        update_kwargs['ConditionExpression'] = 'attribute_not_exists(#stat)'
+
     # Update the check log item.
     try:
-        response = log_table.update_item(
+        response = get_log_table().update_item(
             Key=log_item['key'],
-            UpdateExpression=update_expression,
+            UpdateExpression=update_expression + remove_expression,
             ExpressionAttributeNames=expression_attribute_names,
             ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues='NONE'
+            ReturnValues='NONE',
+            **update_kwargs
         )
+        return True
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        # Already validated by an earlier delivery of the record or by the sweeper.
+        return False
     except Exception as e:
         logger.error("Update check_log item failed! key = " + str(log_item['key']))
         logger.error(e)
+        return False
 
 
-def update_task_table(task_id: str, checked_count: int, failed_count: int):
+def update_task_table(task_id: str, checked_count: int, failed_count: int, target_failed_counts: dict = None):
     """
         Updates the checked_query and failed_query counts of a task item in a DynamoDB table.
 
+        The failed count of each validation target is kept in a failed_query_<target> attribute. The counts of a
+        task that is Stopped, Finished or Rechecking in the meantime are dropped.
+
         Args:
             task_id (str): The ID of the task item to be updated.
             checked_count (int): The number of queries to increment the checked_query count by.
             failed_count (int): The number of queries to increment the failed_query count by.
+            target_failed_counts (dict): The number of queries failed on each target, by target name.
 
         Returns:
             None
@@ -157,52 +464,85 @@ def update_task_table(task_id: str, checked_count: int, failed_count: int):
     update_expression = '''SET checked_query = checked_query + :check_value,
      failed_query = failed_query + :fail_value'''
 
+    expression_attribute_names = {'#stat': 'status'}
     expression_attribute_values = {
         ':check_value': checked_count,
-        ':fail_value': failed_count
+        ':fail_value': failed_count,
+        ':stopped': Task.STOPPED.value,
+        ':finished': Task.FINISHED.value,
+        ':rechecking': Task.RECHECKING.value
     }
 
+    for index, (target_name, target_failed_count) in enumerate((target_failed_counts or {}).items()):
+        update_expression += ', #tf{0} = if_not_exists(#tf{0}, :zero) + :tf{0}'.format(index)
+        expression_attribute_names['#tf{}'.format(index)] = 'failed_query_' + target_name
+        expression_attribute_values[':tf{}'.format(index)] = target_failed_count
+        expression_attribute_values[':zero'] = 0
+
     # Update the task item.
     try:
         response = task_table.update_item(
             Key=key,
             UpdateExpression=update_expression,
+            ConditionExpression='NOT #stat IN (:stopped, :finished, :rechecking)',
+            ExpressionAttributeNames=expression_attribute_names,
             ExpressionAttributeValues=expression_attribute_values,
             ReturnValues='NONE'
         )
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        logger.info("Task is stopped, finished or rechecking, counts are not updated. key = " + str(key))
     except Exception as e:
         logger.error("Update check_task item failed! key = " + str(key))
         logger.error(e)
 
 
-def update_task(task_id: str, log_items: list):
+def update_task(task_id: str, log_items: list, counters: dict):
     """
-        Updates the task and log tables with the provided log items.
+        Updates the log items of a task concurrently and adds them to the task counters of the window.
+
+        Only the items validated for the first time are counted, those that failed are written to a report segment.
 
         Args:
             task_id (str): The ID of the task to be updated.
             log_items (list): A list of dictionaries representing the log items.
+            counters (dict): The [checked, failed, failed by target] counts by task ID of the current window.
 
         Returns:
             None
     """
 
-    checked_count = 0
-    failed_count = 0
-    for log_item in log_items:
-        checked_count += 1
+    task_counters = counters.setdefault(task_id, [0, 0, {}])
+    if len(task_counters) < 3:
+        task_counters.append({})
+    failed_rows = []
+    for log_item, updated in zip(log_items, update_executor.map(update_log_table, log_items)):
+        if not updated:
+            continue
+        task_counters[0] += 1
         if log_item['status'] == QueryLog.FAILED.value:
-            failed_count += 1
-        update_log_table(log_item)
-    update_task_table(task_id, checked_count, failed_count)
+            task_counters[1] += 1
+            # Items read from the pending index have no src, the report is then built from the failed index.
+            if 'src' in log_item:
+                failed_rows.append(build_report_row(task_id, log_item, [target.name for target in targets]))
+        for target_name, target_result in log_item['target_results'].items():
+            if target_result['status'] == QueryLog.FAILED.value:
+                task_counters[2][target_name] = task_counters[2].get(target_name, 0) + 1
+
+    if failed_rows and REPORT_BUCKET:
+        try:
+            write_segment(s3, REPORT_BUCKET, task_id, failed_rows)
+        except Exception as e:
+            logger.error("Write report segment failed! task_id = " + task_id)
+            logger.error(e)
 
 
-def update_validate_result(update_tasks: dict):
+def update_validate_result(update_tasks: dict, counters: dict):
     """
-        Updates the task and log tables with the provided log items for each task.
+        Updates the log table with the provided log items for each task and accumulates the task counters.
 
         Args:
             update_tasks (dict): A dictionary where keys are task IDs and values are lists of log items.
+            counters (dict): The [checked, failed, failed by target] counts by task ID of the current window.
 
         Returns:
             None
@@ -219,20 +559,146 @@ def update_validate_result(update_tasks: dict):
             if 'Item' in response:
                 item = response['Item']
                 task_status = item['status']
-                # Do not update checked and failed count if a task status is Finished or Stopped.
-                if task_status == Task.STOPPED.value or task_status == Task.FINISHED.value:
+                # Do not update checked and failed count if a task status is Finished, Stopped or Rechecking.
+                if task_status in [Task.STOPPED.value, Task.FINISHED.value, Task.RECHECKING.value]:
                     continue
                 else:
-                    update_task(task_id, log_items)
+                    update_task(task_id, log_items, counters)
 
         except Exception as e:
             logger.error("Get check_task item failed! key = " + str(key))
             logger.error(e)
 
 
+def flush_task_counters(counters: dict):
+    """
+        Adds the counts accumulated during a window to the task items, one update per task.
+
+        Args:
+            counters (dict): The [checked, failed, failed by target] counts by task ID.
+
+        Returns:
+            None
+    """
+
+    for task_id, task_counters in counters.items():
+        update_task_table(task_id, *task_counters)
+
+
+def evaluate_rules(query: str):
+    """
+        Evaluates the compatibility and performance rules on a query.
+
+        Args:
+            query (str): The query to be evaluated.
+
+        Returns:
+            dict: The status, message and rule ids of the compatibility findings, and the rule ids and message of the
+                  performance risk findings.
+    """
+
+    findings = rule_engine.evaluate(query)
+    compatibility_findings = [finding for finding in findings if not rule_engine.is_performance_risk(finding)]
+    risk_findings = [finding for finding in findings if rule_engine.is_performance_risk(finding)]
+    return {
+        "message": rule_engine.describe(compatibility_findings),
+        "status": QueryLog.FAILED.value if compatibility_findings else QueryLog.CHECKED.value,
+        "rule_ids": list(dict.fromkeys(finding.rule_id for finding in compatibility_findings)),
+        "risk_ids": list(dict.fromkeys(finding.rule_id for finding in risk_findings)),
+        "risk_message": rule_engine.describe(risk_findings)
+    }
+
+
+def validate_target_queries(target: ValidationTarget, queries: dict, rule_results: dict):
+    """
+        Validates queries against one target, queries validated before by any task are taken from its result cache.
+
+        Args:
+            target (ValidationTarget): The validation target.
+            queries (dict): The queries by query hash.
+            rule_results (dict): The rule results by query hash shared by the targets, completed on demand.
+
+        Returns:
+            dict: The result of each query on the target by query hash, with its status, message and rule ids.
+    """
+
+    cache_keys = {query_hash: target.result_cache.key(query_hash) for query_hash in queries}
+    cached_results, local_hits = target.result_cache.get_many(list(cache_keys.values()))
+
+    results = {}
+    unchecked_queries = {}
+    for query_hash, cache_key in cache_keys.items():
+        if cache_key in cached_results:
+            results[query_hash] = cached_results[cache_key]
+            continue
+        if query_hash not in rule_results:
+            rule_results[query_hash] = evaluate_rules(queries[query_hash])
+        results[query_hash] = dict(rule_results[query_hash])
+        unchecked_queries[query_hash] = queries[query_hash]
+
+    # Check the syntax of the whole batch, the statements left by the prefilter are checked with a few concurrent
+    # round trips instead of one per query.
+    syntax_errors = check_syntax(target, list(unchecked_queries.values()))
+    for query_hash, syntax_error in zip(unchecked_queries.keys(), syntax_errors):
+        if syntax_error is not None:
+            results[query_hash]['status'] = QueryLog.FAILED.value
+            results[query_hash]['message'] = results[query_hash]['message'] + syntax_error
+
+    target.result_cache.put_many({cache_keys[query_hash]: results[query_hash] for query_hash in unchecked_queries})
+    if queries:
+        put_metrics(METRIC_NAMESPACE, {'ResultCacheLocalHits': local_hits,
+                                       'ResultCacheTableHits': len(cached_results) - local_hits,
+                                       'ResultCacheMisses': len(unchecked_queries)},
+                    dimensions={'Target': target.name})
+    return results
+
+
+def validate_queries(queries: dict):
+    """
+        Validates queries with the compatibility rules and the syntax check of every validation target, the targets
+        are checked concurrently.
+
+        A query fails if it fails on any target. The message is the one of the primary target when there is a single
+        target, otherwise the messages of the failed targets prefixed with their name.
+
+        Args:
+            queries (dict): The queries by query hash.
+
+        Returns:
+            dict: The result of each query by query hash, with its status, message, rule ids and target results.
+    """
+
+    rule_results = {}
+    target_results = list(target_executor.map(
+        lambda target: validate_target_queries(target, queries, rule_results), targets))
+
+    results = {}
+    for query_hash in queries:
+        per_target = {target.name: {'status': results_of_target[query_hash]['status'],
+                                    'message': results_of_target[query_hash]['message']}
+                      for target, results_of_target in zip(targets, target_results)}
+        failed_targets = [name for name, result in per_target.items() if result['status'] == QueryLog.FAILED.value]
+        primary_result = target_results[0][query_hash]
+
+        message = primary_result['message']
+        if len(targets) > 1 and failed_targets:
+            message = ' '.join('[{}] {}'.format(name, per_target[name]['message']) for name in failed_targets)
+
+        results[query_hash] = {
+            "status": QueryLog.FAILED.value if failed_targets else QueryLog.CHECKED.value,
+            "message": message,
+            "rule_ids": primary_result['rule_ids'],
+            "risk_ids": primary_result.get('risk_ids', []),
+            "risk_message": primary_result.get('risk_message', ''),
+            "target_results": per_target
+        }
+    return results
+
+
 def lambda_handler(event, context):
     ddb_records = event['Records']
     update_task_dict = {}
+    log_records = []
 
     for record in ddb_records:
         if record['eventName'] != 'INSERT':
@@ -240,38 +706,33 @@ def lambda_handler(event, context):
         log_item = record['dynamodb']['NewImage']
 
         task_id = log_item['task_id']['S']
-        query = log_item['query']['S']
-        query_hash = log_item['query_hash']['S']
-
-        status = QueryLog.CHECKED.value
-        message = ""
-
-        unsupported_functions = check_for_unsupported_functions(query)
-        keywords = check_for_keywords(query)
-
-        if unsupported_functions:
-            status = QueryLog.FAILED.value
-            message = 'Query contains unsupported functions: {}; '.format(unsupported_functions)
-        if keywords:
-            status = QueryLog.FAILED.value
-            message = message + 'Query contains 8.0 keywords without ``: {}; '.format(keywords)
-
-        try:
-            check_for_mysql_syntax(query)
-        except Exception as e:
-            status = QueryLog.FAILED.value
-            message = message + str(e)
+        task_bucket = log_item['task_bucket']['S']
+        query = get_query_from_image(log_item)
+        query_hash = base64.b64decode(log_item['query_hash']['B'])
 
         # Define the key of the item to update
         key = {
-            'task_id': task_id,
+            'task_bucket': task_bucket,
             'query_hash': query_hash
         }
 
+        log_records.append((task_id, key, query, log_item))
+
+    results = validate_queries({key['query_hash']: query for _, key, query, _ in log_records})
+
+    for task_id, key, query, log_item in log_records:
+        result = results[key['query_hash']]
         log_item_dict = {
             "key": key,
-            "message": message,
-            "status": status
+            "message": result['message'],
+            "status": result['status'],
+            "rule_ids": result['rule_ids'],
+            "risk_ids": result['risk_ids'],
+            "risk_message": result['risk_message'],
+            "target_results": result['target_results'],
+            "query": query,
+            "src": log_item['src']['S'],
+            "src_port": list(log_item['src_port'].values())[0]
         }
 
         if task_id in update_task_dict:
@@ -279,9 +740,13 @@ def lambda_handler(event, context):
         else:
             update_task_dict[task_id] = [log_item_dict]
 
-    update_validate_result(update_task_dict)
+    # The task counters are carried in the tumbling window state and written once per window.
+    counters = event.get('state') or {}
+    update_validate_result(update_task_dict, counters)
+    if event.get('isFinalInvokeForWindow', True):
+        flush_task_counters(counters)
+        counters = {}
 
     return {
-        'statusCode': 202,  # Custom success code (optional)
-        'body': json.dumps('Validate query successfully!')
+        'state': counters
     }
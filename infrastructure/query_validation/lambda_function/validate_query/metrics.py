@@ -0,0 +1,34 @@
+import json
+import time
+
+
+def put_metrics(namespace: str, metrics: dict, dimensions: dict = None, units: dict = None):
+    """
+        Publishes CloudWatch metrics with the embedded metric format, the Lambda log line is turned into metrics
+        without an API call.
+
+        Args:
+            namespace (str): The CloudWatch namespace.
+            metrics (dict): The metric names and their values.
+            dimensions (dict): The dimension names and values of the metrics.
+            units (dict): The units of the metrics that are not a Count.
+
+        Returns:
+            None
+    """
+
+    dimensions = dimensions or {}
+    units = units or {}
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [list(dimensions.keys())],
+                'Metrics': [{'Name': name, 'Unit': units.get(name, 'Count')} for name in metrics],
+            }],
+        },
+    }
+    record.update(dimensions)
+    record.update(metrics)
+    print(json.dumps(record))
@@ -0,0 +1,573 @@
+import hashlib
+from enum import Enum
+
+import rule_engine
+from rule_engine import tokenize
+
+# Reserved words of MySQL 8.0, an unquoted reserved word used as an identifier is a syntax error.
+RESERVED_WORDS = {
+    'accessible', 'add', 'all', 'alter', 'analyze', 'and', 'as', 'asc', 'asensitive', 'before', 'between', 'bigint',
+    'binary', 'blob', 'both', 'by', 'call', 'cascade', 'case', 'change', 'char', 'character', 'check', 'collate',
+    'column', 'condition', 'constraint', 'continue', 'convert', 'create', 'cross', 'cube', 'cume_dist',
+    'current_date', 'current_time', 'current_timestamp', 'current_user', 'cursor', 'database', 'databases',
+    'day_hour', 'day_microsecond', 'day_minute', 'day_second', 'dec', 'decimal', 'declare', 'default', 'delayed',
+    'delete', 'dense_rank', 'desc', 'describe', 'deterministic', 'distinct', 'distinctrow', 'div', 'double', 'drop',
+    'dual', 'each', 'else', 'elseif', 'empty', 'enclosed', 'escaped', 'except', 'exists', 'exit', 'explain', 'false',
+    'fetch', 'first_value', 'float', 'float4', 'float8', 'for', 'force', 'foreign', 'from', 'fulltext', 'function',
+    'generated', 'get', 'grant', 'group', 'grouping', 'groups', 'having', 'high_priority', 'hour_microsecond',
+    'hour_minute', 'hour_second', 'if', 'ignore', 'in', 'index', 'infile', 'inner', 'inout', 'insensitive', 'insert',
+    'int', 'int1', 'int2', 'int3', 'int4', 'int8', 'integer', 'intersect', 'interval', 'into', 'io_after_gtids',
+    'io_before_gtids', 'is', 'iterate', 'join', 'json_table', 'key', 'keys', 'kill', 'lag', 'last_value', 'lateral',
+    'lead', 'leading', 'leave', 'left', 'like', 'limit', 'linear', 'lines', 'load', 'localtime', 'localtimestamp',
+    'lock', 'long', 'longblob', 'longtext', 'loop', 'low_priority', 'master_bind', 'master_ssl_verify_server_cert',
+    'match', 'maxvalue', 'mediumblob', 'mediumint', 'mediumtext', 'middleint', 'minute_microsecond', 'minute_second',
+    'mod', 'modifies', 'natural', 'not', 'no_write_to_binlog', 'nth_value', 'ntile', 'null', 'numeric', 'of', 'on',
+    'optimize', 'optimizer_costs', 'option', 'optionally', 'or', 'order', 'out', 'outer', 'outfile', 'over',
+    'partition', 'percent_rank', 'precision', 'primary', 'procedure', 'purge', 'range', 'rank', 'read', 'reads',
+    'read_write', 'real', 'recursive', 'references', 'regexp', 'release', 'rename', 'repeat', 'replace', 'require',
+    'resignal', 'restrict', 'return', 'revoke', 'right', 'rlike', 'row', 'rows', 'row_number', 'schema', 'schemas',
+    'second_microsecond', 'select', 'sensitive', 'separator', 'set', 'show', 'signal', 'smallint', 'spatial',
+    'specific', 'sql', 'sqlexception', 'sqlstate', 'sqlwarning', 'sql_big_result', 'sql_calc_found_rows',
+    'sql_small_result', 'ssl', 'starting', 'stored', 'straight_join', 'system', 'table', 'terminated', 'then',
+    'tinyblob', 'tinyint', 'tinytext', 'to', 'trailing', 'trigger', 'true', 'undo', 'union', 'unique', 'unlock',
+    'unsigned', 'update', 'usage', 'use', 'using', 'utc_date', 'utc_time', 'utc_timestamp', 'values', 'varbinary',
+    'varchar', 'varcharacter', 'varying', 'virtual', 'when', 'where', 'while', 'window', 'with', 'write', 'xor',
+    'year_month', 'zerofill',
+}
+
+# Reserved words that are called like ordinary functions.
+RESERVED_FUNCTIONS = {'if', 'left', 'right', 'replace', 'mod', 'database', 'schema', 'repeat', 'values',
+                      'current_date', 'current_time', 'current_timestamp', 'current_user', 'localtime',
+                      'localtimestamp', 'utc_date', 'utc_time', 'utc_timestamp'}
+
+# Functions with their own argument grammar, e.g. CAST(x AS type) or DATE_ADD(x, INTERVAL 1 DAY).
+SPECIAL_SYNTAX_FUNCTIONS = {'cast', 'convert', 'extract', 'trim', 'substring', 'substr', 'position', 'group_concat',
+                            'char', 'date_add', 'date_sub', 'adddate', 'subdate', 'get_format', 'timestampadd',
+                            'timestampdiff', 'weight_string', 'json_value', 'json_arrayagg', 'json_objectagg',
+                            'st_collect'}
+
+# Select modifiers that are not reserved but would otherwise be read as a column name.
+MODIFIER_WORDS = {'sql_cache', 'sql_no_cache', 'sql_buffer_result'}
+
+# Aggregates take exactly one argument, only COUNT(*) and COUNT(DISTINCT expr, ...) differ.
+AGGREGATE_FUNCTIONS = {'count', 'sum', 'avg', 'min', 'max', 'bit_and', 'bit_or', 'bit_xor', 'std', 'stddev',
+                       'stddev_pop', 'stddev_samp', 'var_pop', 'var_samp', 'variance'}
+DISTINCT_AGGREGATE_FUNCTIONS = {'count', 'sum', 'avg', 'min', 'max'}
+
+# The (minimum, maximum) number of arguments of the functions the parser accepts, None for any number. A call of
+# another function is left to the database.
+FUNCTION_ARITY = {
+    'abs': (1, 1), 'ascii': (1, 1), 'bin': (1, 1), 'ceil': (1, 1), 'ceiling': (1, 1), 'char_length': (1, 1),
+    'coalesce': (1, None), 'concat': (1, None), 'concat_ws': (2, None), 'connection_id': (0, 0), 'curdate': (0, 0),
+    'current_date': (0, 0), 'current_time': (0, 1), 'current_timestamp': (0, 1), 'current_user': (0, 0),
+    'curtime': (0, 1), 'database': (0, 0), 'date': (1, 1), 'date_format': (2, 2), 'datediff': (2, 2),
+    'day': (1, 1), 'dayofmonth': (1, 1), 'dayofweek': (1, 1), 'field': (2, None), 'find_in_set': (2, 2),
+    'floor': (1, 1), 'found_rows': (0, 0), 'from_unixtime': (1, 2), 'greatest': (2, None), 'hex': (1, 1),
+    'hour': (1, 1), 'if': (3, 3), 'ifnull': (2, 2), 'inet_aton': (1, 1), 'inet_ntoa': (1, 1), 'instr': (2, 2),
+    'isnull': (1, 1), 'json_array': (0, None), 'json_contains': (2, 3), 'json_extract': (2, None),
+    'json_unquote': (1, 1), 'last_insert_id': (0, 1), 'least': (2, None), 'left': (2, 2), 'length': (1, 1),
+    'locate': (2, 3), 'localtime': (0, 1), 'localtimestamp': (0, 1), 'lower': (1, 1), 'lpad': (3, 3),
+    'ltrim': (1, 1), 'md5': (1, 1), 'minute': (1, 1), 'mod': (2, 2), 'month': (1, 1), 'now': (0, 1),
+    'nullif': (2, 2), 'pow': (2, 2), 'power': (2, 2), 'rand': (0, 1), 'repeat': (2, 2), 'replace': (3, 3),
+    'reverse': (1, 1), 'right': (2, 2), 'round': (1, 2), 'row_count': (0, 0), 'rpad': (3, 3), 'rtrim': (1, 1),
+    'schema': (0, 0), 'second': (1, 1), 'sha1': (1, 1), 'sha2': (2, 2), 'sign': (1, 1), 'sqrt': (1, 1),
+    'sysdate': (0, 1), 'truncate': (2, 2), 'unhex': (1, 1), 'unix_timestamp': (0, 1), 'upper': (1, 1),
+    'utc_date': (0, 0), 'utc_time': (0, 1), 'utc_timestamp': (0, 1), 'uuid': (0, 0), 'values': (1, 1),
+    'version': (0, 0), 'week': (1, 2), 'year': (1, 1),
+}
+
+MULTI_CHAR_OPERATORS = {'<=>', '<=', '>=', '<>', '!=', '||', '&&', '<<', '>>'}
+COMPARISON_OPERATORS = {'=', '<=>', '<', '<=', '>', '>=', '<>', '!='}
+ARITHMETIC_OPERATORS = {'+', '-', '*', '/', '%', '&', '|', '^', '<<', '>>', 'div', 'mod'}
+LOGICAL_OPERATORS = {'and', 'or', 'xor', '&&', '||'}
+
+
+# The verdicts of the parser are cached, a change of the parser or of its tokenizer must not reuse them.
+with open(__file__, 'rb') as prefilter_source, open(rule_engine.__file__, 'rb') as tokenizer_source:
+    PARSER_VERSION = hashlib.sha256(prefilter_source.read() + tokenizer_source.read()).hexdigest()[:12]
+
+
+class Verdict(Enum):
+    VALID = 'Valid'
+    INVALID = 'Invalid'
+    UNCERTAIN = 'Uncertain'
+
+
+class Uncertain(Exception):
+    """Raised when a statement leaves the grammar subset understood by the prefilter."""
+
+
+def merge_operators(tokens: list):
+    merged = []
+    for token in tokens:
+        if merged and token.kind == 'punct' and merged[-1].kind == 'punct' \
+                and merged[-1].position + len(merged[-1].text) == token.position \
+                and merged[-1].text + token.text in MULTI_CHAR_OPERATORS:
+            merged[-1] = merged[-1]._replace(text=merged[-1].text + token.text)
+        else:
+            merged.append(token)
+    return merged
+
+
+def find_lexical_error(tokens: list):
+    """
+        Finds errors that make a statement invalid regardless of its grammar.
+
+        Args:
+            tokens (list): The tokens of the statement.
+
+        Returns:
+            str: A description of the error, or None.
+    """
+
+    depth = 0
+    for token in tokens:
+        if token.kind == 'unterminated':
+            return 'unterminated quoted identifier' if token.text[0] == '`' else 'unterminated string literal'
+        if token.kind == 'punct' and token.text == '(':
+            depth += 1
+        elif token.kind == 'punct' and token.text == ')':
+            depth -= 1
+            if depth < 0:
+                return 'unbalanced parentheses'
+    if depth != 0:
+        return 'unbalanced parentheses'
+    return None
+
+
+class SubsetParser:
+    """
+        A recursive descent parser for the common SELECT, INSERT, REPLACE, UPDATE and DELETE shapes of MySQL 8.0.
+
+        It accepts only statements it fully understands and raises Uncertain for anything else, so acceptance
+        means the statement is valid while a rejection says nothing about the statement.
+    """
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.pos = 0
+
+    # Token helpers
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def peek_word(self, offset=0):
+        token = self.peek(offset)
+        return token.text.lower() if token is not None and token.kind == 'word' else None
+
+    def peek_punct(self, offset=0):
+        token = self.peek(offset)
+        return token.text if token is not None and token.kind == 'punct' else None
+
+    def accept_word(self, *words):
+        if self.peek_word() in words:
+            self.pos += 1
+            return True
+        return False
+
+    def accept_punct(self, text):
+        if self.peek_punct() == text:
+            self.pos += 1
+            return True
+        return False
+
+    def expect_word(self, word):
+        if not self.accept_word(word):
+            raise Uncertain(word)
+
+    def expect_punct(self, text):
+        if not self.accept_punct(text):
+            raise Uncertain(text)
+
+    def is_identifier(self, offset=0):
+        token = self.peek(offset)
+        if token is None:
+            return False
+        if token.kind == 'word':
+            word = token.text.lower()
+            return word not in RESERVED_WORDS and word not in MODIFIER_WORDS
+        return token.kind == 'quoted'
+
+    def identifier(self):
+        if not self.is_identifier():
+            raise Uncertain('identifier')
+        self.pos += 1
+
+    def qualified_name(self):
+        self.identifier()
+        for _ in range(2):
+            if not self.accept_punct('.'):
+                break
+            self.identifier()
+
+    def alias(self, allow_string=True):
+        # A column alias may be a string literal, a table alias may not.
+        if self.accept_word('as'):
+            if allow_string and self.peek() is not None and self.peek().kind == 'string':
+                self.pos += 1
+            else:
+                self.identifier()
+        elif self.is_identifier():
+            self.identifier()
+
+    # Statements
+
+    def parse(self):
+        word = self.peek_word()
+        if word == 'select':
+            self.select_statement()
+        elif word == 'insert':
+            self.insert_statement()
+        elif word == 'replace':
+            self.insert_statement(replace=True)
+        elif word == 'update':
+            self.update_statement()
+        elif word == 'delete':
+            self.delete_statement()
+        else:
+            raise Uncertain(word)
+        self.accept_punct(';')
+        if self.peek() is not None:
+            raise Uncertain('trailing tokens')
+
+    def select_statement(self):
+        self.select_block()
+        while self.accept_word('union'):
+            self.accept_word('all', 'distinct')
+            self.select_block()
+        self.order_by_limit()
+        if self.accept_word('for'):
+            self.expect_word('update')
+        elif self.accept_word('lock'):
+            self.expect_word('in')
+            self.expect_word('share')
+            self.expect_word('mode')
+
+    def select_block(self):
+        self.expect_word('select')
+        self.accept_word('distinct', 'all')
+        self.select_list()
+        if self.accept_word('from'):
+            self.table_references()
+        if self.accept_word('where'):
+            self.expr()
+        if self.peek_word() == 'group' and self.peek_word(1) == 'by':
+            self.pos += 2
+            self.expr_list()
+            if self.peek_word() == 'with':
+                raise Uncertain('with rollup')
+        if self.accept_word('having'):
+            self.expr()
+
+    def select_list(self):
+        # A bare * is only allowed as the first item, t.* may be anywhere.
+        if self.accept_punct('*') and not self.accept_punct(','):
+            return
+        while True:
+            if self.peek_punct() == '*':
+                raise Uncertain('* after the first select item')
+            elif self.is_identifier() and self.peek_punct(1) == '.' and self.peek_punct(2) == '*':
+                self.pos += 3
+            else:
+                self.expr()
+                self.alias()
+            if not self.accept_punct(','):
+                break
+
+    def table_references(self):
+        while True:
+            self.table_factor()
+            while True:
+                # An outer join needs a join condition, an inner join may go without.
+                outer = False
+                if self.accept_word('inner', 'cross'):
+                    self.expect_word('join')
+                elif self.accept_word('left', 'right'):
+                    outer = True
+                    self.accept_word('outer')
+                    self.expect_word('join')
+                elif not self.accept_word('join'):
+                    break
+                self.table_factor()
+                if outer and self.peek_word() not in ('on', 'using'):
+                    raise Uncertain('outer join without a join condition')
+                if self.accept_word('on'):
+                    self.expr()
+                elif self.accept_word('using'):
+                    self.expect_punct('(')
+                    self.identifier_list()
+                    self.expect_punct(')')
+            if not self.accept_punct(','):
+                break
+
+    def table_factor(self):
+        if self.accept_punct('('):
+            self.select_statement()
+            self.expect_punct(')')
+            self.accept_word('as')
+            self.identifier()
+        else:
+            self.qualified_name()
+            self.alias(allow_string=False)
+
+    def order_by_limit(self, allow_offset=True):
+        if self.peek_word() == 'order' and self.peek_word(1) == 'by':
+            self.pos += 2
+            while True:
+                self.expr()
+                self.accept_word('asc', 'desc')
+                if not self.accept_punct(','):
+                    break
+        if self.accept_word('limit'):
+            self.limit_value()
+            # UPDATE and DELETE take a row count only.
+            if self.peek_punct() == ',' or self.peek_word() == 'offset':
+                if not allow_offset:
+                    raise Uncertain('limit offset')
+                self.pos += 1
+                self.limit_value()
+
+    def limit_value(self):
+        token = self.peek()
+        if token is None or token.kind != 'number' or not token.text.isdigit():
+            raise Uncertain('limit')
+        self.pos += 1
+
+    def insert_statement(self, replace=False):
+        self.pos += 1
+        if not replace:
+            self.accept_word('ignore')
+        self.accept_word('into')
+        self.qualified_name()
+        if self.accept_punct('('):
+            self.identifier_list()
+            self.expect_punct(')')
+        if self.accept_word('values', 'value'):
+            while True:
+                self.expect_punct('(')
+                if not self.accept_punct(')'):
+                    self.expr_list()
+                    self.expect_punct(')')
+                if not self.accept_punct(','):
+                    break
+        elif self.accept_word('set'):
+            self.assignments()
+        elif self.peek_word() == 'select':
+            self.select_statement()
+        else:
+            raise Uncertain('insert')
+        if self.peek_word() == 'on':
+            if replace:
+                raise Uncertain('replace on duplicate key update')
+            self.pos += 1
+            self.expect_word('duplicate')
+            self.expect_word('key')
+            self.expect_word('update')
+            self.assignments()
+
+    def update_statement(self):
+        self.pos += 1
+        self.accept_word('ignore')
+        self.qualified_name()
+        self.alias(allow_string=False)
+        self.expect_word('set')
+        self.assignments()
+        if self.accept_word('where'):
+            self.expr()
+        self.order_by_limit(allow_offset=False)
+
+    def delete_statement(self):
+        self.pos += 1
+        self.accept_word('ignore')
+        self.expect_word('from')
+        self.qualified_name()
+        if self.accept_word('where'):
+            self.expr()
+        self.order_by_limit(allow_offset=False)
+
+    def assignments(self):
+        while True:
+            self.qualified_name()
+            self.expect_punct('=')
+            self.expr()
+            if not self.accept_punct(','):
+                break
+
+    def identifier_list(self):
+        while True:
+            self.identifier()
+            if not self.accept_punct(','):
+                break
+
+    def expr_list(self):
+        count = 0
+        while True:
+            self.expr()
+            count += 1
+            if not self.accept_punct(','):
+                return count
+
+    # Expressions
+
+    def expr(self):
+        self.boolean_term()
+        while self.peek_word() in LOGICAL_OPERATORS or self.peek_punct() in LOGICAL_OPERATORS:
+            self.pos += 1
+            self.boolean_term()
+
+    def boolean_term(self):
+        if self.accept_word('not') or self.accept_punct('!'):
+            self.boolean_term()
+        else:
+            self.predicate()
+
+    def predicate(self):
+        self.arithmetic()
+        while True:
+            if self.peek_punct() in COMPARISON_OPERATORS:
+                self.pos += 1
+                if self.peek_word() in ('any', 'some', 'all'):
+                    raise Uncertain('quantified comparison')
+                self.arithmetic()
+            elif self.accept_word('is'):
+                self.accept_word('not')
+                if not self.accept_word('null', 'true', 'false', 'unknown'):
+                    raise Uncertain('is')
+            else:
+                negated = self.peek_word() == 'not'
+                word = self.peek_word(1 if negated else 0)
+                if word not in ('in', 'between', 'like', 'regexp', 'rlike'):
+                    return
+                self.pos += 2 if negated else 1
+                if word == 'in':
+                    self.expect_punct('(')
+                    if self.peek_word() == 'select':
+                        self.select_statement()
+                    else:
+                        self.expr_list()
+                    self.expect_punct(')')
+                elif word == 'between':
+                    self.arithmetic()
+                    self.expect_word('and')
+                    self.arithmetic()
+                else:
+                    self.arithmetic()
+                    if word == 'like' and self.accept_word('escape'):
+                        self.arithmetic()
+
+    def arithmetic(self):
+        self.unary()
+        while self.peek_punct() in ARITHMETIC_OPERATORS or self.peek_word() in ARITHMETIC_OPERATORS:
+            self.pos += 1
+            self.unary()
+
+    def unary(self):
+        if self.accept_punct('-') or self.accept_punct('+') or self.accept_punct('~'):
+            self.unary()
+        else:
+            self.primary()
+
+    def primary(self):
+        token = self.peek()
+        if token is None:
+            raise Uncertain('end of statement')
+        if token.kind == 'number':
+            self.pos += 1
+        elif token.kind == 'string':
+            while self.peek() is not None and self.peek().kind == 'string':
+                self.pos += 1
+        elif self.accept_word('null', 'true', 'false'):
+            pass
+        elif self.accept_punct('('):
+            if self.peek_word() == 'select':
+                self.select_statement()
+            else:
+                self.expr_list()
+            self.expect_punct(')')
+        elif self.accept_word('exists'):
+            self.expect_punct('(')
+            self.select_statement()
+            self.expect_punct(')')
+        elif self.accept_word('case'):
+            self.case_expression()
+        elif token.kind == 'word' and self.peek_punct(1) == '(':
+            self.function_call()
+        else:
+            self.qualified_name()
+
+    def case_expression(self):
+        if self.peek_word() != 'when':
+            self.expr()
+        self.expect_word('when')
+        while True:
+            self.expr()
+            self.expect_word('then')
+            self.expr()
+            if not self.accept_word('when'):
+                break
+        if self.accept_word('else'):
+            self.expr()
+        self.expect_word('end')
+
+    def function_call(self):
+        name_token = self.peek()
+        name = name_token.text.lower()
+        parenthesis = self.peek(1)
+        if name in SPECIAL_SYNTAX_FUNCTIONS or (name in RESERVED_WORDS and name not in RESERVED_FUNCTIONS):
+            raise Uncertain(name)
+        # Built-in functions need the parenthesis right after the name unless IGNORE_SPACE is set.
+        if name_token.position + len(name_token.text) != parenthesis.position:
+            raise Uncertain('space before parenthesis')
+        self.pos += 2
+        if name in AGGREGATE_FUNCTIONS:
+            self.aggregate_arguments(name)
+        else:
+            arity = FUNCTION_ARITY.get(name)
+            if arity is None:
+                raise Uncertain('arguments of ' + name)
+            count = 0 if self.peek_punct() == ')' else self.expr_list()
+            if count < arity[0] or (arity[1] is not None and count > arity[1]):
+                raise Uncertain('arguments of ' + name)
+        self.expect_punct(')')
+        if self.peek_word() == 'over':
+            raise Uncertain('window function')
+
+    def aggregate_arguments(self, name: str):
+        distinct = self.accept_word('distinct')
+        if distinct and name not in DISTINCT_AGGREGATE_FUNCTIONS:
+            raise Uncertain('distinct ' + name)
+        if name == 'count' and not distinct and self.accept_punct('*'):
+            return
+        if self.peek_punct() in ('*', ')'):
+            raise Uncertain('arguments of ' + name)
+        # COUNT(DISTINCT a, b) counts the distinct combinations, every other aggregate takes one expression.
+        if self.expr_list() != 1 and not (name == 'count' and distinct):
+            raise Uncertain('arguments of ' + name)
+
+
+def classify(query: str):
+    """
+        Classifies a statement with a local MySQL 8.0 grammar check.
+
+        Args:
+            query (str): The statement to be checked.
+
+        Returns:
+            tuple: (Verdict, reason), the reason describes why a statement is invalid or uncertain.
+    """
+
+    tokens = tokenize(query, keep_comments=True)
+    lexical_error = find_lexical_error(tokens)
+    if lexical_error:
+        return Verdict.INVALID, lexical_error
+    # Versioned comments and optimizer hints are executed, plain comments are left to the database as well.
+    if any(token.kind == 'comment' for token in tokens):
+        return Verdict.UNCERTAIN, 'comment'
+    tokens = merge_operators(tokens)
+    try:
+        SubsetParser(tokens).parse()
+    except Uncertain as e:
+        return Verdict.UNCERTAIN, str(e)
+    return Verdict.VALID, None
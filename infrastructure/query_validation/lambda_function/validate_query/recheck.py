@@ -0,0 +1,168 @@
+import os
+import zlib
+import base64
+import logging
+from boto3.dynamodb.conditions import Key
+from enums import Task, QueryLog
+from lambda_function import (get_log_table, task_table, rule_engine, update_executor, update_log_table,
+                             validate_queries)
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Log items read per Query call, they are validated together.
+RECHECK_PAGE_SIZE = int(os.environ.get("RECHECK_PAGE_SIZE", "500"))
+# Return to the state machine before the Lambda timeout, it invokes the function again from the last key.
+RECHECK_TIME_MARGIN_MS = int(os.environ.get("RECHECK_TIME_MARGIN_MS", "60000"))
+
+
+def encode_key(key: dict):
+    return {'task_bucket': key['task_bucket'], 'query_hash': base64.b64encode(key['query_hash'].value).decode()}
+
+
+def decode_key(key: dict):
+    return {'task_bucket': key['task_bucket'], 'query_hash': base64.b64decode(key['query_hash'])}
+
+
+def get_query(item: dict):
+    # Long queries are stored zlib compressed in the binary query_z attribute.
+    if 'query_z' in item:
+        return zlib.decompress(item['query_z'].value).decode()
+    return item['query']
+
+
+def recheck_page(items: list):
+    """
+        Validates a page of log items again and updates their status, message and rule ids.
+
+        Args:
+            items (list): The log items with their key and query.
+
+        Returns:
+            tuple: The number of checked and failed items, and the number of failed items by target.
+    """
+
+    log_records = []
+    for item in items:
+        key = {'task_bucket': item['task_bucket'], 'query_hash': item['query_hash'].value}
+        log_records.append((key, get_query(item)))
+
+    results = validate_queries({key['query_hash']: query for key, query in log_records})
+
+    log_items = []
+    failed_count = 0
+    target_failed_counts = {}
+    for key, query in log_records:
+        result = results[key['query_hash']]
+        if result['status'] == QueryLog.FAILED.value:
+            failed_count += 1
+        for target_name, target_result in result['target_results'].items():
+            target_failed_counts.setdefault(target_name, 0)
+            if target_result['status'] == QueryLog.FAILED.value:
+                target_failed_counts[target_name] += 1
+        log_items.append({"key": key, "message": result['message'], "status": result['status'],
+                          "rule_ids": result['rule_ids'], "risk_ids": result['risk_ids'],
+                          "risk_message": result['risk_message'], "target_results": result['target_results']})
+    # Validated items are overwritten with the result of the current rules.
+    list(update_executor.map(lambda log_item: update_log_table(log_item, first_only=False), log_items))
+    return len(log_items), failed_count, target_failed_counts
+
+
+def recheck_bucket(event: dict, context):
+    """
+        Rechecks the log items of one bucket of a task, from the last key of the previous invocation.
+
+        Args:
+            event (dict): The task_id, bucket, the counts so far and the last_key of the previous invocation.
+            context: The Lambda context.
+
+        Returns:
+            dict: The event with the updated counts and last_key, done is true when the bucket is complete.
+    """
+
+    task_id = event['task_id']
+    checked_count = event.get('checked', 0)
+    failed_count = event.get('failed', 0)
+    target_failed_counts = event.get('target_failed') or {}
+    query_kwargs = {
+        'KeyConditionExpression': Key('task_bucket').eq('{}#{}'.format(task_id, event['bucket'])),
+        'ProjectionExpression': 'task_bucket, query_hash, #query, query_z',
+        'ExpressionAttributeNames': {'#query': 'query'},
+        'Limit': RECHECK_PAGE_SIZE,
+    }
+    if event.get('last_key'):
+        query_kwargs['ExclusiveStartKey'] = decode_key(event['last_key'])
+
+    done = False
+    last_key = event.get('last_key')
+    while context.get_remaining_time_in_millis() > RECHECK_TIME_MARGIN_MS:
+        response = get_log_table().query(**query_kwargs)
+        page_checked, page_failed, page_target_failed = recheck_page(response['Items'])
+        checked_count += page_checked
+        failed_count += page_failed
+        for target_name, target_failed_count in page_target_failed.items():
+            target_failed_counts[target_name] = target_failed_counts.get(target_name, 0) + target_failed_count
+
+        if 'LastEvaluatedKey' not in response:
+            done = True
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        last_key = encode_key(response['LastEvaluatedKey'])
+
+    return {'task_id': task_id, 'bucket': event['bucket'], 'checked': checked_count, 'failed': failed_count,
+            'target_failed': target_failed_counts, 'last_key': last_key, 'done': done}
+
+
+def finish_recheck(event: dict):
+    """
+        Sets the counters of a task to the totals of the rechecked buckets and restores the task status.
+
+        The counters are set rather than incremented so that a repeated recheck gives the same result. Restoring
+        the Stopped or Finished status regenerates the report through the task table stream.
+
+        Args:
+            event (dict): The task_id and the results of all buckets.
+
+        Returns:
+            dict: The task_id with its checked and failed counts.
+    """
+
+    task_id = event['task_id']
+    checked_count = sum(bucket['checked'] for bucket in event['buckets'])
+    failed_count = sum(bucket['failed'] for bucket in event['buckets'])
+    target_failed_counts = {}
+    for bucket in event['buckets']:
+        for target_name, target_failed_count in (bucket.get('target_failed') or {}).items():
+            target_failed_counts[target_name] = target_failed_counts.get(target_name, 0) + target_failed_count
+
+    # The report segments do not hold the results of the recheck, the report is exported from the failed index.
+    update_expression = 'SET checked_query = :check_value, failed_query = :fail_value, #stat = recheck_from, ' \
+                        'rule_catalog_version = :version, report_segments_stale = :stale'
+    expression_attribute_names = {'#stat': 'status'}
+    expression_attribute_values = {
+        ':check_value': checked_count,
+        ':fail_value': failed_count,
+        ':version': rule_engine.version,
+        ':rechecking': Task.RECHECKING.value,
+        ':stale': True
+    }
+    for index, (target_name, target_failed_count) in enumerate(target_failed_counts.items()):
+        update_expression += ', #tf{0} = :tf{0}'.format(index)
+        expression_attribute_names['#tf{}'.format(index)] = 'failed_query_' + target_name
+        expression_attribute_values[':tf{}'.format(index)] = target_failed_count
+
+    task_table.update_item(
+        Key={'task_id': task_id},
+        UpdateExpression=update_expression + ' REMOVE recheck_from',
+        ConditionExpression='#stat = :rechecking',
+        ExpressionAttributeNames=expression_attribute_names,
+        ExpressionAttributeValues=expression_attribute_values
+    )
+    logger.info("Task " + task_id + " rechecked, checked = " + str(checked_count) + ", failed = " + str(failed_count))
+    return {'task_id': task_id, 'checked': checked_count, 'failed': failed_count}
+
+
+def lambda_handler(event, context):
+    if event.get('action') == 'finish':
+        return finish_recheck(event)
+    return recheck_bucket(event, context)
@@ -0,0 +1,55 @@
+import io
+import csv
+import gzip
+import time
+import uuid
+
+# Segments are partitioned by the hour they were written in, the report compacts the hours that are closed.
+SEGMENT_KEY = 'failed_reports/id={}/segments/hour={}/{}-{}-{}.csv.gz'
+
+
+def build_report_row(task_id: str, log_item: dict, target_names: list):
+    """
+        Builds the row of a failed log item, in the column order of the failed query report.
+
+        Args:
+            task_id (str): The ID of the task.
+            log_item (dict): The log item with its query, src, src_port, message and the result of each target.
+            target_names (list): The names of the validation targets, in the order of the report columns.
+
+        Returns:
+            list: The report row.
+    """
+
+    row = [task_id, log_item['query'].replace("\"", ""), log_item['src'], log_item['src_port'],
+           log_item['message'].replace("\"", "")]
+    for target_name in target_names:
+        row.append(log_item['target_results'].get(target_name, {}).get('status', log_item['status']))
+    return row
+
+
+def write_segment(s3, bucket_name: str, task_id: str, rows: list):
+    """
+        Writes the failed rows of a task as a gzip compressed report segment.
+
+        The number of rows is part of the key, so the report can count the rows of the segments without reading
+        them and compare it with the failed_query counter of the task.
+
+        Args:
+            s3: The S3 client.
+            bucket_name (str): The report bucket.
+            task_id (str): The ID of the task.
+            rows (list): The report rows.
+
+        Returns:
+            str: The key of the segment.
+    """
+
+    page = io.StringIO()
+    csv.writer(page, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL).writerows(rows)
+    now = time.time()
+    key = SEGMENT_KEY.format(task_id, time.strftime('%Y%m%d%H', time.gmtime(now)), int(now * 1000),
+                             uuid.uuid4().hex, len(rows))
+    s3.put_object(Bucket=bucket_name, Key=key, Body=gzip.compress(page.getvalue().encode()),
+                  ContentType='application/gzip')
+    return key
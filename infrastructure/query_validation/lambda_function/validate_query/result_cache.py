@@ -0,0 +1,112 @@
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+# Keys per BatchGetItem request.
+BATCH_GET_SIZE = 100
+
+
+class ResultCache:
+    """
+        Validation results shared by all tasks, an in-container LRU in front of a DynamoDB table with TTL.
+
+        A result is only valid for the same target engine version, rule catalog version and local parser version,
+        all are part of the cache key. Failures of the cache table are logged and treated as misses, they never fail a validation.
+
+        Args:
+            dynamodb: The boto3 DynamoDB service resource.
+            table_name (str): The name of the result cache table.
+            engine_version (str): The engine version of the validation database.
+            catalog_version (str): The version of the rule catalog.
+            parser_version (str): The version of the local parser, whose verdicts are cached too.
+            ttl_seconds (int): The lifetime of a cached result in the table.
+            local_size (int): The maximum number of results kept in the container.
+    """
+
+    def __init__(self, dynamodb, table_name: str, engine_version: str, catalog_version: str, parser_version: str,
+                 ttl_seconds: int, local_size: int):
+        self.dynamodb = dynamodb
+        self.table = dynamodb.Table(table_name)
+        self.table_name = table_name
+        self.prefix = '{}#{}#{}#'.format(engine_version, catalog_version, parser_version)
+        self.ttl_seconds = ttl_seconds
+        self.local_size = local_size
+        self.local = OrderedDict()
+
+    def key(self, query_hash: bytes):
+        return self.prefix + query_hash.hex()
+
+    def remember(self, cache_key: str, result: dict):
+        self.local[cache_key] = result
+        self.local.move_to_end(cache_key)
+        if len(self.local) > self.local_size:
+            self.local.popitem(last=False)
+
+    def get_many(self, cache_keys: list):
+        """
+            Looks up the results of cache keys, first in the container and then in the cache table.
+
+            Args:
+                cache_keys (list): The cache keys to be looked up.
+
+            Returns:
+                tuple: A dict of the found results by cache key, and the number of results found in the container.
+        """
+
+        results = {}
+        missing = []
+        for cache_key in dict.fromkeys(cache_keys):
+            if cache_key in self.local:
+                self.local.move_to_end(cache_key)
+                results[cache_key] = self.local[cache_key]
+            else:
+                missing.append(cache_key)
+        local_hits = len(results)
+
+        try:
+            for i in range(0, len(missing), BATCH_GET_SIZE):
+                request = {self.table_name: {
+                    'Keys': [{'cache_key': cache_key} for cache_key in missing[i:i + BATCH_GET_SIZE]],
+                    'ProjectionExpression': 'cache_key, #stat, message, rule_ids, risk_ids, risk_message',
+                    'ExpressionAttributeNames': {'#stat': 'status'},
+                }}
+                while request:
+                    response = self.dynamodb.batch_get_item(RequestItems=request)
+                    for item in response['Responses'].get(self.table_name, []):
+                        result = {'status': item['status'], 'message': item['message'],
+                                  'rule_ids': list(item['rule_ids']), 'risk_ids': list(item.get('risk_ids', [])),
+                                  'risk_message': item.get('risk_message', '')}
+                        results[item['cache_key']] = result
+                        self.remember(item['cache_key'], result)
+                    request = response.get('UnprocessedKeys')
+        except Exception as e:
+            logger.error("Get result cache items failed!")
+            logger.error(e)
+
+        return results, local_hits
+
+    def put_many(self, results: dict):
+        """
+            Stores validation results in the container and in the cache table.
+
+            Args:
+                results (dict): The results with their status, message, rule ids and performance risks by cache key.
+
+            Returns:
+                None
+        """
+
+        expire_at = int(time.time()) + self.ttl_seconds
+        try:
+            with self.table.batch_writer(overwrite_by_pkeys=['cache_key']) as batch:
+                for cache_key, result in results.items():
+                    self.remember(cache_key, result)
+                    batch.put_item(Item={'cache_key': cache_key, 'status': result['status'],
+                                         'message': result['message'], 'rule_ids': result['rule_ids'],
+                                         'risk_ids': result['risk_ids'], 'risk_message': result['risk_message'],
+                                         'expire_at': expire_at})
+        except Exception as e:
+            logger.error("Put result cache items failed!")
+            logger.error(e)
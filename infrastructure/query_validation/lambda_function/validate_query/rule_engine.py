@@ -0,0 +1,195 @@
+import re
+import json
+import hashlib
+from collections import namedtuple
+
+# One pass over the query, string literals, quoted identifiers and comments are single tokens so that rules never
+# match inside them. A literal or identifier without its closing quote is an unterminated token up to the end.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<quoted>`(?:[^`]|``)*`)
+  | (?P<unterminated>['"`].*)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+  | (?P<word>[A-Za-z_$\u0080-\uffff][\w$\u0080-\uffff]*)
+  | (?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Words ending the expression list of a GROUP BY clause at the same parenthesis depth.
+GROUP_BY_END_WORDS = {'having', 'order', 'limit', 'window', 'union', 'procedure', 'into', 'for', 'lock'}
+
+# Words before a parenthesis that opens a derived table.
+DERIVED_TABLE_WORDS = {'from', 'join'}
+
+# Rules of the performance category do not fail a query, their findings are reported as risks.
+COMPATIBILITY = 'compatibility'
+PERFORMANCE = 'performance'
+
+Token = namedtuple('Token', ['kind', 'text', 'position'])
+Finding = namedtuple('Finding', ['rule_id', 'text', 'position'])
+
+
+def tokenize(query: str, keep_comments: bool = False):
+    """
+        Splits a query into tokens, whitespace and comments are dropped.
+
+        Args:
+            query (str): The SQL query.
+            keep_comments (bool): Keep the comment tokens.
+
+        Returns:
+            list: A list of Token(kind, text, position), kind is one of string, quoted, unterminated, number, word
+                  and punct, or comment if keep_comments is set.
+    """
+
+    return [Token(match.lastgroup, match.group(), match.start()) for match in TOKEN_PATTERN.finditer(query)
+            if match.lastgroup != 'space' and (keep_comments or match.lastgroup != 'comment')]
+
+
+class RuleEngine:
+    """
+        Evaluates a declarative catalog of compatibility rules on queries in a single tokenized pass.
+
+        Rule types:
+            function: a call of one of the names, e.g. PASSWORD(...).
+            keyword: one of the words used unquoted, not after a '.' of a qualified name.
+            group_by_order: one of the words inside a GROUP BY expression list, e.g. GROUP BY a DESC.
+            group_by_without_order: a GROUP BY of the outermost query without an ORDER BY, 8.0 no longer sorts it.
+            derived_table: a subquery in a FROM or JOIN clause.
+
+        A rule is of the compatibility category unless it sets "category": "performance", performance rules have a
+        weight that ranks their findings in the report.
+
+        Args:
+            catalog (dict): The rule catalog with its version and rules.
+    """
+
+    def __init__(self, catalog: dict):
+        # The content hash changes with every edit of the catalog, the cached results of older catalogs are not used.
+        digest = hashlib.sha256(json.dumps(catalog, sort_keys=True).encode()).hexdigest()[:12]
+        self.version = '{}-{}'.format(catalog['version'], digest)
+        self.rules = catalog['rules']
+        self.functions = {}
+        self.keywords = {}
+        self.group_by_words = {}
+        self.group_by_without_order = None
+        self.derived_table = None
+        self.performance_rules = {rule['id']: rule.get('weight', 1) for rule in self.rules
+                                  if rule.get('category', COMPATIBILITY) == PERFORMANCE}
+        for rule in self.rules:
+            if rule['type'] == 'function':
+                self.functions.update({name: rule['id'] for name in rule['names']})
+            elif rule['type'] == 'keyword':
+                self.keywords.update({word: rule['id'] for word in rule['words']})
+            elif rule['type'] == 'group_by_order':
+                self.group_by_words.update({word: rule['id'] for word in rule['words']})
+            elif rule['type'] == 'group_by_without_order':
+                self.group_by_without_order = rule['id']
+            elif rule['type'] == 'derived_table':
+                self.derived_table = rule['id']
+            else:
+                raise ValueError("Unknown rule type {} of rule {}".format(rule['type'], rule['id']))
+
+    @classmethod
+    def from_file(cls, path: str):
+        with open(path) as catalog_file:
+            return cls(json.load(catalog_file))
+
+    def evaluate(self, query: str):
+        """
+            Evaluates all rules on a query.
+
+            Args:
+                query (str): The SQL query to be checked.
+
+            Returns:
+                list: A list of Finding(rule_id, text, position) in query order.
+        """
+
+        findings = []
+        tokens = tokenize(query)
+        depth = 0
+        group_by_depth = None
+        # The GROUP BY of the outermost query block while no ORDER BY follows it.
+        unordered_group_by = None
+        previous = None
+
+        for i, token in enumerate(tokens):
+            if token.kind == 'punct':
+                if token.text == '(':
+                    depth += 1
+                elif token.text == ')':
+                    depth -= 1
+                    if group_by_depth is not None and depth < group_by_depth:
+                        group_by_depth = None
+                elif token.text == ';':
+                    group_by_depth = None
+                    if unordered_group_by is not None:
+                        findings.append(Finding(self.group_by_without_order, unordered_group_by.text,
+                                                unordered_group_by.position))
+                        unordered_group_by = None
+            elif token.kind == 'word' and not (previous is not None and previous.text == '.'):
+                word = token.text.lower()
+                following = tokens[i + 1] if i + 1 < len(tokens) else None
+
+                if word in self.functions and following is not None and following.text == '(':
+                    findings.append(Finding(self.functions[word], token.text, token.position))
+                if word in self.keywords:
+                    findings.append(Finding(self.keywords[word], token.text, token.position))
+                if group_by_depth is not None and depth == group_by_depth:
+                    if word in self.group_by_words:
+                        findings.append(Finding(self.group_by_words[word], token.text, token.position))
+                    elif word in GROUP_BY_END_WORDS:
+                        group_by_depth = None
+                if word == 'group' and following is not None and following.text.lower() == 'by':
+                    group_by_depth = depth
+                    # Only the order of the outermost query block reaches the client.
+                    if self.group_by_without_order is not None and depth == 0:
+                        unordered_group_by = token
+                if word == 'order' and following is not None and following.text.lower() == 'by' and depth == 0:
+                    unordered_group_by = None
+                if (word == 'select' and self.derived_table is not None and i >= 2 and previous.text == '('
+                        and tokens[i - 2].kind == 'word' and tokens[i - 2].text.lower() in DERIVED_TABLE_WORDS):
+                    findings.append(Finding(self.derived_table, tokens[i - 2].text + ' (' + token.text,
+                                            previous.position))
+            previous = token
+
+        if unordered_group_by is not None:
+            findings.append(Finding(self.group_by_without_order, unordered_group_by.text, unordered_group_by.position))
+        findings.sort(key=lambda finding: finding.position)
+        return findings
+
+    def is_performance_risk(self, finding: Finding):
+        return finding.rule_id in self.performance_rules
+
+    def weigh(self, rule_ids: list):
+        """
+            Returns the weight of a query with performance risk findings, the sum of the weights of its rules.
+
+            Args:
+                rule_ids (list): The IDs of the performance rules found in the query.
+
+            Returns:
+                int: The weight of the query, 0 without performance risks.
+        """
+
+        return sum(self.performance_rules.get(rule_id, 0) for rule_id in rule_ids)
+
+    def describe(self, findings: list):
+        """
+            Formats findings as a log item message, one part per rule in catalog order.
+
+            Args:
+                findings (list): The findings returned by evaluate.
+
+            Returns:
+                str: The message, e.g. "Query contains 8.0 keywords without ``: ['rank']; ".
+        """
+
+        message = ''
+        for rule in self.rules:
+            texts = [finding.text for finding in findings if finding.rule_id == rule['id']]
+            if texts:
+                message = message + '{}: {}; '.format(rule['message'], texts)
+        return message
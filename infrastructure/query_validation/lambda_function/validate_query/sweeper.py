@@ -0,0 +1,141 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key
+from lambda_function import (METRIC_NAMESPACE, get_log_table, task_table, validate_queries, update_task,
+                             flush_task_counters)
+from recheck import get_query
+from metrics import put_metrics
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+LOG_TABLE_GSI = os.environ.get("DDB_LOG_TABLE_GSI")
+TASK_TABLE_GSI = os.environ.get("DDB_TASK_TABLE_GSI")
+LOG_TABLE_BUCKETS = int(os.environ.get("LOG_TABLE_BUCKETS", "1"))
+# Items younger than the grace period are left to the stream.
+SWEEPER_GRACE_SECONDS = int(os.environ.get("SWEEPER_GRACE_SECONDS", "300"))
+# Pending items read per Query call and bucket.
+SWEEPER_PAGE_SIZE = int(os.environ.get("SWEEPER_PAGE_SIZE", "200"))
+# Buckets read concurrently.
+SWEEPER_CONCURRENCY = int(os.environ.get("SWEEPER_CONCURRENCY", "8"))
+# Return before the Lambda timeout, a task that is not completely swept is continued by the next invocation.
+SWEEPER_TIME_MARGIN_MS = int(os.environ.get("SWEEPER_TIME_MARGIN_MS", "60000"))
+
+sweep_executor = ThreadPoolExecutor(max_workers=SWEEPER_CONCURRENCY)
+
+
+def get_active_tasks():
+    """
+        Returns the IDs of the tasks that are capturing queries, from the in-progress index of the task table.
+
+        Returns:
+            list: The task IDs.
+    """
+
+    task_ids = []
+    query_kwargs = {
+        'IndexName': TASK_TABLE_GSI,
+        'KeyConditionExpression': Key('in_progress').eq(1),
+        'ProjectionExpression': 'task_id',
+    }
+    while True:
+        response = task_table.query(**query_kwargs)
+        task_ids.extend(item['task_id'] for item in response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return task_ids
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def read_pending_page(page_request: dict):
+    """
+        Reads a page of the pending items of one bucket of a task.
+
+        Args:
+            page_request (dict): The task_bucket, the cutoff epoch and the last key of the previous page.
+
+        Returns:
+            tuple: The pending items and the last evaluated key, None when the bucket is complete.
+    """
+
+    query_kwargs = {
+        'IndexName': LOG_TABLE_GSI,
+        'KeyConditionExpression': Key('pending_bucket').eq(page_request['task_bucket']) &
+                                  Key('pending_since').lt(page_request['cutoff']),
+        'Limit': SWEEPER_PAGE_SIZE,
+    }
+    if page_request.get('last_key'):
+        query_kwargs['ExclusiveStartKey'] = page_request['last_key']
+
+    response = get_log_table().query(**query_kwargs)
+    return response['Items'], response.get('LastEvaluatedKey')
+
+
+def sweep_task(task_id: str, grace_seconds: int, context):
+    """
+        Validates the log items of a task that are still pending after the grace period.
+
+        The buckets of the task are read concurrently and the pending items of a round are validated together.
+        The log items are updated conditionally, items validated by the stream in the meantime are not counted again.
+
+        Args:
+            task_id (str): The ID of the task to be swept.
+            grace_seconds (int): The minimum age of a pending item.
+            context: The Lambda context.
+
+        Returns:
+            tuple: The number of swept items, and whether all buckets of the task are complete.
+    """
+
+    cutoff = int(time.time()) - grace_seconds
+    page_requests = [{'task_bucket': '{}#{}'.format(task_id, bucket), 'cutoff': cutoff}
+                     for bucket in range(LOG_TABLE_BUCKETS)]
+    counters = {}
+
+    while page_requests and context.get_remaining_time_in_millis() > SWEEPER_TIME_MARGIN_MS:
+        log_records = []
+        next_requests = []
+        for page_request, (items, last_key) in zip(page_requests,
+                                                    sweep_executor.map(read_pending_page, page_requests)):
+            for item in items:
+                key = {'task_bucket': item['task_bucket'], 'query_hash': item['query_hash'].value}
+                log_records.append((key, get_query(item)))
+            if last_key:
+                next_requests.append(dict(page_request, last_key=last_key))
+        page_requests = next_requests
+
+        results = validate_queries({key['query_hash']: query for key, query in log_records})
+        log_items = []
+        for key, query in log_records:
+            result = results[key['query_hash']]
+            log_items.append({"key": key, "message": result['message'], "status": result['status'],
+                              "rule_ids": result['rule_ids'], "risk_ids": result['risk_ids'],
+                              "risk_message": result['risk_message'], "target_results": result['target_results']})
+        update_task(task_id, log_items, counters)
+
+    swept_count = counters.get(task_id, [0])[0]
+    flush_task_counters(counters)
+    if swept_count:
+        logger.info("Task " + task_id + " swept, validated = " + str(swept_count))
+    return swept_count, not page_requests
+
+
+def lambda_handler(event, context):
+    # The cleanup state machine sweeps a single task before its report, the schedule sweeps all active tasks.
+    if event.get('task_id'):
+        task_ids = [event['task_id']]
+        grace_seconds = int(event.get('grace_seconds', 0))
+    else:
+        task_ids = get_active_tasks()
+        grace_seconds = SWEEPER_GRACE_SECONDS
+
+    swept_count = 0
+    done = True
+    for task_id in task_ids:
+        task_swept, task_done = sweep_task(task_id, grace_seconds, context)
+        swept_count += task_swept
+        done = done and task_done
+
+    put_metrics(METRIC_NAMESPACE, {'SweptItems': swept_count})
+    return {'task_id': event.get('task_id'), 'swept': swept_count, 'done': done}
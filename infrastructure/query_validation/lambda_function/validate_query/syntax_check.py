@@ -0,0 +1,113 @@
+import time
+
+from connection_pool import is_infrastructure_error
+
+DIGEST_FUNCTION = 'STATEMENT_DIGEST_TEXT(%s)'
+
+# Keep a batch well below max_allowed_packet of the validation database.
+MAX_BATCH_BYTES = 1024 * 1024
+
+
+def build_batch_command(count: int):
+    """
+        Builds a multi-column SELECT that parses count statements in one round trip.
+
+        Args:
+            count (int): The number of statements in the batch.
+
+        Returns:
+            str: The SELECT statement with one STATEMENT_DIGEST_TEXT column per statement.
+    """
+
+    return 'SELECT ' + ', '.join([DIGEST_FUNCTION] * count)
+
+
+def split_batches(queries: list, batch_size: int):
+    """
+        Splits queries into (start, end) index ranges of at most batch_size statements and MAX_BATCH_BYTES bytes.
+
+        Args:
+            queries (list): The statements to be checked.
+            batch_size (int): The maximum number of statements per batch.
+
+        Returns:
+            list: A list of (start, end) tuples.
+    """
+
+    batches = []
+    start = 0
+    batch_bytes = 0
+    for index, query in enumerate(queries):
+        query_bytes = len(query.encode())
+        if index > start and (index - start >= batch_size or batch_bytes + query_bytes > MAX_BATCH_BYTES):
+            batches.append((start, index))
+            start = index
+            batch_bytes = 0
+        batch_bytes += query_bytes
+    if start < len(queries):
+        batches.append((start, len(queries)))
+    return batches
+
+
+def check_range(cursor, queries: list, start: int, end: int, results: list, latencies: list = None):
+    """
+        Checks queries[start:end] in one statement, bisecting the range when the batch fails.
+
+        STATEMENT_DIGEST_TEXT raises the same error for a statement whether it is parsed alone or as one
+        column of a batch, so the message stored for an isolated statement is unchanged. Infrastructure errors
+        are not attributed to the statements and are raised to the caller. The round trip of the whole range is
+        appended to latencies, the bisection round trips of a failed batch are not, so syntax errors do not make
+        the database look slow.
+
+        Args:
+            cursor: An open database cursor.
+            queries (list): The statements to be checked.
+            start (int): The first index of the range.
+            end (int): The index after the last statement of the range.
+            results (list): The list receiving the error message, or None, of each statement.
+            latencies (list): The list receiving the round trip seconds of the range, or None.
+
+        Returns:
+            None
+    """
+
+    started = time.time()
+    error = None
+    try:
+        cursor.execute(build_batch_command(end - start), queries[start:end])
+        cursor.fetchall()
+    except Exception as e:
+        if is_infrastructure_error(e):
+            raise
+        error = e
+    if latencies is not None:
+        latencies.append(time.time() - started)
+    if error is None:
+        return
+    if end - start == 1:
+        results[start] = str(error)
+        return
+    middle = (start + end) // 2
+    check_range(cursor, queries, start, middle, results)
+    check_range(cursor, queries, middle, end, results)
+
+
+def check_syntax_batch(conn, queries: list, batch_size: int = 25, latencies: list = None):
+    """
+        Checks the MySQL syntax of many statements with one round trip per batch.
+
+        Args:
+            conn: An open pymysql connection to the validation database.
+            queries (list): The statements to be checked.
+            batch_size (int): The maximum number of statements per round trip.
+            latencies (list): The list receiving the round trip seconds of each batch, bisections excluded, or None.
+
+        Returns:
+            list: The error message of each statement, or None if the statement is valid.
+    """
+
+    results = [None] * len(queries)
+    with conn.cursor() as cursor:
+        for start, end in split_batches(queries, batch_size):
+            check_range(cursor, queries, start, end, results, latencies)
+    return results
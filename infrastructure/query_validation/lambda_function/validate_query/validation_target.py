@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ValidationTarget:
+    """
+        A validation database the captured queries are checked against.
+
+        Every target has its own connection pool, adaptive limiter, circuit breaker and result cache, so a slow or
+        unavailable target does not throttle the others and results are only shared between tasks of the same
+        engine version.
+
+        Args:
+            name (str): The name of the target, used in the log items, the task counters and the report.
+            engine_version (str): The engine version of the target database.
+            pool (ConnectionPool): The connections to the target database.
+            limiter (AdaptiveLimiter): The budget of statements in flight against the target.
+            breaker (CircuitBreaker): Fails fast while the target is unavailable.
+            result_cache (ResultCache): The cached validation results of the target.
+            prefilter (bool): Whether the local MySQL 8.0 parser may decide statements for the target.
+    """
+
+    def __init__(self, name: str, engine_version: str, pool, limiter, breaker, result_cache, prefilter: bool):
+        self.name = name
+        self.engine_version = engine_version
+        self.pool = pool
+        self.limiter = limiter
+        self.breaker = breaker
+        self.result_cache = result_cache
+        self.prefilter = prefilter
+        self.executor = ThreadPoolExecutor(max_workers=pool.size)
@@ -1,5 +1,6 @@
 from aws_cdk import (
     aws_ec2 as ec2,
+    aws_apigateway,
 )
 from constructs import (
     Construct,
@@ -7,33 +8,53 @@ from constructs import (
 )
 from infrastructure.query_validation.aurora.stack import Aurora
 from infrastructure.query_validation.lambda_function.stack import LambdaFunction
+from infrastructure.query_validation.step_function.stack import RecheckStepFunction
+from infrastructure.query_validation.api_method.stack import RecheckApiMethod
 from infrastructure.shared_infrastructure import shared_infrastructure_construct
 
 
 class QueryValidationConstruct(Construct):
     def __init__(self, scope: Construct, construct_id: str, params: dict, vpc: ec2.Vpc, private_subnets,
                  sg: ec2.SecurityGroup, s3_bucket=shared_infrastructure_construct.Bucket,
-                 dynamodb=shared_infrastructure_construct.DynamoDBTables, **kwargs) -> None:
+                 dynamodb=shared_infrastructure_construct.DynamoDBTables, api: aws_apigateway.RestApi = None,
+                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
-        aurora = Aurora(self, "aurora_for_validation",
-                        env_name=params['env_name'],
-                        vpc=vpc,
-                        sg=sg,
-                        private_subnets=private_subnets
-                        )
+        # One validation cluster per target, every captured query is validated against all of them.
+        if not params['validation_targets'] or not all(target.get('name') and target.get('engine_version')
+                                                       for target in params['validation_targets']):
+            raise ValueError("validation_targets must configure at least one <name>=<engine version> target")
+        validation_targets = []
+        for index, target in enumerate(params['validation_targets']):
+            aurora = Aurora(self, "aurora_for_validation" if index == 0 else "aurora_for_validation_" + target['name'],
+                            env_name=params['env_name'],
+                            vpc=vpc,
+                            sg=sg,
+                            private_subnets=private_subnets,
+                            engine_version=target['engine_version'],
+                            target_name=None if index == 0 else target['name']
+                            )
+            validation_targets.append((target['name'], aurora))
 
         lambda_function = LambdaFunction(self, 'function_for_validation', params=params,
                                          vpc=vpc,
                                          sg=sg,
                                          private_subnets=private_subnets,
-                                         aurora_proxy=aurora.proxy,
+                                         validation_targets=validation_targets,
                                          s3_bucket=s3_bucket.bucket,
                                          log_table=dynamodb.log_table,
                                          task_table=dynamodb.task_table,
+                                         result_cache_table=dynamodb.result_cache_table,
                                          ddb_log_table_source=dynamodb.log_table_source,
                                          ddb_task_table_source=dynamodb.task_table_update_ddb_source,
                                          )
 
+        recheck_step_function = RecheckStepFunction(self, "recheck_step_function", params=params,
+                                                    recheck_function=lambda_function.recheck_function)
+
+        RecheckApiMethod(self, "recheck_api_method", env_name=params['env_name'], api=api,
+                         recheck_state_machine=recheck_step_function.recheck_step_function)
+
         aurora_and_lambda_group = DependencyGroup()
-        aurora_and_lambda_group.add(aurora)
+        for _, aurora in validation_targets:
+            aurora_and_lambda_group.add(aurora)
         aurora_and_lambda_group.add(lambda_function)
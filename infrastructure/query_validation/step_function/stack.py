@@ -0,0 +1,270 @@
+import json
+from aws_cdk import (
+    aws_stepfunctions as sfn,
+    aws_lambda,
+    aws_iam as iam
+)
+from constructs import Construct
+
+
+class RecheckStepFunction(Construct):
+    def __init__(self, scope: Construct, construct_id: str, params: dict, recheck_function: aws_lambda.Function,
+                 **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        env_name = params['env_name']
+        region = params["region"]
+        account = params["account"]
+        check_task_table_name = params["check_task_table_name"]
+
+        # Create policy document
+        policy = iam.Policy(
+            self,
+            "RecheckStepFunctionPolicy-{}".format(env_name),
+            policy_name="recheck-step-function-policy-{}".format(env_name),
+            statements=[
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=['dynamodb:UpdateItem'],
+                    resources=[f'arn:aws:dynamodb:{region}:{account}:table/{check_task_table_name}'],
+                ),
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=['lambda:InvokeFunction'],
+                    resources=[f'{recheck_function.function_arn}:*', recheck_function.function_arn],
+                )
+            ]
+        )
+
+        role = iam.Role(self, "RecheckStepFunctionRole-{}".format(env_name),
+                        role_name="recheck-step-function-role-{}".format(env_name),
+                        assumed_by=iam.ServicePrincipal("states.amazonaws.com")
+                        )
+
+        role.attach_inline_policy(policy)
+
+        recheck_function_definition = '''
+            {
+              "Comment": "Validates the stored queries of a stopped or finished task again with the current rules",
+              "StartAt": "Start recheck",
+              "States": {
+                "Start recheck": {
+                  "Type": "Task",
+                  "Resource": "arn:aws:states:::dynamodb:updateItem",
+                  "Parameters": {
+                    "TableName": "check_task",
+                    "Key": {
+                      "task_id": {
+                        "S.$": "$.task_id"
+                      }
+                    },
+                    "UpdateExpression": "SET #s = :rechecking, recheck_from = #s, recheck_time = :time REMOVE report_s3_key, risk_report_s3_key, summary_report_s3_key, report_export, report_export_error, corpus_s3_uri, corpus_export, corpus_export_error",
+                    "ConditionExpression": "#s IN (:stopped, :finished)",
+                    "ExpressionAttributeNames": {
+                      "#s": "status"
+                    },
+                    "ExpressionAttributeValues": {
+                      ":rechecking": {
+                        "S": "Rechecking"
+                      },
+                      ":stopped": {
+                        "S": "Stopped"
+                      },
+                      ":finished": {
+                        "S": "Finished"
+                      },
+                      ":time": {
+                        "S.$": "$$.State.EnteredTime"
+                      }
+                    }
+                  },
+                  "Catch": [
+                    {
+                      "ErrorEquals": [
+                        "DynamoDB.ConditionalCheckFailedException"
+                      ],
+                      "Next": "Task not stopped or finished"
+                    }
+                  ],
+                  "Next": "List buckets",
+                  "ResultPath": null
+                },
+                "Task not stopped or finished": {
+                  "Type": "Fail",
+                  "Error": "TaskNotRecheckable",
+                  "Cause": "Only a Stopped or Finished task can be rechecked."
+                },
+                "List buckets": {
+                  "Type": "Pass",
+                  "Parameters": {
+                    "task_id.$": "$.task_id",
+                    "buckets.$": "States.ArrayRange(0, 15, 1)"
+                  },
+                  "Next": "Recheck buckets"
+                },
+                "Recheck buckets": {
+                  "Type": "Map",
+                  "MaxConcurrency": 16,
+                  "ItemsPath": "$.buckets",
+                  "ItemSelector": {
+                    "task_id.$": "$.task_id",
+                    "bucket.$": "$$.Map.Item.Value"
+                  },
+                  "ItemProcessor": {
+                    "ProcessorConfig": {
+                      "Mode": "INLINE"
+                    },
+                    "StartAt": "Recheck bucket",
+                    "States": {
+                      "Recheck bucket": {
+                        "Type": "Task",
+                        "Resource": "arn:aws:states:::lambda:invoke",
+                        "Parameters": {
+                          "Payload.$": "$",
+                          "FunctionName": "recheck_function_arn"
+                        },
+                        "Retry": [
+                          {
+                            "ErrorEquals": [
+                              "Lambda.ServiceException",
+                              "Lambda.AWSLambdaException",
+                              "Lambda.SdkClientException",
+                              "Lambda.TooManyRequestsException",
+                              "DatabaseUnavailableError"
+                            ],
+                            "IntervalSeconds": 5,
+                            "MaxAttempts": 5,
+                            "BackoffRate": 2
+                          }
+                        ],
+                        "ResultSelector": {
+                          "task_id.$": "$.Payload.task_id",
+                          "bucket.$": "$.Payload.bucket",
+                          "checked.$": "$.Payload.checked",
+                          "failed.$": "$.Payload.failed",
+                          "target_failed.$": "$.Payload.target_failed",
+                          "last_key.$": "$.Payload.last_key",
+                          "done.$": "$.Payload.done"
+                        },
+                        "Next": "Bucket done?"
+                      },
+                      "Bucket done?": {
+                        "Type": "Choice",
+                        "Choices": [
+                          {
+                            "Variable": "$.done",
+                            "BooleanEquals": false,
+                            "Next": "Recheck bucket"
+                          }
+                        ],
+                        "Default": "Bucket rechecked"
+                      },
+                      "Bucket rechecked": {
+                        "Type": "Succeed"
+                      }
+                    }
+                  },
+                  "Catch": [
+                    {
+                      "ErrorEquals": [
+                        "States.ALL"
+                      ],
+                      "Next": "Restore task status",
+                      "ResultPath": "$.error"
+                    }
+                  ],
+                  "ResultPath": "$.buckets",
+                  "Next": "Finish recheck"
+                },
+                "Finish recheck": {
+                  "Type": "Task",
+                  "Resource": "arn:aws:states:::lambda:invoke",
+                  "Parameters": {
+                    "Payload": {
+                      "action": "finish",
+                      "task_id.$": "$.task_id",
+                      "buckets.$": "$.buckets"
+                    },
+                    "FunctionName": "recheck_function_arn"
+                  },
+                  "Retry": [
+                    {
+                      "ErrorEquals": [
+                        "Lambda.ServiceException",
+                        "Lambda.AWSLambdaException",
+                        "Lambda.SdkClientException",
+                        "Lambda.TooManyRequestsException"
+                      ],
+                      "IntervalSeconds": 1,
+                      "MaxAttempts": 3,
+                      "BackoffRate": 2
+                    }
+                  ],
+                  "Catch": [
+                    {
+                      "ErrorEquals": [
+                        "States.ALL"
+                      ],
+                      "Next": "Restore task status",
+                      "ResultPath": "$.error"
+                    }
+                  ],
+                  "ResultSelector": {
+                    "checked.$": "$.Payload.checked",
+                    "failed.$": "$.Payload.failed"
+                  },
+                  "End": true
+                },
+                "Restore task status": {
+                  "Type": "Task",
+                  "Resource": "arn:aws:states:::dynamodb:updateItem",
+                  "Parameters": {
+                    "TableName": "check_task",
+                    "Key": {
+                      "task_id": {
+                        "S.$": "$.task_id"
+                      }
+                    },
+                    "UpdateExpression": "SET #s = recheck_from REMOVE recheck_from",
+                    "ConditionExpression": "#s = :rechecking",
+                    "ExpressionAttributeNames": {
+                      "#s": "status"
+                    },
+                    "ExpressionAttributeValues": {
+                      ":rechecking": {
+                        "S": "Rechecking"
+                      }
+                    }
+                  },
+                  "ResultPath": null,
+                  "Next": "Recheck failed"
+                },
+                "Recheck failed": {
+                  "Type": "Fail",
+                  "Error": "RecheckFailed",
+                  "Cause": "The recheck of the task failed, its previous status was restored."
+                }
+              }
+            }
+        '''
+
+        recheck_function_definition_dict = json.loads(recheck_function_definition)
+
+        recheck_function_definition_dict['States']['Start recheck']['Parameters']['TableName'] = check_task_table_name
+        recheck_function_definition_dict['States']['Restore task status']['Parameters']['TableName'] = check_task_table_name
+
+        # One iteration per log table bucket of the task.
+        bucket_count = params['check_log_table_bucket_count']
+        recheck_function_definition_dict['States']['List buckets']['Parameters']['buckets.$'] = \
+            'States.ArrayRange(0, {}, 1)'.format(bucket_count - 1)
+        recheck_function_definition_dict['States']['Recheck buckets']['MaxConcurrency'] = bucket_count
+
+        recheck_function_definition_dict['States']['Recheck buckets']['ItemProcessor']['States']['Recheck bucket']['Parameters']['FunctionName'] = recheck_function.function_arn
+        recheck_function_definition_dict['States']['Finish recheck']['Parameters']['FunctionName'] = recheck_function.function_arn
+
+        self.recheck_step_function = sfn.CfnStateMachine(
+            self,
+            "RecheckTaskStateMachine_{}".format(env_name),
+            state_machine_name="RecheckTaskStateMachine_{}".format(env_name),
+            role_arn=role.role_arn,
+            definition_string=json.dumps(recheck_function_definition_dict)
+        )
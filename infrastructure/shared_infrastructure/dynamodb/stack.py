@@ -1,4 +1,5 @@
 from aws_cdk import (
+    Duration,
     aws_dynamodb as dynamodb,
     aws_lambda_event_sources as source,
     aws_lambda
@@ -8,7 +9,11 @@ from constructs import Construct
 
 class DynamoDBTables(Construct):
     def __init__(self, scope: Construct, construct_id: str,
-                 env_name: str, task_table: str, log_table: str, task_table_gsi: str, **kwargs) -> None:
+                 env_name: str, task_table: str, log_table: str, task_table_gsi: str, log_table_gsi: str, log_table_risk_gsi: str,
+                 log_table_failed_gsi: str,
+                 result_cache_table: str,
+                 log_stream_batch_size: int, log_stream_parallelization_factor: int,
+                 log_stream_tumbling_window_seconds: int, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         # Check task table
@@ -62,23 +67,65 @@ class DynamoDBTables(Construct):
             )]
         )
 
-        # Check log table
+        # Check log table, partitioned by "<task_id>#<bucket>" so a single task is spread over several partitions.
         self.log_table = dynamodb.Table(
             self, "check_log_table",
             table_name=log_table,
-            partition_key=dynamodb.Attribute(name="task_id", type=dynamodb.AttributeType.STRING),
-            sort_key=dynamodb.Attribute(name="query_hash", type=dynamodb.AttributeType.STRING),
+            partition_key=dynamodb.Attribute(name="task_bucket", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="query_hash", type=dynamodb.AttributeType.BINARY),
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             encryption=dynamodb.TableEncryption.AWS_MANAGED,
             stream=dynamodb.StreamViewType.NEW_IMAGE,
             point_in_time_recovery=True
         )
 
-        # log table stream, update
+        # Sparse index of the log items that are not validated yet, the validator removes pending_bucket.
+        self.log_table.add_global_secondary_index(
+            index_name=log_table_gsi,
+            partition_key=dynamodb.Attribute(name="pending_bucket", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="pending_since", type=dynamodb.AttributeType.NUMBER),
+            projection_type=dynamodb.ProjectionType.INCLUDE,
+            non_key_attributes=['task_id', 'query', 'query_z']
+        )
+
+        # Sparse index of the log items with performance risk findings, ranked by the report.
+        self.log_table.add_global_secondary_index(
+            index_name=log_table_risk_gsi,
+            partition_key=dynamodb.Attribute(name="risk_bucket", type=dynamodb.AttributeType.STRING),
+            projection_type=dynamodb.ProjectionType.INCLUDE,
+            non_key_attributes=['query', 'query_z', 'src', 'src_port', 'risk_ids', 'risk_message', 'risk_weight',
+                                'seen_count']
+        )
+
+        # Sparse index of the failed log items, sorted by error class so the failures of a class are read together.
+        self.log_table.add_global_secondary_index(
+            index_name=log_table_failed_gsi,
+            partition_key=dynamodb.Attribute(name="failed_bucket", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="failure_sort", type=dynamodb.AttributeType.STRING),
+            projection_type=dynamodb.ProjectionType.INCLUDE,
+            non_key_attributes=['task_id', 'query', 'query_z', 'src', 'src_port', 'message', 'status',
+                                'target_results', 'rule_ids', 'error_class']
+        )
+
+        # Validation result cache shared by all tasks, keyed by engine version, rule catalog version and query hash.
+        self.result_cache_table = dynamodb.Table(
+            self, "check_result_cache_table",
+            table_name=result_cache_table,
+            partition_key=dynamodb.Attribute(name="cache_key", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.AWS_MANAGED,
+            time_to_live_attribute="expire_at"
+        )
+
+        # log table stream, update. A batch is retried when the validation database is unavailable.
+        # The task counters are aggregated over a tumbling window and written once per window.
         self.log_table_source = source.DynamoEventSource(
             self.log_table,
-            retry_attempts=1,
-            batch_size=50,
+            retry_attempts=5,
+            batch_size=log_stream_batch_size,
+            max_batching_window=Duration.seconds(1),
+            parallelization_factor=log_stream_parallelization_factor,
+            tumbling_window=Duration.seconds(log_stream_tumbling_window_seconds),
             starting_position=aws_lambda.StartingPosition.LATEST,
             filters=[aws_lambda.FilterCriteria.filter({"eventName": aws_lambda.FilterRule.is_equal("INSERT")})]
         )
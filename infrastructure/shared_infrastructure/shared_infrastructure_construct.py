@@ -14,7 +14,14 @@ class SharedInfrastructureConstruct(Construct):
         self.dynamodb = DynamoDBTables(self, "ddb", env_name=params['env_name'],
                                        task_table=params['check_task_table_name'],
                                        log_table=params['check_log_table_name'],
-                                       task_table_gsi=params['check_task_table_gsi_name'])
+                                       task_table_gsi=params['check_task_table_gsi_name'],
+                                       log_table_gsi=params['check_log_table_gsi_name'],
+                                       log_table_risk_gsi=params['check_log_table_risk_gsi_name'],
+                                       log_table_failed_gsi=params['check_log_table_failed_gsi_name'],
+                                       result_cache_table=params['check_result_cache_table_name'],
+                                       log_stream_batch_size=params['check_log_stream_batch_size'],
+                                       log_stream_parallelization_factor=params['check_log_stream_parallelization_factor'],
+                                       log_stream_tumbling_window_seconds=params['check_log_stream_tumbling_window_seconds'])
 
         self.api = API(self, "api", env_name=params['env_name'])
 
@@ -5,6 +5,7 @@ vpc_id = None
 private_subnet_ids = []
 public_subnet_ids = []
 keypair = None
+validation_targets = []
 
 
 def _init_from_context(scope: Construct, name: str, default=None, array=False, array_spliter=",", formatter=str):
@@ -30,11 +31,13 @@ def _init_from_context(scope: Construct, name: str, default=None, array=False, a
 
 
 def init(scope: Construct):
-    global env_name, vpc_id, private_subnet_ids, public_subnet_ids, keypair
+    global env_name, vpc_id, private_subnet_ids, public_subnet_ids, keypair, validation_targets
 
     env_name = _init_from_context(scope, 'env', 'dev')
     vpc_id = _init_from_context(scope, 'vpc', None)
     private_subnet_ids = _init_from_context(scope, 'private_subnets', [], array=True)
     public_subnet_ids = _init_from_context(scope, 'public_subnets', [], array=True)
     keypair = _init_from_context(scope, 'keypair', None)
+    # <name>=<Aurora MySQL engine version> pairs, the captured queries are validated against every target.
+    validation_targets = _init_from_context(scope, 'validation_targets', 'mysql80=8.0.mysql_aurora.3.04.1', array=True)
     
\ No newline at end of file
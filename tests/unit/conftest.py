@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The Lambda functions import their modules from their own asset directory.
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for asset in ('infrastructure/query_validation/lambda_function/validate_query',
+              'infrastructure/query_validation/lambda_function/generate_error_report'):
+    sys.path.insert(0, os.path.join(ROOT, asset))
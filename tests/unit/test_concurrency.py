@@ -0,0 +1,107 @@
+import pytest
+from concurrency import AdaptiveLimiter, CircuitBreaker
+from connection_pool import DatabaseUnavailableError
+
+
+def make_limiter(initial_limit=10):
+    return AdaptiveLimiter(min_limit=2, max_limit=20, initial_limit=initial_limit, latency_target_ms=100,
+                           increase_step=1)
+
+
+def test_limit_grows_below_the_latency_target():
+    limiter = make_limiter()
+    limiter.acquire(10)
+    limiter.release(10, 0.01)
+    assert limiter.limit == 11
+    assert limiter.in_flight == 0
+
+
+def test_limit_is_halved_once_per_interval_above_the_latency_target():
+    limiter = make_limiter()
+    limiter.acquire(2)
+    limiter.release(1, 0.5)
+    assert limiter.limit == 5
+    # A second slow call of the same slowdown does not halve the limit again.
+    limiter.release(1, 0.5)
+    assert limiter.limit == 5
+
+
+def test_limit_stays_within_bounds():
+    assert make_limiter(initial_limit=100).limit == 20
+    limiter = make_limiter(initial_limit=2)
+    limiter.acquire(1)
+    limiter.release(1, 0.5)
+    assert limiter.limit == 2
+
+
+def test_statements_release_with_the_slowest_recorded_latency():
+    limiter = make_limiter()
+    with limiter.statements(4) as latencies:
+        assert limiter.in_flight == 4
+        latencies.extend([0.01, 0.3, 0.02])
+    assert limiter.latency == 0.3
+    assert limiter.limit == 5
+
+
+def test_statements_failing_for_another_reason_keep_the_limit():
+    limiter = make_limiter()
+    with pytest.raises(ValueError):
+        with limiter.statements(4):
+            raise ValueError()
+    assert limiter.limit == 10
+    assert limiter.latency is None
+    assert limiter.in_flight == 0
+
+
+def test_unavailable_database_decreases_the_limit():
+    limiter = make_limiter()
+    with pytest.raises(DatabaseUnavailableError):
+        with limiter.statements(4):
+            raise DatabaseUnavailableError()
+    assert limiter.limit == 5
+
+
+def fail(breaker):
+    with pytest.raises(DatabaseUnavailableError):
+        with breaker.call():
+            raise DatabaseUnavailableError()
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=60)
+    fail(breaker)
+    assert not breaker.is_open
+    fail(breaker)
+    assert breaker.is_open
+    with pytest.raises(DatabaseUnavailableError):
+        breaker.before_call()
+
+
+def test_breaker_success_resets_the_failures():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=60)
+    fail(breaker)
+    with breaker.call():
+        pass
+    fail(breaker)
+    assert not breaker.is_open
+
+
+def test_breaker_lets_one_trial_call_through_after_the_cooldown():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=0)
+    fail(breaker)
+    assert breaker.is_open
+    breaker.before_call()
+    # Only one trial runs at a time.
+    with pytest.raises(DatabaseUnavailableError):
+        breaker.before_call()
+    breaker.record_success()
+    assert not breaker.is_open
+
+
+def test_breaker_failed_trial_opens_it_again():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown_seconds=0)
+    for _ in range(3):
+        fail(breaker)
+    fail(breaker)
+    assert breaker.is_open
+    assert not breaker.trial_running
@@ -0,0 +1,46 @@
+import pytest
+from failure_summary import OTHER_TEMPLATES, FailureSummary, normalize_template
+
+
+@pytest.mark.parametrize("query, template", [
+    ("SELECT a FROM t WHERE b = 'x' AND c = 12", "select a from t where b = ? and c = ?"),
+    ("select a from t where b = \"it\"\"s\" and c = -1.5e3", "select a from t where b = ? and c = ?"),
+    ("SELECT a FROM t WHERE id = 0x1F", "select a from t where id = ?"),
+    ("SELECT a FROM t WHERE id IN (1, 2,3)", "select a from t where id in (?+)"),
+    ("INSERT INTO t VALUES (1, 'a'), (2, 'b')", "insert into t values (?+)"),
+    ("SELECT  a\n FROM   t1 ", "select a from t1"),
+    ("SELECT `col1` FROM t2", "select `col1` from t2"),
+])
+def test_normalize_template(query, template):
+    assert normalize_template(query) == template
+
+
+def test_queries_of_a_template_share_a_group():
+    summary = FailureSummary()
+    summary.add('RESERVED_KEYWORD', ['RESERVED_KEYWORD'], "SELECT rank FROM t WHERE id = 1", 'm1')
+    summary.add('RESERVED_KEYWORD', ['RESERVED_KEYWORD'], "SELECT rank FROM t WHERE id = 2", 'm2')
+    summary.add('MYSQL_1064', [], "SELECT FROM", 'm3')
+    rows = summary.rows()
+    assert [row[:3] + [row[4]] for row in rows] == [['RESERVED_KEYWORD', 'RESERVED_KEYWORD', 2, 2],
+                                                    ['MYSQL_1064', '', 1, 1]]
+    # The first query of a group is its example.
+    assert rows[0][5:] == ["select rank from t where id = ?", "SELECT rank FROM t WHERE id = 1", 'm1']
+
+
+def test_merged_summaries_add_up():
+    first = FailureSummary()
+    second = FailureSummary()
+    first.add('MYSQL_1064', [], "SELECT 1 FROM", 'm')
+    second.add('MYSQL_1064', [], "SELECT 2 FROM", 'm')
+    first.merge(second)
+    assert [row[4] for row in first.rows()] == [2]
+
+
+def test_new_templates_beyond_the_group_limit_are_counted_together(monkeypatch):
+    monkeypatch.setattr('failure_summary.MAX_GROUPS', 2)
+    summary = FailureSummary()
+    for table in ('t1', 't2', 't3', 't4'):
+        summary.add('MYSQL_1064', [], "SELECT FROM " + table, 'm')
+    rows = summary.rows()
+    assert len(rows) == 3
+    assert [row[5] for row in rows if row[4] == 2] == [OTHER_TEMPLATES]
@@ -0,0 +1,57 @@
+import pytest
+from prefilter import Verdict, classify
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT a, * FROM t",
+    "SELECT * FROM t LEFT JOIN u",
+    "SELECT * FROM t RIGHT OUTER JOIN u AS x",
+    "DELETE FROM t LIMIT 1, 2",
+    "DELETE FROM t WHERE a = 1 LIMIT 1 OFFSET 2",
+    "UPDATE t SET a = 1 LIMIT 1, 2",
+    "REPLACE INTO t (a) VALUES (1) ON DUPLICATE KEY UPDATE a=1",
+    "REPLACE IGNORE INTO t (a) VALUES (1)",
+    "SELECT * FROM t AS 'x'",
+    "UPDATE t AS 'x' SET a = 1",
+    "SELECT 'a''",
+    "SELECT 'abc\\'",
+    "SELECT `a``",
+    "SELECT SUM(a, b) FROM t",
+    "SELECT MAX(a,b,c) FROM t",
+    "SELECT COUNT() FROM t",
+    "SELECT count(distinct *) FROM t",
+    "SELECT LOWER() FROM t",
+    "SELECT IFNULL(a) FROM t",
+])
+def test_invalid_statements_are_not_valid(query):
+    verdict, _ = classify(query)
+    assert verdict != Verdict.VALID
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM t",
+    "SELECT *, a FROM t",
+    "SELECT a, t.* FROM t",
+    "SELECT * FROM t LEFT JOIN u ON t.id = u.id",
+    "SELECT * FROM t RIGHT JOIN u USING (id)",
+    "SELECT * FROM t JOIN u",
+    "SELECT a FROM t ORDER BY a LIMIT 1, 2",
+    "SELECT a FROM t LIMIT 2 OFFSET 1",
+    "DELETE FROM t WHERE a = 1 ORDER BY a LIMIT 1",
+    "UPDATE t SET a = 1 WHERE b = 2 LIMIT 10",
+    "REPLACE INTO t (a) VALUES (1)",
+    "INSERT INTO t (a) VALUES (1) ON DUPLICATE KEY UPDATE a=1",
+    "SELECT a AS 'x' FROM t AS y",
+    "SELECT 'a''b', 'it\\'s' FROM t",
+    "SELECT COUNT(*), COUNT(a), COUNT(DISTINCT a, b), SUM(DISTINCT a) FROM t",
+    "SELECT NOW(), CONCAT(a, 'x', b), IFNULL(a, 0) FROM t",
+])
+def test_valid_statements(query):
+    assert classify(query) == (Verdict.VALID, None)
+
+
+def test_lexical_errors_are_invalid():
+    assert classify("SELECT 'a FROM t")[0] == Verdict.INVALID
+    assert classify("SELECT 'a''")[0] == Verdict.INVALID
+    assert classify("SELECT 'abc\\'")[0] == Verdict.INVALID
+    assert classify("SELECT (a FROM t")[0] == Verdict.INVALID
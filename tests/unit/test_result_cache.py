@@ -0,0 +1,93 @@
+from result_cache import ResultCache
+
+
+class FakeBatchWriter:
+    def __init__(self, items):
+        self.items = items
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def put_item(self, Item):
+        self.items[Item['cache_key']] = Item
+
+
+class FakeTable:
+    def __init__(self, items):
+        self.items = items
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return FakeBatchWriter(self.items)
+
+
+class FakeDynamoDB:
+    """The batch_get_item and Table calls of the cache on a dict, optionally failing every request."""
+
+    def __init__(self, fail=False):
+        self.items = {}
+        self.fail = fail
+        self.requested_keys = []
+
+    def Table(self, name):
+        return FakeTable(self.items)
+
+    def batch_get_item(self, RequestItems):
+        if self.fail:
+            raise RuntimeError('Throttled')
+        (table_name, request), = RequestItems.items()
+        keys = [key['cache_key'] for key in request['Keys']]
+        self.requested_keys.extend(keys)
+        return {'Responses': {table_name: [self.items[key] for key in keys if key in self.items]}}
+
+
+def make_result(status='Checked'):
+    return {'status': status, 'message': '', 'rule_ids': [], 'risk_ids': [], 'risk_message': ''}
+
+
+def make_cache(dynamodb, local_size=2, engine_version='8.0', catalog_version='2-abc', parser_version='p1'):
+    return ResultCache(dynamodb, 'cache', engine_version, catalog_version, parser_version, 3600, local_size)
+
+
+def test_key_includes_the_engine_catalog_and_parser_versions():
+    cache = make_cache(FakeDynamoDB())
+    assert cache.key(b'\x01\x02') == '8.0#2-abc#p1#0102'
+    assert make_cache(FakeDynamoDB(), parser_version='p2').key(b'\x01\x02') != cache.key(b'\x01\x02')
+
+
+def test_local_results_are_evicted_least_recently_used_first():
+    dynamodb = FakeDynamoDB()
+    cache = make_cache(dynamodb)
+    cache.put_many({'a': make_result(), 'b': make_result()})
+    # Reading a makes b the least recently used result.
+    cache.get_many(['a'])
+    cache.put_many({'c': make_result()})
+    assert list(cache.local) == ['a', 'c']
+
+
+def test_local_hits_do_not_read_the_table():
+    dynamodb = FakeDynamoDB()
+    cache = make_cache(dynamodb)
+    cache.put_many({'a': make_result('Failed')})
+    results, local_hits = cache.get_many(['a', 'a'])
+    assert results == {'a': make_result('Failed')}
+    assert local_hits == 1
+    assert dynamodb.requested_keys == []
+
+
+def test_table_hits_are_kept_in_the_container():
+    dynamodb = FakeDynamoDB()
+    make_cache(dynamodb).put_many({'a': make_result('Failed')})
+    cache = make_cache(dynamodb)
+    results, local_hits = cache.get_many(['a', 'b'])
+    assert results == {'a': make_result('Failed')}
+    assert local_hits == 0
+    assert dynamodb.requested_keys == ['a', 'b']
+    assert 'a' in cache.local
+
+
+def test_table_failures_are_misses():
+    cache = make_cache(FakeDynamoDB(fail=True))
+    assert cache.get_many(['a']) == ({}, 0)
@@ -0,0 +1,81 @@
+import copy
+import os
+
+import pytest
+import rule_engine
+from rule_engine import RuleEngine
+
+CATALOG_PATH = os.path.join(os.path.dirname(rule_engine.__file__), 'rule_catalog.json')
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return RuleEngine.from_file(CATALOG_PATH)
+
+
+def rule_ids(engine, query):
+    return [finding.rule_id for finding in engine.evaluate(query)]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT PASSWORD('x')", ['PASSWORD_FUNCTION']),
+    ("SELECT rank FROM t ORDER BY a", ['RESERVED_KEYWORD']),
+    ("SELECT SQL_CACHE a FROM t", ['SQL_CACHE']),
+    ("SELECT a FROM t GROUP BY a DESC ORDER BY a", ['GROUP_BY_ORDER']),
+    ("SELECT a FROM t GROUP BY a", ['GROUP_BY_IMPLICIT_SORT']),
+    ("SELECT * FROM (SELECT a FROM t) x", ['DERIVED_TABLE']),
+])
+def test_rules_are_found(engine, query, expected):
+    assert rule_ids(engine, query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT password FROM t",
+    "SELECT 'rank' FROM t",
+    "SELECT `rank` FROM t",
+    "SELECT t.rank FROM t",
+    "SELECT a FROM t -- rank",
+    "SELECT a FROM t /* PASSWORD(a) */",
+    "SELECT a FROM t GROUP BY a ORDER BY a DESC",
+    "SELECT a FROM t WHERE a IN (SELECT a FROM u GROUP BY a) ORDER BY a",
+])
+def test_rules_are_not_found(engine, query):
+    assert rule_ids(engine, query) == []
+
+
+def test_findings_are_in_query_order(engine):
+    findings = engine.evaluate("SELECT rank, PASSWORD(a) FROM t GROUP BY a ASC")
+    assert [finding.rule_id for finding in findings] == ['RESERVED_KEYWORD', 'PASSWORD_FUNCTION',
+                                                         'GROUP_BY_IMPLICIT_SORT', 'GROUP_BY_ORDER']
+    assert findings == sorted(findings, key=lambda finding: finding.position)
+
+
+def test_group_by_without_order_is_reported_per_statement(engine):
+    assert rule_ids(engine, "SELECT a FROM t GROUP BY a; SELECT a FROM t GROUP BY a ORDER BY a") == \
+        ['GROUP_BY_IMPLICIT_SORT']
+
+
+def test_performance_rules_are_weighed(engine):
+    findings = engine.evaluate("SELECT * FROM (SELECT a FROM t) x GROUP BY a")
+    assert all(engine.is_performance_risk(finding) for finding in findings)
+    assert engine.weigh([finding.rule_id for finding in findings]) == 5
+    assert engine.weigh(['RESERVED_KEYWORD']) == 0
+
+
+def test_describe_formats_findings_in_catalog_order(engine):
+    message = engine.describe(engine.evaluate("SELECT rank, PASSWORD(a) FROM t ORDER BY a"))
+    assert message == ("Query contains the PASSWORD() function removed in 8.0: ['PASSWORD']; "
+                       "Query contains 8.0 keywords without ``: ['rank']; ")
+
+
+def test_version_changes_with_the_catalog_content(engine):
+    catalog = {'version': engine.version.split('-')[0], 'rules': copy.deepcopy(engine.rules)}
+    assert RuleEngine(catalog).version == engine.version
+    catalog['rules'][0]['names'].append('sleep')
+    assert RuleEngine(catalog).version != engine.version
+    assert RuleEngine(catalog).version.startswith(catalog['version'] + '-')
+
+
+def test_unknown_rule_type_is_rejected():
+    with pytest.raises(ValueError):
+        RuleEngine({'version': '1', 'rules': [{'id': 'X', 'type': 'regex', 'message': 'x'}]})
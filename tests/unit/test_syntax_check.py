@@ -0,0 +1,79 @@
+import pymysql
+import pytest
+from syntax_check import MAX_BATCH_BYTES, check_syntax_batch, split_batches
+
+
+class FakeCursor:
+    """Parses every statement of a batch, a statement containing "bad" is a syntax error of the whole batch."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.batches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, command, params):
+        self.batches.append(list(params))
+        if self.error is not None:
+            raise self.error
+        for query in params:
+            if 'bad' in query:
+                raise pymysql.err.ProgrammingError(1064, "You have an error in your SQL syntax near '{}'".format(query))
+
+    def fetchall(self):
+        return ()
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self.fake_cursor = cursor
+
+    def cursor(self):
+        return self.fake_cursor
+
+
+def test_split_batches_by_count():
+    assert split_batches(['q'] * 5, 2) == [(0, 2), (2, 4), (4, 5)]
+    assert split_batches([], 2) == []
+
+
+def test_split_batches_by_bytes():
+    queries = ['a' * (MAX_BATCH_BYTES // 2 + 1)] * 3
+    assert split_batches(queries, 25) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_valid_batch_is_one_round_trip():
+    cursor = FakeCursor()
+    latencies = []
+    assert check_syntax_batch(FakeConnection(cursor), ['select 1', 'select 2'], 25, latencies) == [None, None]
+    assert len(cursor.batches) == 1
+    assert len(latencies) == 1
+
+
+def test_failed_batch_is_bisected_to_the_invalid_statements():
+    cursor = FakeCursor()
+    queries = ['select 1', 'bad 2', 'select 3', 'select 4', 'bad 5']
+    results = check_syntax_batch(FakeConnection(cursor), queries, 25)
+    assert [result is not None for result in results] == [False, True, False, False, True]
+    assert "bad 2" in results[1]
+    assert len(cursor.batches) > 1
+
+
+def test_bisection_round_trips_are_not_latencies():
+    cursor = FakeCursor()
+    latencies = []
+    check_syntax_batch(FakeConnection(cursor), ['bad 1', 'select 2', 'select 3', 'bad 4'], 2, latencies)
+    # Two batches, each bisected into two single statement calls.
+    assert len(cursor.batches) == 6
+    assert len(latencies) == 2
+
+
+def test_infrastructure_errors_are_raised():
+    cursor = FakeCursor(pymysql.err.OperationalError(2013, 'Lost connection to MySQL server during query'))
+    with pytest.raises(pymysql.err.OperationalError):
+        check_syntax_batch(FakeConnection(cursor), ['select 1', 'select 2'], 25)
+    assert len(cursor.batches) == 1
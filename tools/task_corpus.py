@@ -0,0 +1,136 @@
+"""
+Loads the query corpus a task is exported to when it is stopped or finished, lazily with pyarrow datasets.
+
+The corpus is a Parquet dataset in the bucket of the solution, partitioned by task and status:
+
+    s3://db-check-bucket-<account>-<region>-<env>/corpus/task_id=<task_id>/status=<status>/bucket-<n>-<part>.parquet
+
+Every row is one distinct query with its hash, text, status, message, error class, compatibility rule ids,
+performance risk ids, status on each validation target, first seen source and the number of times it was captured.
+
+    from tools.task_corpus import open_corpus, iter_queries
+    corpus = open_corpus('db-check-bucket-123456789012-us-east-1-dev', task_id)
+    for row in iter_queries(corpus, status='Failed', columns=['query', 'message']):
+        ...
+
+    python3 tools/task_corpus.py --bucket <bucket> --task <task_id> [--diff <other task_id>] [--status Failed]
+
+Files downloaded with "aws s3 sync" are opened with open_corpus(path=<local directory of the task>).
+"""
+import argparse
+
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+
+CORPUS_PREFIX = 'corpus/task_id={}/'
+
+
+def open_corpus(bucket: str = None, task_id: str = None, path: str = None, region: str = None):
+    """
+        Opens the corpus of a task, no data is read until the dataset is scanned.
+
+        Args:
+            bucket (str): The bucket of the solution.
+            task_id (str): The ID of the task.
+            path (str): A local directory with the status partitions of a task, instead of bucket and task_id.
+            region (str): The region of the bucket, resolved from the bucket when not set.
+
+        Returns:
+            pyarrow.dataset.Dataset: The corpus, with the status partition as a column.
+    """
+
+    if path is None:
+        filesystem = fs.S3FileSystem(region=region or fs.resolve_s3_region(bucket))
+        path = bucket + '/' + CORPUS_PREFIX.format(task_id)
+    else:
+        filesystem = fs.LocalFileSystem()
+    return ds.dataset(path, format='parquet', partitioning='hive', filesystem=filesystem)
+
+
+def iter_queries(corpus, status: str = None, columns: list = None, batch_size: int = 10000):
+    """
+        Iterates over the queries of a corpus one record batch at a time.
+
+        Args:
+            corpus (pyarrow.dataset.Dataset): The corpus of a task.
+            status (str): Only the queries with this status, e.g. Failed, Checked or Pending.
+            columns (list): The columns to read, all columns when not set.
+            batch_size (int): The maximum number of rows read at once.
+
+        Returns:
+            generator: The queries as dictionaries.
+    """
+
+    scan_filter = pc.field('status') == status if status else None
+    for batch in corpus.to_batches(columns=columns, filter=scan_filter, batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def count_by_status(corpus):
+    """
+        Counts the queries of a corpus by status, only the status column is read.
+
+        Args:
+            corpus (pyarrow.dataset.Dataset): The corpus of a task.
+
+        Returns:
+            dict: The number of queries by status.
+    """
+
+    counts = corpus.to_table(columns=['status']).group_by('status').aggregate([('status', 'count')])
+    return dict(zip(counts['status'].to_pylist(), counts['status_count'].to_pylist()))
+
+
+def diff_corpora(old_corpus, new_corpus):
+    """
+        Compares the failed queries of two tasks by query hash, e.g. before and after a schema or rule change.
+
+        Args:
+            old_corpus (pyarrow.dataset.Dataset): The corpus of the earlier task.
+            new_corpus (pyarrow.dataset.Dataset): The corpus of the later task.
+
+        Returns:
+            dict: The hashes of the queries that fail only in the new task, that failed only in the old task although
+                  they were captured again, and of the queries captured only by the new task.
+    """
+
+    def read_status(corpus):
+        table = corpus.to_table(columns=['query_hash', 'status'])
+        return dict(zip(table['query_hash'].to_pylist(), table['status'].to_pylist()))
+
+    old_status = read_status(old_corpus)
+    new_status = read_status(new_corpus)
+    return {
+        'new_failures': sorted(query_hash for query_hash, status in new_status.items()
+                               if status == 'Failed' and old_status.get(query_hash, 'Failed') != 'Failed'),
+        'fixed': sorted(query_hash for query_hash, status in old_status.items()
+                        if status == 'Failed' and new_status.get(query_hash, 'Failed') != 'Failed'),
+        'new_queries': sorted(set(new_status) - set(old_status)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bucket', required=True, help='the bucket of the solution')
+    parser.add_argument('--task', required=True, help='the ID of the task')
+    parser.add_argument('--diff', help='the ID of an earlier task to compare the failed queries with')
+    parser.add_argument('--status', help='print the queries with this status, e.g. Failed')
+    parser.add_argument('--region', help='the region of the bucket')
+    args = parser.parse_args()
+
+    corpus = open_corpus(args.bucket, args.task, region=args.region)
+    print('queries by status: {}'.format(count_by_status(corpus)))
+
+    if args.diff:
+        diff = diff_corpora(open_corpus(args.bucket, args.diff, region=args.region), corpus)
+        for name, hashes in diff.items():
+            print('{}: {}'.format(name, len(hashes)))
+
+    if args.status:
+        for row in iter_queries(corpus, status=args.status, columns=['query_hash', 'query', 'message']):
+            print('{}\t{}\t{}'.format(row['query_hash'], row['query'], row['message'] or ''))
+
+
+if __name__ == '__main__':
+    main()